@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+弹幕 ASS 排版：逐行检查轨道与线段树查找的对比
+
+用固定随机种子生成一批弹幕作为样本集（也可用 --input 读入导出的 JSON 弹幕），
+分别交给原先的排版实现（每条弹幕一次 horizontalAdvance、逐行检查轨道）与 DanmakuLayoutEngine，
+核对两者生成的 Dialogue 行逐字节相同，并输出耗时。
+
+默认用一个按字符累加宽度的假字体度量，不需要图形环境；加上 --qt 改用真实的 QFontMetrics，
+此时原实现按整串测量宽度，若字体带字距调整，个别弹幕的宽度可能相差几个像素，脚本会列出不一致的行数。
+
+用法：
+
+    python scripts/benchmark/danmaku_ass_layout.py
+    python scripts/benchmark/danmaku_ass_layout.py --count 200000 --duration 7200
+    python scripts/benchmark/danmaku_ass_layout.py --input danmaku.json --qt
+"""
+from pathlib import Path
+from typing import Optional
+import argparse
+import random
+import time
+import json
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+from util.parse.additional.file.danmaku_ass import DanmakuASS, DanmakuLayoutEngine
+from util.parse.additional.file.danmaku_record import DanmakuRecord
+from util.common.config import DefaultValue
+from util.format.time import Time
+
+class FakeFontMetrics:
+    # 汉字占满字号，其余字符半宽，宽度可加
+    def __init__(self, size: int):
+        self.size = size
+
+    def height(self) -> int:
+        return self.size + 6
+
+    def horizontalAdvance(self, text: str) -> int:
+        return sum(self.size if ord(char) > 0x2E80 else self.size // 2 for char in text)
+
+class ScrollTrack:
+    def __init__(self, screen_width: int, min_gap: int):
+        self.screen_width = screen_width
+        self.min_gap = min_gap
+        self.last_stime = -1
+        self.last_duration = 0
+        self.last_width = 0
+        self.last_speed = 0.0
+
+    def can_fit(self, stime: int, speed: float) -> bool:
+        if self.last_stime == -1:
+            return True
+
+        cond1 = stime >= self.last_stime + ((self.last_width + self.min_gap) / self.last_speed)
+        cond2 = stime >= self.last_stime + self.last_duration - ((self.screen_width - self.min_gap) / speed)
+
+        return cond1 and cond2
+
+    def push(self, stime: int, duration_ms: int, text_width: int, speed: float):
+        self.last_stime = stime
+        self.last_duration = duration_ms
+        self.last_width = text_width
+        self.last_speed = speed
+
+class StaticTrack:
+    def __init__(self):
+        self.end_time = -1
+
+    def can_fit(self, stime: int) -> bool:
+        return stime >= self.end_time
+
+    def push(self, end_time: int):
+        self.end_time = end_time
+
+class ReferenceLayout:
+    # 原先的 DanmakuLayoutEngine 与 DanmakuASS._convert_dialogues
+    duration_map = {1: 10000, 2: 10000, 3: 10000, 4: 5000, 5: 5000}
+
+    def __init__(self, engine: DanmakuLayoutEngine):
+        self.font_metrics = engine.font_metrics
+        self.line_height = engine.line_height
+        self.screen_width = engine.screen_width
+        self.screen_height = engine.screen_height
+
+        self.scroll_tracks = [ScrollTrack(engine.screen_width, engine.min_gap) for _ in range(engine.max_scroll_rows)]
+        self.top_tracks = [StaticTrack() for _ in range(engine.max_static_rows)]
+        self.bottom_tracks = [StaticTrack() for _ in range(engine.max_static_rows)]
+
+    def alloc_scroll(self, stime: int, text_width: int, duration_ms: int) -> Optional[int]:
+        speed = (self.screen_width + text_width) / duration_ms
+
+        for row, track in enumerate(self.scroll_tracks):
+            if track.can_fit(stime, speed):
+                track.push(stime, duration_ms, text_width, speed)
+                return row
+
+        return None
+
+    def alloc_static(self, tracks: list[StaticTrack], stime: int, duration_ms: int) -> Optional[int]:
+        for row, track in enumerate(tracks):
+            if track.can_fit(stime):
+                track.push(stime + duration_ms)
+                return row
+
+        return None
+
+    def convert(self, record_list: list[DanmakuRecord]) -> list[str]:
+        dialogues = []
+
+        for record in sorted(record_list, key = lambda x: x.stime):
+            mode, stime, text = record.mode, record.stime, record.text
+
+            if not text or mode not in self.duration_map:
+                continue
+
+            duration_ms = self.duration_map[mode]
+            text_width = self.font_metrics.horizontalAdvance(text)
+
+            start_ass = Time.format_ass_time_by_ms(stime)
+            end_ass = Time.format_ass_time_by_ms(stime + duration_ms)
+
+            style_label = ""
+            allocated_row = None
+
+            if mode in (1, 2, 3):
+                allocated_row = self.alloc_scroll(stime, text_width, duration_ms)
+
+                if allocated_row is not None:
+                    y_pos = allocated_row * self.line_height
+                    style_label = f"\\move({self.screen_width},{y_pos},-{text_width},{y_pos})"
+
+            elif mode == 5:
+                allocated_row = self.alloc_static(self.top_tracks, stime, duration_ms)
+
+                if allocated_row is not None:
+                    y_pos = allocated_row * self.line_height
+                    style_label = f"\\an8\\pos({self.screen_width // 2},{y_pos})"
+
+            elif mode == 4:
+                allocated_row = self.alloc_static(self.bottom_tracks, stime, duration_ms)
+
+                if allocated_row is not None:
+                    y_pos = self.screen_height - allocated_row * self.line_height
+                    style_label = f"\\an2\\pos({self.screen_width // 2},{y_pos})"
+
+            if allocated_row is not None:
+                color_tag = ""
+
+                if record.color and record.color != 16777215:
+                    c = record.color
+                    bgr = ((c & 0xFF) << 16) | (c & 0xFF00) | ((c >> 16) & 0xFF)
+                    color_tag = f"\\c&H{bgr:06X}&"
+
+                dialogues.append(f"Dialogue: 0,{start_ass},{end_ass},Default,,0,0,0,,{{{style_label}{color_tag}}}{text}")
+
+        return dialogues
+
+def build_corpus(count: int, duration: int) -> list[DanmakuRecord]:
+    random.seed(22)
+
+    words = ["哈哈哈", "前方高能", "awsl", "2333", "泪目", "这也太强了吧", "来了来了", "名场面", "op 好听", "？？？", "妙啊", "下次一定"]
+    record_list = []
+
+    for index in range(count):
+        # 一部分弹幕集中在几个高能时刻，制造满屏的场景
+        if random.random() < 0.3:
+            stime = random.choice((60, 600, 1800, duration // 2)) * 1000 + random.randint(0, 20000)
+        else:
+            stime = random.randint(1, duration * 1000 - 1)
+
+        text = "".join(random.choice(words) for _ in range(random.randint(1, 4)))
+
+        record_list.append(DanmakuRecord(
+            stime = stime,
+            mode = random.choice((1, 1, 1, 1, 1, 4, 5)),
+            size = 25,
+            color = random.choice((16777215, 16777215, 16777215, 16711680, 65280)),
+            date = 1700000000 + index,
+            weight = random.randint(0, 11),
+            uhash = f"{random.getrandbits(32):08x}",
+            dmid = str(10 ** 15 + index),
+            text = text
+        ))
+
+    return record_list
+
+def load_corpus(path: str) -> list[DanmakuRecord]:
+    # DanmakuParser 导出的 JSON 弹幕
+    entry_list = json.loads(Path(path).read_text(encoding = "utf-8"))
+
+    return [
+        DanmakuRecord(
+            stime = entry.get("stime", 0),
+            mode = entry.get("mode", 0),
+            size = entry.get("size", 0),
+            color = entry.get("color", 0),
+            date = int(entry.get("date", 0)),
+            weight = entry.get("weight", 0),
+            uhash = entry.get("uhash", ""),
+            dmid = entry.get("dmid", ""),
+            text = entry.get("text", "")
+        )
+        for entry in entry_list
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description = "弹幕 ASS 排版：逐行检查轨道与线段树查找的对比")
+    parser.add_argument("--count", type = int, default = 100000, help = "生成的弹幕条数")
+    parser.add_argument("--duration", type = int, default = 3600, help = "视频时长（秒）")
+    parser.add_argument("--input", help = "改用导出的 JSON 弹幕作为样本集")
+    parser.add_argument("--qt", action = "store_true", help = "使用真实的 QFontMetrics")
+    args = parser.parse_args()
+
+    style = DefaultValue.danmaku_style
+    width, height = style["resolution"]["width"], style["resolution"]["height"]
+
+    if args.qt:
+        from PySide6.QtWidgets import QApplication
+
+        # QFontMetrics 需要已存在的 QApplication，PySide 会保留这个单例到进程退出
+        QApplication.instance() or QApplication(sys.argv)
+        font_metrics = None
+    else:
+        font_metrics = FakeFontMetrics(style["font"]["size"])
+
+    record_list = load_corpus(args.input) if args.input else build_corpus(args.count, args.duration)
+
+    print(f"{len(record_list)} 条弹幕，{width}x{height}")
+
+    engine = DanmakuLayoutEngine(width, height, style, font_metrics)
+    reference = ReferenceLayout(DanmakuLayoutEngine(width, height, style, font_metrics))
+
+    started = time.perf_counter()
+    expected = reference.convert(record_list)
+    reference_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = list(DanmakuASS(record_list, "benchmark")._convert_dialogues(engine))
+    engine_elapsed = time.perf_counter() - started
+
+    print(f"  逐行检查  {reference_elapsed:8.3f}s  保留 {len(expected)} 条")
+    print(f"  线段树    {engine_elapsed:8.3f}s  保留 {len(actual)} 条  {reference_elapsed / engine_elapsed:.1f}x")
+    print(f"  {engine.max_scroll_rows} 行滚动轨道，缓存 {len(engine.glyph_widths)} 个字符宽度")
+
+    if "\n".join(expected) == "\n".join(actual):
+        print("输出逐字节相同")
+    else:
+        mismatched = sum(a != b for a, b in zip(expected, actual)) + abs(len(expected) - len(actual))
+
+        print(f"输出不一致：{mismatched} 行")
+
+        if not args.qt:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
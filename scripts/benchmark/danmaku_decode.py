@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+弹幕分包的获取与解码
+
+构造一份合成的弹幕数据（默认 20 万条，按 6 分钟一包切分），对比：
+  - 解码：原先的 MessageToDict 转 dict，与 decode_segment 直接读取属性构造 DanmakuRecord
+  - 获取：逐包顺序请求，与按 DANMAKU_FETCH_CONCURRENCY 并发请求（请求用 sleep 模拟网络延迟）
+
+两种解码的结果会逐条核对，确保 DanmakuXML 用到的字段一致。需要安装 protobuf。
+
+用法：
+
+    python scripts/benchmark/danmaku_decode.py
+    python scripts/benchmark/danmaku_decode.py --count 200000 --duration 7200 --latency 0.3
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from math import ceil
+import argparse
+import random
+import time
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+from util.parse.additional.file.danmaku_record import decode_segment
+import util.misc.dm_pb2 as dm_pb2
+
+# 与 DanmakuParser 保持一致
+DANMAKU_FETCH_CONCURRENCY = 4
+SEGMENT_MS = 360 * 1000
+
+def build_segments(count: int, duration: int) -> list[bytes]:
+    random.seed(23)
+
+    parts = ceil(duration / 360)
+    replies = [dm_pb2.DmSegMobileReply() for _ in range(parts)]
+
+    for index in range(count):
+        stime = random.randint(1, duration * 1000 - 1)
+
+        elem = replies[stime // SEGMENT_MS].elems.add()
+        elem.id = 10 ** 15 + index
+        elem.stime = stime
+        elem.mode = random.choice((1, 1, 1, 1, 4, 5))
+        elem.size = 25
+        elem.color = random.choice((16777215, 16777215, 16711680, 65280))
+        elem.uhash = f"{random.getrandbits(32):08x}"
+        elem.text = "弹幕" * random.randint(1, 12)
+        elem.date = 1700000000 + index
+        elem.weight = random.randint(0, 11)
+        elem.pool = 0
+        elem.dmid = str(elem.id)
+        elem.attr = random.choice((0, 0, 1))
+
+    return [reply.SerializeToString() for reply in replies]
+
+def decode_message_to_dict(segment_list: list[bytes]) -> list[dict]:
+    # 原先 DanmakuParser._proto_to_dict_list 的实现
+    from google.protobuf.json_format import MessageToDict
+
+    dict_list = []
+
+    for segment in segment_list:
+        DmSeg = dm_pb2.DmSegMobileReply()
+        DmSeg.ParseFromString(segment)
+
+        temp_entry = MessageToDict(DmSeg).get("elems", [])
+
+        dict_list.extend([entry for entry in temp_entry if entry.get("stime") and entry.get("text")])
+
+    return dict_list
+
+def decode_records(segment_list: list[bytes]):
+    record_list = []
+
+    for segment in segment_list:
+        record_list.extend(decode_segment(segment))
+
+    return record_list
+
+def check(dict_list: list[dict], record_list: list):
+    assert len(dict_list) == len(record_list), f"条数不一致：{len(dict_list)} != {len(record_list)}"
+
+    for entry, record in zip(dict_list, record_list):
+        assert entry["stime"] == record.stime and entry["text"] == record.text
+        assert entry.get("mode", 0) == record.mode and entry.get("color", 0) == record.color
+        assert int(entry.get("date", 0)) == record.date and entry.get("dmid", "") == record.dmid
+        assert entry.get("uhash", "") == record.uhash
+
+def fetch(segment_list: list[bytes], latency: float, concurrency: int):
+    def request(index: int):
+        time.sleep(latency)
+
+        return decode_segment(segment_list[index])
+
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers = concurrency) as executor:
+        futures = [executor.submit(request, index) for index in range(len(segment_list))]
+
+        total = sum(len(future.result()) for future in futures)
+
+    return time.perf_counter() - started, total
+
+def main():
+    parser = argparse.ArgumentParser(description = "弹幕分包的获取与解码")
+    parser.add_argument("--count", type = int, default = 200000, help = "弹幕条数")
+    parser.add_argument("--duration", type = int, default = 7200, help = "视频时长（秒）")
+    parser.add_argument("--latency", type = float, default = 0.3, help = "模拟每个分包请求的耗时（秒）")
+    args = parser.parse_args()
+
+    segment_list = build_segments(args.count, args.duration)
+
+    print(f"{args.count} 条弹幕，{len(segment_list)} 包，共 {sum(map(len, segment_list)) / 1024 / 1024:.1f} MB")
+
+    started = time.perf_counter()
+    dict_list = decode_message_to_dict(segment_list)
+    dict_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    record_list = decode_records(segment_list)
+    record_elapsed = time.perf_counter() - started
+
+    check(dict_list, record_list)
+
+    print("解码")
+    print(f"  MessageToDict  {dict_elapsed:8.3f}s")
+    print(f"  DanmakuRecord  {record_elapsed:8.3f}s  {dict_elapsed / record_elapsed:.1f}x")
+
+    print(f"获取（每包 {args.latency}s）")
+
+    for name, concurrency in (("sequential", 1), ("concurrent", DANMAKU_FETCH_CONCURRENCY)):
+        elapsed, total = fetch(segment_list, args.latency, concurrency)
+
+        print(f"  {name:<14} {elapsed:8.3f}s  {total} 条")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+HTTP/1.1 与 HTTP/2 分片下载对比
+
+在本机起两个支持 Range 的测试服务器（HTTP/1.1 与 h2c），用同样的线程数、
+同样的分片大小把一个随机文件完整下载一遍，比较耗时与服务端实际接受的连接数。
+--latency 会在服务端每次接受新连接时额外等待一段时间，用来模拟公网上的 TCP + TLS 握手。
+
+需要安装 httpx 与 h2：
+
+    pip install httpx h2
+
+用法：
+
+    python scripts/benchmark/http2.py
+    python scripts/benchmark/http2.py --size 256 --threads 8 --chunk 2 --latency 0.1
+"""
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+import argparse
+import socket
+import time
+import os
+import re
+
+import httpx
+import h2.config
+import h2.connection
+import h2.events
+
+RANGE_PATTERN = re.compile(r"bytes=(\d+)-(\d*)")
+
+class Counter:
+    def __init__(self):
+        self.lock = Lock()
+        self.value = 0
+
+    def increase(self):
+        with self.lock:
+            self.value += 1
+
+def parse_range(value: str, size: int):
+    match = RANGE_PATTERN.fullmatch(value or "")
+
+    if not match:
+        return 0, size - 1, False
+
+    start = int(match.group(1))
+    end = int(match.group(2)) if match.group(2) else size - 1
+
+    return start, min(end, size - 1), True
+
+def start_http1_server(payload: bytes, latency: float, counter: Counter):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            counter.increase()
+            time.sleep(latency)
+
+            super().setup()
+
+        def do_GET(self):
+            start, end, partial = parse_range(self.headers.get("Range"), len(payload))
+
+            self.send_response(206 if partial else 200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(payload)}")
+            self.end_headers()
+
+            self.wfile.write(memoryview(payload)[start:end + 1])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+
+    Thread(target = server.serve_forever, daemon = True).start()
+
+    return server.server_address[1]
+
+def serve_h2_connection(sock: socket.socket, payload: bytes):
+    conn = h2.connection.H2Connection(config = h2.config.H2Configuration(client_side = False))
+    conn.initiate_connection()
+    sock.sendall(conn.data_to_send())
+
+    # stream_id -> 尚未发出的数据
+    pending: dict[int, memoryview] = {}
+
+    def flush_streams():
+        for stream_id in list(pending):
+            data = pending[stream_id]
+
+            while data:
+                window = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+
+                if window <= 0:
+                    break
+
+                conn.send_data(stream_id, data[:window].tobytes())
+                data = data[window:]
+
+            if data:
+                pending[stream_id] = data
+            else:
+                conn.end_stream(stream_id)
+                del pending[stream_id]
+
+        sock.sendall(conn.data_to_send())
+
+    try:
+        while True:
+            data = sock.recv(65536)
+
+            if not data:
+                return
+
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    headers = {key.decode() if isinstance(key, bytes) else key: value.decode() if isinstance(value, bytes) else value for key, value in event.headers}
+                    start, end, partial = parse_range(headers.get("range"), len(payload))
+
+                    conn.send_headers(event.stream_id, [
+                        (":status", "206" if partial else "200"),
+                        ("content-type", "application/octet-stream"),
+                        ("content-length", str(end - start + 1)),
+                        ("content-range", f"bytes {start}-{end}/{len(payload)}")
+                    ])
+
+                    pending[event.stream_id] = memoryview(payload)[start:end + 1]
+
+                elif isinstance(event, h2.events.StreamReset):
+                    pending.pop(event.stream_id, None)
+
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    return
+
+            flush_streams()
+
+    except OSError:
+        return
+
+    finally:
+        sock.close()
+
+def start_h2_server(payload: bytes, latency: float, counter: Counter):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(128)
+
+    def accept_loop():
+        while True:
+            sock, _ = listener.accept()
+
+            counter.increase()
+
+            def serve(sock = sock):
+                time.sleep(latency)
+                serve_h2_connection(sock, payload)
+
+            Thread(target = serve, daemon = True).start()
+
+    Thread(target = accept_loop, daemon = True).start()
+
+    return listener.getsockname()[1]
+
+def download(client: httpx.Client, url: str, size: int, chunk_size: int, threads: int) -> bytes:
+    buffer = bytearray(size)
+
+    def fetch(start: int):
+        end = min(start + chunk_size, size)
+
+        with client.stream("GET", url, headers = {"Range": f"bytes={start}-{end - 1}"}) as response:
+            response.raise_for_status()
+
+            offset = start
+
+            for chunk in response.iter_bytes(256 * 1024):
+                buffer[offset:offset + len(chunk)] = chunk
+                offset += len(chunk)
+
+    with ThreadPoolExecutor(max_workers = threads) as executor:
+        list(executor.map(fetch, range(0, size, chunk_size)))
+
+    return bytes(buffer)
+
+def run(name: str, client: httpx.Client, url: str, payload: bytes, chunk_size: int, threads: int, counter: Counter):
+    started = time.perf_counter()
+
+    with client:
+        result = download(client, url, len(payload), chunk_size, threads)
+
+    elapsed = time.perf_counter() - started
+
+    assert result == payload, f"{name} 下载结果与原文件不一致"
+
+    print("{name:<10} {elapsed:8.3f}s {speed:10.1f} MB/s {connections:6d} 条连接".format(
+        name = name,
+        elapsed = elapsed,
+        speed = len(payload) / elapsed / 1024 / 1024,
+        connections = counter.value
+    ))
+
+def main():
+    parser = argparse.ArgumentParser(description = "HTTP/1.1 与 HTTP/2 分片下载对比")
+    parser.add_argument("--size", type = int, default = 128, help = "测试文件大小（MB）")
+    parser.add_argument("--chunk", type = float, default = 4, help = "分片大小（MB）")
+    parser.add_argument("--threads", type = int, default = 8, help = "下载线程数")
+    parser.add_argument("--latency", type = float, default = 0.05, help = "每条新连接的模拟握手延迟（秒）")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size * 1024 * 1024)
+    chunk_size = int(args.chunk * 1024 * 1024)
+
+    http1_counter = Counter()
+    http2_counter = Counter()
+
+    http1_port = start_http1_server(payload, args.latency, http1_counter)
+    http2_port = start_h2_server(payload, args.latency, http2_counter)
+
+    limits = httpx.Limits(max_connections = args.threads, max_keepalive_connections = args.threads)
+
+    print(f"文件 {args.size} MB，分片 {args.chunk} MB，{args.threads} 线程，模拟握手延迟 {args.latency}s")
+
+    run("HTTP/1.1", httpx.Client(limits = limits), f"http://127.0.0.1:{http1_port}/file", payload, chunk_size, args.threads, http1_counter)
+    # 明文 h2c 需要先验知识（prior knowledge），即关闭 HTTP/1.1 直接以 HTTP/2 建连
+    run("HTTP/2", httpx.Client(limits = limits, http1 = False, http2 = True), f"http://127.0.0.1:{http2_port}/file", payload, chunk_size, args.threads, http2_counter)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+音视频合并：MP4Remuxer 与 FFmpeg 的对比
+
+先生成一对与 B 站 DASH 结构相同的分段 MP4（视频 avc1、音频 mp4a，每 2 秒一个 moof + mdat），
+样本内容是随机数据，两种方式都只做 copy 封装，不会解码：
+  - native：MP4Remuxer，样本表由 trun 汇总，数据按分片整段 copy_file_range
+  - ffmpeg：ffmpeg -c copy，与 FFmpegCommand.merge_video_audio 的参数一致（PATH 中没有 ffmpeg 时跳过）
+
+输出耗时与吞吐量，并逐个样本核对 native 的输出与输入一致。
+
+需要在项目的运行环境中执行（会导入 src/util）：
+
+    python scripts/benchmark/remux.py
+    python scripts/benchmark/remux.py --duration 1200 --bitrate 8 --rounds 3
+"""
+from pathlib import Path
+from array import array
+import subprocess
+import argparse
+import tempfile
+import hashlib
+import shutil
+import struct
+import time
+import sys
+import os
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+from util.ffmpeg.remux import MP4Remuxer, Box, make_box, make_full_box, from_big_endian
+
+FRAGMENT_SECONDS = 2
+FPS = 30
+VIDEO_TIMESCALE = 16000
+AUDIO_TIMESCALE = 44100
+AUDIO_FRAME = 1024
+
+# x264 720p High Profile 的 SPS / PPS，只用于让 FFmpeg 能识别出流的参数
+SPS = bytes.fromhex("6764001facd9405005bb011000000300100000030320f1831960")
+PPS = bytes.fromhex("68ebe3cb22c0")
+
+def matrix() -> bytes:
+    return struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+
+def make_track(track_id: int, handler: bytes, timescale: int, sample_entry: bytes) -> bytes:
+    tkhd = make_full_box(b"tkhd", 0, 3, struct.pack(">5I", 0, 0, track_id, 0, 0) + bytes(8) + struct.pack(">hhhh", 0, 0, 0x100 if handler == b"soun" else 0, 0) + matrix() + struct.pack(">II", (1280 << 16) if handler == b"vide" else 0, (720 << 16) if handler == b"vide" else 0))
+    mdhd = make_full_box(b"mdhd", 0, 0, struct.pack(">4I", 0, 0, timescale, 0) + struct.pack(">HH", 0x55C4, 0))
+    hdlr = make_full_box(b"hdlr", 0, 0, struct.pack(">I", 0) + handler + bytes(12) + b"handler\0")
+    media_header = make_full_box(b"vmhd", 0, 1, bytes(8)) if handler == b"vide" else make_full_box(b"smhd", 0, 0, bytes(4))
+    dinf = make_box(b"dinf", make_full_box(b"dref", 0, 0, struct.pack(">I", 1) + make_full_box(b"url ", 0, 1, b"")))
+    stbl = make_box(b"stbl", b"".join([
+        make_full_box(b"stsd", 0, 0, struct.pack(">I", 1) + sample_entry),
+        make_full_box(b"stts", 0, 0, struct.pack(">I", 0)),
+        make_full_box(b"stsc", 0, 0, struct.pack(">I", 0)),
+        make_full_box(b"stsz", 0, 0, struct.pack(">II", 0, 0)),
+        make_full_box(b"stco", 0, 0, struct.pack(">I", 0)),
+    ]))
+
+    return make_box(b"trak", tkhd + make_box(b"mdia", mdhd + hdlr + make_box(b"minf", media_header + dinf + stbl)))
+
+def video_sample_entry() -> bytes:
+    avcc = make_box(b"avcC", bytes([1, SPS[1], SPS[2], SPS[3], 0xFF, 0xE1]) + struct.pack(">H", len(SPS)) + SPS + bytes([1]) + struct.pack(">H", len(PPS)) + PPS)
+
+    return make_box(b"avc1", bytes(6) + struct.pack(">H", 1) + bytes(16) + struct.pack(">HHII", 1280, 720, 0x480000, 0x480000) + bytes(4) + struct.pack(">H", 1) + bytes(32) + struct.pack(">Hh", 0x18, -1) + avcc)
+
+def audio_sample_entry() -> bytes:
+    # AudioSpecificConfig 0x1210：AAC LC，44.1kHz，双声道
+    decoder_specific = bytes([0x05, 0x02, 0x12, 0x10])
+    decoder_config = bytes([0x04, 13 + len(decoder_specific), 0x40, 0x15]) + bytes(3) + struct.pack(">II", 128000, 128000) + decoder_specific
+    es = bytes([0x03, 3 + len(decoder_config) + 3]) + struct.pack(">HB", 1, 0) + decoder_config + bytes([0x06, 0x01, 0x02])
+    esds = make_full_box(b"esds", 0, 0, es)
+
+    return make_box(b"mp4a", bytes(6) + struct.pack(">H", 1) + bytes(8) + struct.pack(">HHHHI", 2, 16, 0, 0, AUDIO_TIMESCALE << 16) + esds)
+
+def write_fragmented(path: Path, handler: bytes, timescale: int, sample_entry: bytes, duration: int, bitrate: float):
+    """生成分段 MP4：ftyp、moov（含 mvex）、若干个 moof + mdat"""
+    if handler == b"vide":
+        sample_duration = timescale // FPS
+        gop = FPS * FRAGMENT_SECONDS
+    else:
+        sample_duration = AUDIO_FRAME
+        gop = 1
+
+    samples_per_fragment = FRAGMENT_SECONDS * timescale // sample_duration
+    total_samples = duration * timescale // sample_duration
+    sample_size = max(int(bitrate * 1024 * 1024 / 8 * sample_duration / timescale), 16)
+
+    noise = os.urandom(sample_size * 4)
+
+    with open(path, "wb") as f:
+        f.write(make_box(b"ftyp", b"iso5" + struct.pack(">I", 1) + b"iso5dashmp41"))
+
+        mvhd = make_full_box(b"mvhd", 0, 0, struct.pack(">5I", 0, 0, 1000, 0, 0x10000) + struct.pack(">H", 0x100) + bytes(10) + matrix() + bytes(24) + struct.pack(">I", 2))
+        mvex = make_box(b"mvex", make_full_box(b"trex", 0, 0, struct.pack(">5I", 1, 1, 0, 0, 0)))
+        f.write(make_box(b"moov", mvhd + make_track(1, handler, timescale, sample_entry) + mvex))
+
+        decode_time = 0
+        sequence = 1
+
+        for first in range(0, total_samples, samples_per_fragment):
+            count = min(samples_per_fragment, total_samples - first)
+
+            # 视频按 GOP 起始帧为关键帧，帧大小略有起伏，带上 B 帧式的合成时间偏移
+            sizes = [sample_size + (index * 7919) % (sample_size // 4 + 1) for index in range(count)]
+            entries = b"".join(
+                struct.pack(">IIIi", sample_duration, size, 0x02000000 if (first + index) % gop == 0 else 0x01010000, sample_duration if handler == b"vide" else 0)
+                for index, size in enumerate(sizes)
+            )
+
+            tfhd = make_full_box(b"tfhd", 0, 0x020000, struct.pack(">I", 1))
+            tfdt = make_full_box(b"tfdt", 1, 0, struct.pack(">Q", decode_time))
+            trun_content = struct.pack(">Ii", count, 0) + entries
+            trun_size = 12 + len(trun_content)
+            traf_size = 8 + len(tfhd) + len(tfdt) + trun_size
+            moof_size = 8 + 16 + traf_size
+
+            trun_content = struct.pack(">Ii", count, moof_size + 8) + entries
+            trun = make_full_box(b"trun", 1, 0x000F01, trun_content)
+
+            f.write(make_box(b"moof", make_full_box(b"mfhd", 0, 0, struct.pack(">I", sequence)) + make_box(b"traf", tfhd + tfdt + trun)))
+
+            payload = bytearray()
+
+            for index, size in enumerate(sizes):
+                offset = (first + index) * 131 % (len(noise) - size)
+                payload += noise[offset:offset + size]
+
+            f.write(make_box(b"mdat", bytes(payload)))
+
+            decode_time += count * sample_duration
+            sequence += 1
+
+def input_sample_digest(path: Path) -> tuple[str, int]:
+    """按解码顺序计算分段 MP4 全部样本数据的摘要，顺带返回样本数"""
+    digest = hashlib.sha256()
+    count = 0
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    offset = 0
+
+    while offset < len(data):
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+
+        if box_type == b"moof":
+            traf = next(box for box in Box.parse(data, offset + 8, offset + size) if box.type == b"traf")
+            trun = next(box for box in Box.parse(traf.payload) if box.type == b"trun").payload
+
+            sample_count, data_offset = struct.unpack_from(">Ii", trun, 4)
+            sizes = from_big_endian("I", trun[12:12 + sample_count * 16])[1::4]
+            position = offset + data_offset
+
+            for sample_size in sizes:
+                digest.update(data[position:position + sample_size])
+                position += sample_size
+
+            count += sample_count
+
+        offset += size
+
+    return digest.hexdigest(), count
+
+def output_sample_digests(path: Path) -> dict[bytes, tuple[str, int]]:
+    """按 stsc / stsz / stco 还原普通 MP4 中每条轨道的样本，返回 {handler: (摘要, 样本数)}"""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    moov = next(box for box in Box.parse(data) if box.type == b"moov")
+    result = {}
+
+    for trak in moov.find_all(b"trak"):
+        handler = trak.find(b"mdia", b"hdlr").payload[8:12]
+        stbl = trak.find(b"mdia", b"minf", b"stbl")
+
+        stsz = stbl.find(b"stsz").payload
+        fixed_size, sample_count = struct.unpack_from(">II", stsz, 4)
+        sizes = from_big_endian("I", stsz[12:]) if fixed_size == 0 else array("I", [fixed_size]) * sample_count
+
+        if stbl.find(b"co64"):
+            offsets = from_big_endian("Q", stbl.find(b"co64").payload[8:])
+        else:
+            offsets = from_big_endian("I", stbl.find(b"stco").payload[8:])
+
+        stsc = from_big_endian("I", stbl.find(b"stsc").payload[8:])
+        runs = [(stsc[index], stsc[index + 1]) for index in range(0, len(stsc), 3)]
+
+        digest = hashlib.sha256()
+        sample = 0
+
+        for chunk_index, offset in enumerate(offsets):
+            per_chunk = next(count for first, count in reversed(runs) if first <= chunk_index + 1)
+
+            for _ in range(per_chunk):
+                digest.update(data[offset:offset + sizes[sample]])
+                offset += sizes[sample]
+                sample += 1
+
+        assert sample == sample_count, f"{handler} 的 stsc 与 stsz 不一致"
+
+        result[handler] = (digest.hexdigest(), sample_count)
+
+    return result
+
+def run_native(video: Path, audio: Path, output: Path):
+    MP4Remuxer.merge_video_audio(video, audio, output)
+
+def run_ffmpeg(video: Path, audio: Path, output: Path):
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error", "-i", str(video), "-i", str(audio), "-c:v", "copy", "-c:a", "copy", "-strict", "unofficial", str(output)],
+        check = True
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description = "音视频合并：MP4Remuxer 与 FFmpeg 的对比")
+    parser.add_argument("--duration", type = int, default = 600, help = "视频时长（秒）")
+    parser.add_argument("--bitrate", type = float, default = 6.0, help = "视频码率（Mbps）")
+    parser.add_argument("--rounds", type = int, default = 3, help = "每种方式的重复次数，取最快的一次")
+    parser.add_argument("--dir", default = None, help = "存放测试文件的目录，默认使用系统临时目录")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir = args.dir) as temp_dir:
+        video = Path(temp_dir, "video.m4s")
+        audio = Path(temp_dir, "audio.m4s")
+
+        write_fragmented(video, b"vide", VIDEO_TIMESCALE, video_sample_entry(), args.duration, args.bitrate)
+        write_fragmented(audio, b"soun", AUDIO_TIMESCALE, audio_sample_entry(), args.duration, 0.125)
+
+        total = video.stat().st_size + audio.stat().st_size
+
+        print(f"时长 {args.duration}s，视频 {video.stat().st_size / 1024 / 1024:.1f} MB，音频 {audio.stat().st_size / 1024 / 1024:.1f} MB")
+
+        methods = [("native", run_native)]
+
+        if shutil.which("ffmpeg"):
+            methods.append(("ffmpeg", run_ffmpeg))
+        else:
+            print("PATH 中没有 ffmpeg，只测试 native")
+
+        for name, func in methods:
+            output = Path(temp_dir, f"output_{name}.mp4")
+            best = None
+
+            for _ in range(args.rounds):
+                output.unlink(missing_ok = True)
+
+                started = time.perf_counter()
+                func(video, audio, output)
+                elapsed = time.perf_counter() - started
+
+                best = elapsed if best is None else min(best, elapsed)
+
+            print(f"  {name:<8} {best:8.3f}s  {total / 1024 / 1024 / best:10.1f} MB/s")
+
+        digests = output_sample_digests(Path(temp_dir, "output_native.mp4"))
+
+        assert digests[b"vide"] == input_sample_digest(video), "视频样本与输入不一致"
+        assert digests[b"soun"] == input_sample_digest(audio), "音频样本与输入不一致"
+
+        print("  native 输出的样本与输入逐一核对一致")
+
+if __name__ == "__main__":
+    main()
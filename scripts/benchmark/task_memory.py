@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+下载列表中 TaskInfo 的内存占用
+
+按数据库读出后的形态批量构造 TaskInfo，用 tracemalloc 统计每种规模下的总内存与单个任务的平均占用：
+  - cold：刚从数据库读出，File、Episode、Options 仍是未解析的 JSON（列表里绝大多数行都是这个状态）
+  - loaded：冷数据已展开（可见行、正在下载的任务）
+
+任务内容取自一个典型的投稿视频：带简介、标签与分片断点。
+
+用法：
+
+    python scripts/benchmark/task_memory.py
+    python scripts/benchmark/task_memory.py --count 1000 10000 50000
+"""
+from pathlib import Path
+import tracemalloc
+import argparse
+import sys
+import gc
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "src"))
+
+from util.download.task.info import TaskInfo, COLD_SECTIONS
+from util.common._json import json_dumps
+
+def build_sample() -> TaskInfo:
+    task_info = TaskInfo()
+
+    task_info.File.name = "【4K】某 UP 主的投稿视频标题 - P1 第一集"
+    task_info.File.download_path = "C:/Users/user/Downloads"
+    task_info.File.folder = "某 UP 主的投稿视频标题"
+    task_info.File.video_file_ext = "m4s"
+    task_info.File.audio_file_ext = "m4s"
+    task_info.File.merge_file_ext = "mp4"
+    task_info.File.relative_files = ["video.m4s", "audio.m4s"]
+
+    task_info.Episode.attribute = 1
+    task_info.Episode.aid = 114514191981
+    task_info.Episode.bvid = "BV1xx411c7mD"
+    task_info.Episode.cid = 1919810114
+    task_info.Episode.cover = "https://i0.hdslb.com/bfs/archive/0123456789abcdef0123456789abcdef01234567.jpg"
+    task_info.Episode.pubtime = 1772841600
+    task_info.Episode.number = "1"
+    task_info.Episode.leaf_title = "P1 第一集"
+    task_info.Episode.parent_title = "某 UP 主的投稿视频标题"
+    task_info.Episode.description = "这是一段视频简介。" * 20
+    task_info.Episode.uploader = "某 UP 主"
+    task_info.Episode.uploader_uid = 12345678
+    task_info.Episode.uploader_face = "https://i0.hdslb.com/bfs/face/0123456789abcdef0123456789abcdef01234567.jpg"
+    task_info.Episode.url = "https://www.bilibili.com/video/BV1xx411c7mD?p=1"
+    task_info.Episode.duration = 600
+    task_info.Episode.tags = ["标签一", "标签二", "生活", "日常", "Vlog"]
+    task_info.Episode.video_quality = "1080P 高清"
+    task_info.Episode.audio_quality = "192K"
+    task_info.Episode.video_codec = "AVC/H.264"
+
+    task_info.Options.video_container = "mp4"
+    task_info.Options.danmaku_type = "ass"
+    task_info.Options.subtitle_type = "srt"
+    task_info.Options.cover_type = "jpg"
+    task_info.Options.metadata_type = "nfo"
+    task_info.Options.subtitle_language = {"zh-CN": True}
+
+    return task_info
+
+def build_tasks(count: int, cold_data: str, loaded: bool):
+    task_info_list = []
+
+    for index in range(count):
+        task_info = TaskInfo()
+
+        # 与 TaskDatabase._to_task_info 相同：热字段逐项赋值，冷数据整体暂存。
+        # 字符串都经过一次切片，模拟每行从 SQLite 读出时各自独立的字符串对象
+        task_info.Basic.task_id = f"{index:08d}-0000-4000-8000-000000000000"
+        task_info.Basic.cover_id = ("0123456789abcdef" * 2)[:]
+        task_info.Basic.show_title = f"某 UP 主的投稿视频标题 - P{index}"
+        task_info.Basic.created_time = 1772841600000 + index
+
+        task_info.Download.status = 1
+        task_info.Download.total_size = 123456789
+        task_info.Download.queue = ["video", "audio"]
+        task_info.Download.files = {
+            "video": {"total_chunks": 4, "chunks_list": [2, 3], "file_size": 100000000, "chunk_offsets": {"0": 25000000, "1": 25000000, "2": 1048576, "3": 0}},
+            "audio": {"total_chunks": 1, "chunks_list": [0], "file_size": 23456789, "chunk_offsets": {"0": 0}}
+        }
+
+        task_info.set_cold_data(cold_data[:1] + cold_data[1:])
+
+        if loaded:
+            task_info.Episode
+
+        task_info_list.append(task_info)
+
+    return task_info_list
+
+def measure(count: int, cold_data: str, loaded: bool):
+    gc.collect()
+    tracemalloc.start()
+
+    task_info_list = build_tasks(count, cold_data, loaded)
+
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    del task_info_list
+
+    return current
+
+def main():
+    parser = argparse.ArgumentParser(description = "TaskInfo 内存占用")
+    parser.add_argument("--count", type = int, nargs = "+", default = [1000, 10000, 50000], help = "任务数")
+    args = parser.parse_args()
+
+    sample = build_sample()
+    cold_data = json_dumps({name: getattr(sample, name) for name in COLD_SECTIONS})
+
+    print(f"冷数据 JSON：{len(cold_data.encode())} 字节")
+    print(f"{'任务数':>8} {'状态':>8} {'总计 (MB)':>12} {'每个任务 (KB)':>14}")
+
+    for count in args.count:
+        for loaded in (False, True):
+            total = measure(count, cold_data, loaded)
+
+            print(f"{count:>8} {'loaded' if loaded else 'cold':>8} {total / 1024 / 1024:>12.1f} {total / count / 1024:>14.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+分片写入路径的 CPU 开销对比
+
+在子进程里起一个支持 Range 的本地服务器，客户端分别用两种方式把同一个文件下载若干遍：
+  - file：原先的写法，iter_bytes(8192) 后 f.write，每轮请求 open("r+b") + seek
+  - pwrite：数据攒进可复用的缓冲区，满了再按绝对偏移 os.pwrite
+
+统计客户端进程消耗的 CPU 时间，折算为每 GB 的 CPU 秒数。服务器在另一个进程，不计入。
+
+用法：
+
+    python scripts/benchmark/write_path.py
+    python scripts/benchmark/write_path.py --size 512 --buffer 256 --rounds 3
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Process, Queue
+import argparse
+import tempfile
+import time
+import os
+import re
+
+import httpx
+
+RANGE_PATTERN = re.compile(r"bytes=(\d+)-(\d*)")
+
+def serve(size: int, queue: Queue):
+    payload = os.urandom(1024 * 1024) * (size // (1024 * 1024))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            match = RANGE_PATTERN.fullmatch(self.headers.get("Range", ""))
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else size - 1
+
+            self.send_response(206)
+            self.send_header("Content-Length", str(end - start + 1))
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.end_headers()
+
+            self.wfile.write(memoryview(payload)[start:end + 1])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    queue.put(server.server_address[1])
+    server.serve_forever()
+
+def download_file(client: httpx.Client, url: str, path: str, size: int, chunk_size: int, buffer_size: int):
+    for start in range(0, size, chunk_size):
+        end = min(start + chunk_size, size)
+
+        with open(path, "r+b") as f:
+            f.seek(start)
+
+            with client.stream("GET", url, headers = {"Range": f"bytes={start}-{end - 1}"}) as response:
+                for chunk in response.iter_bytes(chunk_size = 8192):
+                    f.write(chunk)
+
+def download_pwrite(client: httpx.Client, url: str, path: str, size: int, chunk_size: int, buffer_size: int):
+    fd = os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+    buffer = memoryview(bytearray(buffer_size))
+
+    try:
+        for start in range(0, size, chunk_size):
+            end = min(start + chunk_size, size)
+            offset = start
+            filled = 0
+
+            with client.stream("GET", url, headers = {"Range": f"bytes={start}-{end - 1}"}) as response:
+                for chunk in response.iter_bytes():
+                    view = memoryview(chunk)
+
+                    while view:
+                        length = min(len(view), buffer_size - filled)
+
+                        buffer[filled:filled + length] = view[:length]
+                        filled += length
+                        view = view[length:]
+
+                        if filled == buffer_size:
+                            os.pwrite(fd, buffer, offset)
+                            offset += filled
+                            filled = 0
+
+            if filled:
+                os.pwrite(fd, buffer[:filled], offset)
+
+    finally:
+        os.close(fd)
+
+def main():
+    parser = argparse.ArgumentParser(description = "分片写入路径的 CPU 开销对比")
+    parser.add_argument("--size", type = int, default = 512, help = "测试文件大小（MB）")
+    parser.add_argument("--chunk", type = int, default = 4, help = "分片大小（MB）")
+    parser.add_argument("--buffer", type = int, default = 256, help = "pwrite 写缓冲区大小（KB）")
+    parser.add_argument("--rounds", type = int, default = 3, help = "每种写法重复的次数")
+    args = parser.parse_args()
+
+    if not hasattr(os, "pwrite"):
+        parser.error("当前平台没有 os.pwrite")
+
+    size = args.size * 1024 * 1024
+
+    queue = Queue()
+    server = Process(target = serve, args = (size, queue), daemon = True)
+    server.start()
+
+    url = f"http://127.0.0.1:{queue.get()}/file"
+
+    print(f"文件 {args.size} MB，分片 {args.chunk} MB，写缓冲区 {args.buffer} KB，每种写法 {args.rounds} 轮")
+
+    with tempfile.TemporaryDirectory() as directory, httpx.Client(timeout = 30) as client:
+        path = os.path.join(directory, "file.bin")
+
+        with open(path, "wb") as f:
+            f.truncate(size)
+
+        for name, func in (("file", download_file), ("pwrite", download_pwrite)):
+            cpu_started = time.process_time()
+            wall_started = time.perf_counter()
+
+            for _ in range(args.rounds):
+                func(client, url, path, size, args.chunk * 1024 * 1024, args.buffer * 1024)
+
+            cpu = time.process_time() - cpu_started
+            wall = time.perf_counter() - wall_started
+            gigabytes = size * args.rounds / 1024 ** 3
+
+            print(f"  {name:<8} CPU {cpu / gigabytes:6.2f} s/GB   耗时 {wall:6.2f}s")
+
+    server.terminate()
+
+if __name__ == "__main__":
+    main()
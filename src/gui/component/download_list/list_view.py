@@ -10,6 +10,8 @@ from .proxy_model import DownloadListProxyModel
 from gui.component.widget.smooth_scroll import applySmoothScroll
 
 from util.download.downloader.manager import downloader_manager
+from util.download.downloader.rate_limit import RateLimiter
+from util.download.task.pager import TaskPager
 from util.download.task.info import TaskInfo
 
 from util.common.enum import DownloadStatus, ToastNotificationCategory
@@ -63,6 +65,13 @@ class DownloadListView(ListView):
             case DownloadStatus.DOWNLOADING:
                 menu.addAction(self._create_action(FluentIcon.PAUSE, self.tr("Pause"), lambda: self.onTogglePauseResumeTask(index, task_info)))
 
+        if task_info.Download.status in (DownloadStatus.QUEUED, DownloadStatus.PAUSED, DownloadStatus.DOWNLOADING):
+            # 开启限速时，优先的任务从全局限速中分得更多带宽
+            if RateLimiter.is_prioritized(task_info.Basic.task_id):
+                menu.addAction(self._create_action(FluentIcon.UNPIN, self.tr("Remove Bandwidth Priority"), lambda: RateLimiter.set_prioritized(task_info.Basic.task_id, False)))
+            else:
+                menu.addAction(self._create_action(FluentIcon.PIN, self.tr("Prioritize Bandwidth"), lambda: RateLimiter.set_prioritized(task_info.Basic.task_id, True)))
+
         menu.addAction(self._create_action(ExtendedFluentIcon.RETRY, self.tr("Re-download"), lambda: self.onRedownloadTask(index, task_info)))
 
         #menu.addAction(self._create_action(FluentIcon.EDIT, self.tr("Edit download options"), lambda: self.onEditDownloadOptions(index, task_info)))
@@ -141,6 +150,12 @@ class DownloadListView(ListView):
                 # 如果没有正在下载的任务了，发射下载完成的通知信号
                 downloader_manager.show_notification()
 
+    def setPager(self, pager: TaskPager, task_info_list: List[TaskInfo]):
+        self._source_model.setPager(pager, task_info_list)
+
+    def resetPager(self, sort_key: str, ascending: bool):
+        self._source_model.resetPager(sort_key, ascending)
+
     def _beginAddQueriedTasks(self):
         self._in_adding_queried_tasks = True
 
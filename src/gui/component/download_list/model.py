@@ -2,7 +2,11 @@ from PySide6.QtCore import QModelIndex, Qt, QSize
 from PySide6.QtWidgets import QAbstractItemView
 
 from util.download.downloader.manager import downloader_manager
+from util.download.downloader.merge_scheduler import MergeScheduler
+from util.download.downloader.merger import Merger
+from util.download.downloader.prefetch import PlayurlPrefetcher
 from util.download.task.manager import task_manager
+from util.download.task.pager import TaskPager
 from util.download.task.info import TaskInfo
 from util.common.signal_bus import signal_bus
 from util.common.enum import DownloadStatus
@@ -26,6 +30,13 @@ class DownloadListModel(CoverQueryModelBase):
         self._managing_concurrent = False
         self._managing_merges = False
 
+        # 分页读取：_pager 为空表示列表一次性给全，不再向数据库取更多
+        self._pager: TaskPager = None
+        # 经由分页读入的任务，排序方式改变后重新分页时要先移出
+        self._fetched_task_ids: set[str] = set()
+        # 本次运行中移出列表的任务，数据库里的删除是异步的，重新分页时可能还读得到
+        self._removed_task_ids: set[str] = set()
+
         self._rebuild_row_index()
 
     def _get_task_id(self, task_info: TaskInfo):
@@ -43,6 +54,56 @@ class DownloadListModel(CoverQueryModelBase):
 
     def rowCount(self, parent = QModelIndex()):
         return len(self._task_list)
+
+    def setPager(self, pager: TaskPager, task_info_list: List[TaskInfo]):
+        # task_info_list 为调用方已经读出的第一页
+        self._pager = pager
+
+        self._appendFetchedRows(task_info_list)
+
+    def resetPager(self, sort_key: str, ascending: bool):
+        # 已读入的页是按旧的排序键取的，换成新的顺序后中间会缺行，只能从第一页重新读。
+        # 运行期间新加入的任务（例如刚完成的）不在分页结果里，予以保留
+        if self._pager is None:
+            return
+
+        self.beginResetModel()
+
+        self._task_list[:] = [task_info for task_info in self._task_list if task_info.Basic.task_id not in self._fetched_task_ids]
+        self._fetched_task_ids.clear()
+
+        self.endResetModel()
+
+        self._rebuild_row_index()
+
+        self._pager.reset(sort_key, ascending)
+
+        self.fetchMore()
+
+    def canFetchMore(self, parent = QModelIndex()):
+        return self._pager is not None and not self._pager.exhausted
+
+    def fetchMore(self, parent = QModelIndex()):
+        if not self.canFetchMore():
+            return
+
+        self._appendFetchedRows(self._pager.fetch())
+
+    def fetchAll(self):
+        # 需要作用于整个列表的操作（筛选、全部清除）之前，先把剩余的页读完
+        while self.canFetchMore():
+            self.fetchMore()
+
+    def _appendFetchedRows(self, task_info_list: List[TaskInfo]):
+        # 运行期间新加入的任务可能也在这一页里，跳过已在列表中的
+        task_info_list = [
+            task_info for task_info in task_info_list
+            if task_info.Basic.task_id not in self._row_by_task_id and task_info.Basic.task_id not in self._removed_task_ids
+        ]
+
+        self._fetched_task_ids.update(task_info.Basic.task_id for task_info in task_info_list)
+
+        self.appendRows(task_info_list)
     
     def data(self, index: QModelIndex, role = Qt.ItemDataRole.DisplayRole):
         if not index.isValid():
@@ -85,7 +146,8 @@ class DownloadListModel(CoverQueryModelBase):
 
         self.endInsertRows()
 
-        for row, task_info in enumerate(self._task_list):
+        # 追加在末尾，已有行的位置不变，只需登记新行
+        for row, task_info in enumerate(task_info_list, start = row):
             self._row_by_task_id[task_info.Basic.task_id] = row
 
         self._applyCurrentSort()
@@ -103,6 +165,9 @@ class DownloadListModel(CoverQueryModelBase):
         if 0 <= row < self.rowCount():
             self.beginRemoveRows(parent, row, row)
 
+            if self._pager is not None:
+                self._removed_task_ids.add(self._task_list[row].Basic.task_id)
+
             del self._task_list[row]
 
             self.endRemoveRows()
@@ -121,6 +186,9 @@ class DownloadListModel(CoverQueryModelBase):
         if not task_id_set:
             return
 
+        if self._pager is not None:
+            self._removed_task_ids.update(task_id_set)
+
         self.beginResetModel()
 
         self._task_list[:] = [
@@ -208,6 +276,9 @@ class DownloadListModel(CoverQueryModelBase):
         completed_tasks = []
         remaining_tasks = []
 
+        # 尚未分页读入的任务同样要清除
+        self.fetchAll()
+
         for task in list(self._task_list):
             match task.Download.status:
                 case DownloadStatus.MERGING | DownloadStatus.CONVERTING:
@@ -269,6 +340,11 @@ class DownloadListModel(CoverQueryModelBase):
             if task.Download.status in [DownloadStatus.DOWNLOADING, DownloadStatus.PARSING]:
                 active_count += 1
 
+        # 额度占满时，为接下来最先开始的几个排队任务预先解析下载链接，
+        # 空出额度后即可直接下载分片。预解析的个数与并发数相同，正好够补上一轮空出的额度
+        if active_count >= limit:
+            PlayurlPrefetcher.schedule([task for task in queued_tasks if task.Download.status == DownloadStatus.QUEUED][:limit])
+
         self.manageConcurrentMerges()
 
     def manageConcurrentMerges(self):
@@ -286,29 +362,19 @@ class DownloadListModel(CoverQueryModelBase):
 
     def _manageConcurrentMerges(self):
         # 自动调度同时合并的任务数量
-        # 为避免多个合并任务同时进行导致高频资源占用，每次只允许一个合并任务进行，其他等待合并的任务都处于等待合并状态，由 manage_concurrent_merges 统一调度
+        # 由 MergeScheduler 按 CPU 与磁盘两份预算判断能否再启动一个合并：封装与转码吃的资源不同，
+        # 可以同时进行；排在前面的任务暂时放不进去时，继续看后面的任务能否补上空出的预算
 
-        merging_count = 0
-        merge_queued_tasks = []
+        for task in [item for item in self._task_list if item.Download.status == DownloadStatus.FFMPEG_QUEUED]:
+            if not MergeScheduler.can_start(Merger.classify(task)):
+                if MergeScheduler.is_saturated():
+                    break
 
-        for item in self._task_list:
-            match item.Download.status:
-                case DownloadStatus.MERGING | DownloadStatus.CONVERTING:
-                    merging_count += 1
-
-                case DownloadStatus.FFMPEG_QUEUED:
-                    merge_queued_tasks.append(item)
-
-        for task in merge_queued_tasks:
-            if merging_count >= 1:
-                break
+                continue
 
+            # 无需调用 ffmpeg 的任务会同步完成，不占用合并预算
             self.togglePauseResume(task)
 
-            # 无需调用 ffmpeg 的任务会同步完成，不占用合并额度
-            if task.Download.status in [DownloadStatus.MERGING, DownloadStatus.CONVERTING]:
-                merging_count += 1
-
     def connectUpdateDataSignal(self):
         signal_bus.download.update_downloading_item.connect(self.onUpdateData)
 
@@ -384,7 +450,8 @@ class DownloadListModel(CoverQueryModelBase):
                 self._task_list.sort(key = lambda x: x.Basic.completed_time, reverse = reverse)
 
             case "show_title":
-                self._task_list.sort(key = lambda x: x.Basic.show_title, reverse = reverse)
+                # 与分页查询的 CASEFOLD 排序规则、代理模型的比较方式一致
+                self._task_list.sort(key = lambda x: (x.Basic.show_title or "").casefold(), reverse = reverse)
 
             case "file_size":
                 self._task_list.sort(key = lambda x: x.Download.total_size, reverse = reverse)
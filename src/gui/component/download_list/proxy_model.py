@@ -129,11 +129,11 @@ class DownloadListProxyModel(QSortFilterProxyModel):
 
         return source.queryRowCover(cover_id, cover_url, source_index.row())
 
-    def updateRowCover(self, cover_id: str, image):
+    def updateRowCover(self, cover_id: str, image, cover_size):
         source = self._source()
 
         if source:
-            source.updateRowCover(cover_id, image)
+            source.updateRowCover(cover_id, image, cover_size)
 
     def setQueryCoverParam(self, param: dict):
         source = self._source()
@@ -299,12 +299,21 @@ class DownloadListProxyModel(QSortFilterProxyModel):
 
     def setFilterText(self, text: str):
         self._filter_text = text.strip()
+        self._fetchAllForFilter()
         self._scheduleRefresh(refresh_filter = True)
 
     def setStatusFilter(self, statuses):
         self._status_filter = set(statuses) if statuses else None
+        self._fetchAllForFilter()
         self._scheduleRefresh(refresh_filter = True)
 
+    def _fetchAllForFilter(self):
+        # 筛选只能作用于已读入的行，分页读取的列表要先读完，否则还没读到的任务永远搜不出来
+        source = self._source()
+
+        if source and (self._filter_text or self._status_filter):
+            source.fetchAll()
+
     def clearFilter(self):
         self._filter_text = ""
         self._status_filter = None
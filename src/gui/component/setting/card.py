@@ -479,6 +479,8 @@ class CDNSettingCard(ExpandGroupSettingCard):
         self.parent_window = parent_window
 
         self.prefer_server_provider_switch = SettingSwitchButton(config.prefer_cdn_server_provider, parent = self)
+        self.multi_cdn_download_switch = SettingSwitchButton(config.multi_cdn_download, parent = self)
+        self.http2_download_switch = SettingSwitchButton(config.http2_download, parent = self)
         self.configure_area_btn = PushButton(self.tr("Configure…"), self)
         self.custom_provider_btn = PushButton(self.tr("Customize…"), self)
 
@@ -486,6 +488,8 @@ class CDNSettingCard(ExpandGroupSettingCard):
         self.viewLayout.setSpacing(0)
 
         self.addGroup("", self.tr("Prefer Service Provider CDN"), self.tr("Prefer CDN provided by cloud service providers to improve download stability"), self.prefer_server_provider_switch)
+        self.addGroup("", self.tr("Download from Multiple CDNs"), self.tr("Download each file from several CDN servers at once, weighted by their measured speed"), self.multi_cdn_download_switch)
+        self.addGroup("", self.tr("Use HTTP/2"), self.tr("Multiplex all download threads over a single connection per CDN server, falling back to HTTP/1.1 when unsupported"), self.http2_download_switch)
         self.addGroup("", self.tr("Select Geographic Location"), self.tr("Select your actual location to automatically match a more suitable CDN server and improve download speed"), self.configure_area_btn)
         self.addGroup("", self.tr("Customize Service Provider CDN"), self.tr("Customize the list and priority of service provider CDNs"), self.custom_provider_btn)
 
@@ -521,9 +525,13 @@ class FFmpegSettingCard(ExpandGroupSettingCard):
 
         self.source_choice = SettingComboBox(config.ffmpeg_source, [self.tr("Bundled (with app)"), self.tr("System PATH"), self.tr("Custom path")], parent = self)
         self.custom_btn = PushButton(self.tr("Browse…"), self)
+        self.stream_merge_switch = SettingSwitchButton(config.stream_merge, parent = self)
+        self.native_remux_switch = SettingSwitchButton(config.native_remux, parent = self)
 
         self.addGroup("", self.tr("FFmpeg Source"), self.tr("Select the FFmpeg executable to use"), self.source_choice)
         self.custom_group = self.addGroup("", self.tr("Custom FFmpeg Path"), "", self.custom_btn)
+        self.addGroup("", self.tr("Merge While Downloading"), self.tr("Start merging DASH video and audio while the last stream is still downloading, so the file is ready seconds after the download ends"), self.stream_merge_switch)
+        self.addGroup("", self.tr("Merge Without FFmpeg"), self.tr("Merge plain DASH video and audio into MP4 directly, using FFmpeg only for other formats or when embedding covers, chapters or subtitles"), self.native_remux_switch)
 
         self.custom_group.setEnabled(self.source_choice.currentIndex() == 2)
 
@@ -596,12 +604,16 @@ class DownloadConcurrencySettingCard(ExpandGroupSettingCard):
 
         self.download_thread_slider = SettingSlider(config.download_thread, self)
         self.download_parallel_slider = SettingSlider(config.download_parallel, self)
+        self.download_engine_choice = SettingComboBox(config.download_engine, [self.tr("Thread pool"), self.tr("Asynchronous (asyncio)")], parent = self)
+        self.progress_save_interval_slider = SettingSlider(config.progress_save_interval, self)
 
         self.download_speed_limit_btn = PushButton(self.tr("Configure…"), self)
 
         self.addGroup("", self.tr("Number of Threads"), self.tr("Adjust the number of threads used per task (default: 4)"), self.download_thread_slider)
         self.addGroup("", self.tr("Number of Parallel Downloads"), self.tr("Adjust the number of tasks downloaded simultaneously (default: 1)"), self.download_parallel_slider)
         self.addGroup("", self.tr("Speed Limit Settings"), self.tr("Configure speed limit settings for downloads"), self.download_speed_limit_btn)
+        self.addGroup("", self.tr("Download Engine"), self.tr("The asynchronous engine runs every task on one event loop instead of one thread per chunk; applies to tasks started afterwards"), self.download_engine_choice)
+        self.addGroup("", self.tr("Progress Save Interval"), self.tr("Save download progress at most every this many seconds; at most this much progress is lost if the program exits unexpectedly (default: 2)"), self.progress_save_interval_slider)
 
 class CheckUpdateSettingCard(ExpandGroupSettingCard):
     def __init__(self, parent = None):
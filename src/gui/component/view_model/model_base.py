@@ -33,7 +33,7 @@ class CoverQueryModelBase(QAbstractListModel):
             }
         
         # 命中缓存，直接返回
-        if cahce := cover_manager.getCache(cover_id):
+        if cahce := cover_manager.getCache(cover_id, self._cover_size):
             return cahce, False
 
         # 记录等待该cover_id的所有row
@@ -48,11 +48,12 @@ class CoverQueryModelBase(QAbstractListModel):
 
         return cover_manager.placeholder(self._cover_size), True
 
-    @Slot(str, QImage)
-    def updateRowCover(self, cover_id: str, image: QImage):
-        # 缓存图片（回到 GUI 线程后再转成 QPixmap）
+    @Slot(str, QImage, QSize)
+    def updateRowCover(self, cover_id: str, image: QImage, cover_size: QSize):
+        # 缓存图片（回到 GUI 线程后再转成 QPixmap）。按发起请求时的尺寸缓存：
+        # 请求期间列表可能已经换了封面尺寸，图片仍是按旧尺寸裁剪的
         pixmap = QPixmap.fromImage(image)
-        cover_manager.updateCache(cover_id, pixmap)
+        cover_manager.updateCache(cover_id, pixmap, cover_size)
 
         # 更新所有等待该cover_id的行
         if cover_id in self.cover_waiting_rows:
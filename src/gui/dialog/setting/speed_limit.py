@@ -1,8 +1,10 @@
-from qfluentwidgets import SubtitleLabel, DoubleSpinBox, SwitchButton, BodyLabel
+from qfluentwidgets import SubtitleLabel, DoubleSpinBox, SwitchButton, BodyLabel, LineEdit
 
 from gui.component.dialog import DialogBase
 
+from util.common.enum import ToastNotificationCategory
 from util.common.config import config
+from util.download.downloader.rate_limit import RateSchedule
 
 class SpeedLimitSettingDialog(DialogBase):
     def __init__(self, parent = None):
@@ -28,6 +30,13 @@ class SpeedLimitSettingDialog(DialogBase):
         self.rate_spin.setDecimals(1)
         self.rate_spin.setValue(self.speed_limit_rate)
 
+        schedule_lab = BodyLabel(self.tr("Schedule (optional, overrides the limit above within each period)"), self)
+
+        self.schedule_box = LineEdit(self)
+        self.schedule_box.setPlaceholderText(self.tr("e.g. 08:00-23:00=2, 23:00-08:00=0"))
+        self.schedule_box.setClearButtonEnabled(True)
+        self.schedule_box.setText(config.get(config.speed_limit_schedule))
+
         self.viewLayout.addWidget(self.caption_lab)
         self.viewLayout.addSpacing(10)
         self.viewLayout.addWidget(enable_lab)
@@ -35,11 +44,28 @@ class SpeedLimitSettingDialog(DialogBase):
         self.viewLayout.addSpacing(5)
         self.viewLayout.addWidget(rate_lab)
         self.viewLayout.addWidget(self.rate_spin)
+        self.viewLayout.addSpacing(5)
+        self.viewLayout.addWidget(schedule_lab)
+        self.viewLayout.addWidget(self.schedule_box)
 
         self.widget.setMinimumWidth(350)
 
+    def validate(self):
+        # 每条规则都要能识别，否则用户以为生效了的时段实际上被忽略
+        is_valid = RateSchedule.is_valid(self.schedule_box.text())
+
+        self.schedule_box.setError(not is_valid)
+
+        if not is_valid:
+            self.schedule_box.setFocus()
+            self.show_top_toast_message(ToastNotificationCategory.ERROR, "", self.tr("Invalid schedule, use the format HH:MM-HH:MM=MB/s"))
+
+        return is_valid
+
     def accept(self):
+        # 下载中的任务无需重新开始，限速会在一秒内按新的设置生效
         config.set(config.speed_limit_enabled, self.enable_switch.isChecked())
         config.set(config.speed_limit_rate, self.rate_spin.value())
+        config.set(config.speed_limit_schedule, self.schedule_box.text().strip())
 
         return super().accept()
\ No newline at end of file
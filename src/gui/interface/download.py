@@ -6,6 +6,7 @@ from gui.component.download_list import TopStackedWidget, DownloadListView
 from gui.component.widget.pivot import PivotItem
 
 from util.download.task.query_worker import QueryWorker
+from util.download.task.pager import TaskPager
 from util.download.task.info import TaskInfo
 
 from util.common.enum import ToastNotificationCategory
@@ -97,6 +98,8 @@ class DownloadInterface(QFrame):
             key,
             ascending
         )
+        # 已完成的列表是分页读取的，换了排序键要按新的顺序从第一页重新读
+        self.completed_list_view.resetPager(key, ascending)
         self.completed_list_view._model.sortBy(key, ascending)
 
     def _save_sort_preference(self, key_item, ascending_item, key: str, ascending: bool):
@@ -126,11 +129,11 @@ class DownloadInterface(QFrame):
 
         AsyncTask.run(worker)
     
-    def on_query_success(self, downloading_tasks: list[TaskInfo], completed_tasks: list[TaskInfo]):
+    def on_query_success(self, downloading_tasks: list[TaskInfo], completed_tasks: list[TaskInfo], completed_pager: TaskPager):
         self.downloading_list_view._beginAddQueriedTasks()
 
         self.downloading_list_view.addTask(downloading_tasks)
-        self.completed_list_view.addTask(completed_tasks)
+        self.completed_list_view.setPager(completed_pager, completed_tasks)
 
         self.downloading_list_view._endAddQueriedTasks()
 
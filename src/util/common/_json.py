@@ -1,3 +1,4 @@
+from dataclasses import asdict, is_dataclass
 import json as std_json
 import logging
 
@@ -23,8 +24,15 @@ def json_dumps(obj, indent = None):
         # orjson 仅支持 2 空格缩进；未指定 indent 时输出紧凑格式，避免入库数据额外膨胀一倍
         return json.dumps(obj, option = json.OPT_INDENT_2 if indent else None).decode("utf-8")
     else:
-        return json.dumps(obj, indent = indent)
-    
+        # orjson 能直接序列化 dataclass，标准库需要先转换
+        return json.dumps(obj, indent = indent, default = _to_serializable)
+
+def _to_serializable(obj):
+    if is_dataclass(obj) and not isinstance(obj, type):
+        return asdict(obj)
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
 def json_dumps_stable(obj):
     # 供计算持久化哈希使用，输出格式必须永远保持稳定。
     #
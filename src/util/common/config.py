@@ -10,7 +10,7 @@ from .serializer import LanguageSerializer, ScalingSerializer
 from .enum import (
     Language, WhenClose, DanmakuType, SubtitleType, CoverType, MetadataType, ProxyMode, ProxyType, FFmpegSource,
     NumberingType, Scaling, FileConflictResolution, VideoContainer, AutoSelectMode, Area, DuplicateDownloadResolution,
-    ConventionType
+    ConventionType, DownloadEngine
 )
 from ._json import json_loads
 
@@ -353,8 +353,11 @@ class APPConfig(QConfig):
     download_path = ConfigItem("Download", "download_path", QStandardPaths.writableLocation(QStandardPaths.StandardLocation.DownloadLocation))
     download_thread = RangeConfigItem("Download", "download_thread", 4, RangeValidator(1, 10))
     download_parallel = RangeConfigItem("Download", "download_parallel", 1, RangeValidator(1, 10))
+    download_engine = OptionsConfigItem("Download", "download_engine", DownloadEngine.THREAD, OptionsValidator(DownloadEngine), EnumSerializer(DownloadEngine))
     speed_limit_enabled = ConfigItem("Download", "speed_limit_enabled", False, BoolValidator())
     speed_limit_rate = ConfigItem("Download", "speed_limit_rate", 10.0)
+    speed_limit_schedule = ConfigItem("Download", "speed_limit_schedule", "")
+    progress_save_interval = RangeConfigItem("Download", "progress_save_interval", 2, RangeValidator(1, 30))
 
     video_quality_priority = ConfigItem("Download", "video_quality_priority", DefaultValue.video_quality_priority)
     audio_quality_priority = ConfigItem("Download", "audio_quality_priority", DefaultValue.audio_quality_priority)
@@ -396,9 +399,13 @@ class APPConfig(QConfig):
     area = OptionsConfigItem("Advanced", "area", Area.CN, OptionsValidator(Area), EnumSerializer(Area))
     cn_cdn_server_list = ConfigItem("Advanced", "cn_cdn_server_list", DefaultValue.cn_cdn_server_list)
     ov_cdn_server_list = ConfigItem("Advanced", "ov_cdn_server_list", DefaultValue.ov_cdn_server_list)
+    multi_cdn_download = ConfigItem("Advanced", "multi_cdn_download", False, BoolValidator())
+    http2_download = ConfigItem("Advanced", "http2_download", False, BoolValidator(), restart = True)
 
     ffmpeg_source = OptionsConfigItem("Advanced", "ffmpeg_source", FFmpegSource.BUNDLED, OptionsValidator(FFmpegSource), EnumSerializer(FFmpegSource), restart = True)
     custom_ffmpeg_path = ConfigItem("Advanced", "custom_ffmpeg_path", "", restart = True)
+    stream_merge = ConfigItem("Advanced", "stream_merge", False, BoolValidator())
+    native_remux = ConfigItem("Advanced", "native_remux", True, BoolValidator())
 
     proxy_mode = OptionsConfigItem("Advanced", "proxy_mode", ProxyMode.SYSTEM, OptionsValidator(ProxyMode), EnumSerializer(ProxyMode), restart = True)
     proxy_type = OptionsConfigItem("Advanced", "proxy_type", ProxyType.HTTP, OptionsValidator(ProxyType), EnumSerializer(ProxyType))
@@ -46,10 +46,16 @@ class Database:
             conn.execute("PRAGMA synchronous = NORMAL")
             conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
 
+            self._on_connect(conn)
+
             storage.conn = conn
 
         return conn
 
+    def _on_connect(self, conn: sqlite3.Connection):
+        # 新建连接后调用，子类在这里注册自定义的函数与排序规则
+        pass
+
     def close_connection(self):
         # 关闭当前线程持有的连接，仅在明确需要释放数据库文件时调用
         storage = self._get_storage()
@@ -75,6 +75,16 @@ class FFmpegSource(Enum):
     SYSTEM = "system"
     CUSTOM = "custom"
 
+class DownloadEngine(Enum):
+    THREAD = "thread"           # 线程池，每个分片占用一个线程
+    ASYNCIO = "asyncio"         # 单线程事件循环，全部任务的分片共用
+
+class MergeJobKind(Enum):
+    RENAME = "rename"           # 无需 FFmpeg，只重命名输出文件
+    COPY = "copy"               # 音视频或分段直接封装（-c copy / 直接合并），主要消耗磁盘读写
+    EMBED = "embed"             # 封装的同时写入封面、章节、字幕轨，读写的文件更多
+    TRANSCODE = "transcode"     # m4a 转 mp3 等重新编码，主要消耗 CPU
+
 class NumberingType(Enum):
     FROM_SPECIFIED = 0
     USE_PARSE_LIST = 1
@@ -4,11 +4,35 @@ from ..config import config
 from threading import Lock
 from pathlib import Path
 import logging
+import sys
+import os
 
 logger = logging.getLogger(__name__)
 
 _rename_lock = Lock()
 
+if sys.platform == "win32":
+    # Windows 没有 os.pwrite。lseek + write 两步之间要加锁，会把所有分片的写入串成一条；
+    # 改为直接调用 WriteFile，在 OVERLAPPED 里带上偏移，一次调用完成定位与写入，各线程互不干扰
+    import ctypes
+    import msvcrt
+    from ctypes import wintypes
+
+    class _OVERLAPPED(ctypes.Structure):
+        _fields_ = [
+            ("Internal", ctypes.c_size_t),
+            ("InternalHigh", ctypes.c_size_t),
+            ("Offset", wintypes.DWORD),
+            ("OffsetHigh", wintypes.DWORD),
+            ("hEvent", wintypes.HANDLE)
+        ]
+
+    _kernel32 = ctypes.WinDLL("kernel32", use_last_error = True)
+
+    _WriteFile = _kernel32.WriteFile
+    _WriteFile.argtypes = [wintypes.HANDLE, ctypes.c_void_p, wintypes.DWORD, ctypes.POINTER(wintypes.DWORD), ctypes.POINTER(_OVERLAPPED)]
+    _WriteFile.restype = wintypes.BOOL
+
 def safe_remove(cwd: str | Path, *file_names: str):
     for file_name in file_names:
         path = Path(cwd, file_name)
@@ -71,3 +95,45 @@ class File:
         # 确保父目录存在，并创建一个空文件作为占位符
         Path(path).parent.mkdir(parents = True, exist_ok = True)
         Path(path).touch(exist_ok = True)
+
+    @staticmethod
+    def open_for_write(path: str | Path) -> int:
+        # 以读写方式打开已存在的文件，返回文件描述符，配合 pwrite 按绝对偏移写入
+        return os.open(path, os.O_RDWR | getattr(os, "O_BINARY", 0))
+
+    @staticmethod
+    def pwrite(fd: int, data, offset: int):
+        """
+        把 data 完整写到文件的 offset 处
+
+        不经过 Python 的文件缓冲区，返回时数据已交给操作系统
+        """
+        view = memoryview(data)
+
+        while view:
+            if sys.platform == "win32":
+                size = File.msw_pwrite(fd, view, offset)
+
+            else:
+                size = os.pwrite(fd, view, offset)
+
+            view = view[size:]
+            offset += size
+
+    @staticmethod
+    def msw_pwrite(fd: int, view: memoryview, offset: int) -> int:
+        # 单次 WriteFile 最多写 DWORD 能表示的字节数，剩余部分由 pwrite 的循环继续写
+        size = min(len(view), 0x7FFFFFFF)
+
+        if view.readonly:
+            buffer = (ctypes.c_char * size).from_buffer_copy(view[:size])
+        else:
+            buffer = (ctypes.c_char * size).from_buffer(view[:size])
+
+        overlapped = _OVERLAPPED(Offset = offset & 0xFFFFFFFF, OffsetHigh = offset >> 32)
+        written = wintypes.DWORD()
+
+        if not _WriteFile(msvcrt.get_osfhandle(fd), buffer, size, ctypes.byref(written), ctypes.byref(overlapped)):
+            raise ctypes.WinError(ctypes.get_last_error())
+
+        return written.value
@@ -1,7 +1,80 @@
 from PySide6.QtGui import QPixmap
 
-from typing import Dict
+from collections import OrderedDict
+from typing import Tuple
+
+# 封面缓存的像素内存上限。下载列表的封面为 144x80，32 位色深下每张约 45 KB，
+# 64 MB 约可容纳一千多张，远多于一屏能显示的数量
+COVER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+CoverKey = Tuple[str, int, int]
 
 class CoverCache:
-    cache: Dict[str, QPixmap] = {}
-    
\ No newline at end of file
+    """
+    已解码封面的 LRU 缓存，按 cover_id 与目标尺寸区分，以像素占用的字节数为上限
+
+    原先是一个没有淘汰的字典，在上千条解析结果或下载记录里来回滚动后，
+    每一张解码过的封面都会常驻到进程退出。
+
+    视图每次绘制可见行都会经 getCache 取用封面，可见行的封面因此始终排在最近使用的一端，
+    超出上限时先淘汰的自然是已经滚出视野最久的行。只在 GUI 线程访问（QPixmap 不能跨线程使用）
+    """
+    cache: OrderedDict[CoverKey, QPixmap] = OrderedDict()
+    max_bytes = COVER_CACHE_MAX_BYTES
+
+    total_bytes = 0
+
+    hits = 0
+    misses = 0
+    evictions = 0
+
+    @classmethod
+    def get(cls, key: CoverKey) -> QPixmap | None:
+        pixmap = cls.cache.get(key)
+
+        if pixmap is None:
+            cls.misses += 1
+
+            return None
+
+        cls.cache.move_to_end(key)
+        cls.hits += 1
+
+        return pixmap
+
+    @classmethod
+    def put(cls, key: CoverKey, pixmap: QPixmap):
+        if key in cls.cache:
+            cls.cache.move_to_end(key)
+
+            return
+
+        size = cls._pixmap_bytes(pixmap)
+
+        if size > cls.max_bytes:
+            # 单张就超过上限，缓存它只会把其余封面全部挤掉
+            return
+
+        cls.cache[key] = pixmap
+        cls.total_bytes += size
+
+        while cls.total_bytes > cls.max_bytes:
+            _, evicted = cls.cache.popitem(last = False)
+
+            cls.total_bytes -= cls._pixmap_bytes(evicted)
+            cls.evictions += 1
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "entries": len(cls.cache),
+            "bytes": cls.total_bytes,
+            "max_bytes": cls.max_bytes,
+            "hits": cls.hits,
+            "misses": cls.misses,
+            "evictions": cls.evictions
+        }
+
+    @staticmethod
+    def _pixmap_bytes(pixmap: QPixmap) -> int:
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
@@ -44,12 +44,15 @@ class CoverManager:
 
         return placeholder_pixmap
     
-    def updateCache(self, cover_id: str, cover_data: bytes):
-        if cover_id not in CoverCache.cache:
-            CoverCache.cache[cover_id] = cover_data
+    def updateCache(self, cover_id: str, pixmap: QPixmap, cover_size: QSize):
+        # 同一封面在不同列表中的显示尺寸不同，缩放后的结果分别缓存
+        CoverCache.put((cover_id, cover_size.width(), cover_size.height()), pixmap)
 
-    def getCache(self, cover_id: str):
-        return CoverCache.cache.get(cover_id, None)
+    def getCache(self, cover_id: str, cover_size: QSize):
+        return CoverCache.get((cover_id, cover_size.width(), cover_size.height()))
+
+    def cacheStats(self):
+        return CoverCache.stats()
 
 cover_manager = CoverManager()
     
\ No newline at end of file
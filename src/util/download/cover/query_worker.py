@@ -79,7 +79,8 @@ class CoverQueryWorker(QRunnable):
             "updateRowCover",
             Qt.ConnectionType.QueuedConnection,
             Q_ARG(str, self.query_id),
-            Q_ARG(QImage, image)
+            Q_ARG(QImage, image),
+            Q_ARG(QSize, self.cover_size)
         )
 
     def download_cover(self):
@@ -0,0 +1,314 @@
+from ...common.config import config
+from ...network.request import get_cookies
+from ...network.connection_pool import create_async_download_client
+
+from .chunk import ChunkTask, RangeWriter
+
+from threading import Condition, Lock, Thread
+import asyncio
+import logging
+import httpx
+import time
+
+logger = logging.getLogger(__name__)
+
+class AsyncDownloadEngine:
+    """
+    异步下载引擎
+
+    整个进程只有一个事件循环线程，全部任务的分片请求都以协程的形式跑在上面，
+    共用一个 AsyncClient。并发数不再受线程数限制，大量任务同时下载时
+    也不会因为每个分片占一个线程而产生成百上千个线程
+    """
+    _lock = Lock()
+    _loop: asyncio.AbstractEventLoop = None
+    _thread: Thread = None
+    _client: httpx.AsyncClient = None
+
+    @classmethod
+    def get_loop(cls) -> asyncio.AbstractEventLoop:
+        with cls._lock:
+            if cls._loop is None:
+                loop = asyncio.new_event_loop()
+
+                # 守护线程：进程退出时各任务已经停止，事件循环无需单独收尾
+                thread = Thread(target = cls._run_loop, args = (loop, ), name = "download-engine", daemon = True)
+                thread.start()
+
+                cls._loop = loop
+                cls._thread = thread
+
+            return cls._loop
+
+    @staticmethod
+    def _run_loop(loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+
+        loop.run_forever()
+
+    @classmethod
+    def get_client(cls) -> httpx.AsyncClient:
+        # 只在事件循环线程上调用，因此无需加锁
+        if cls._client is None:
+            cls._client = create_async_download_client()
+
+        return cls._client
+
+    @classmethod
+    def call_soon(cls, callback, *args):
+        cls.get_loop().call_soon_threadsafe(callback, *args)
+
+    @classmethod
+    def update_cookies(cls, cookies: dict):
+        # 与线程池引擎一样只对 bilibili.com 生效，登录状态可能变化，每个任务开始时刷新一次
+        client = cls.get_client()
+
+        for key, value in cookies.items():
+            client.cookies.set(name = key, value = value, domain = ".bilibili.com", path = "/")
+
+class AsyncChunkPool:
+    """
+    异步引擎下单个任务的分片调度器
+
+    对外提供与 QThreadPool 相同的接口（start / clear / waitForDone / maxThreadCount），
+    Downloader 无需区分两种引擎。线程数设置在这里表示同时进行的分片请求数
+    """
+    def __init__(self):
+        self.max_count = 1
+        self.semaphore: asyncio.Semaphore = None
+
+        self.condition = Condition()
+        self.pending = 0
+        # 已经 start、但 _spawn 还没在事件循环上执行的分片，clear / abort 同样要能丢弃它们
+        self.queued: set["AsyncChunkWorker"] = set()
+        self.tasks: dict["AsyncChunkWorker", asyncio.Task] = {}
+
+        AsyncDownloadEngine.call_soon(AsyncDownloadEngine.update_cookies, get_cookies())
+
+    def setMaxThreadCount(self, count: int):
+        self.max_count = max(count, 1)
+
+    def maxThreadCount(self) -> int:
+        return self.max_count
+
+    def start(self, worker: "AsyncChunkWorker"):
+        # 计数在调用方线程上登记，waitForDone 不会漏掉尚未进入事件循环的分片
+        with self.condition:
+            self.pending += 1
+            self.queued.add(worker)
+
+        AsyncDownloadEngine.call_soon(self._spawn, worker)
+
+    def _spawn(self, worker: "AsyncChunkWorker"):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_count)
+
+        task = asyncio.get_running_loop().create_task(self._run(worker))
+
+        with self.condition:
+            self.queued.discard(worker)
+            self.tasks[worker] = task
+
+        task.add_done_callback(lambda _: self._on_done(worker))
+
+    async def _run(self, worker: "AsyncChunkWorker"):
+        if worker.discarded:
+            return
+
+        async with self.semaphore:
+            if worker.discarded:
+                return
+
+            worker.started = True
+
+            await worker.run()
+
+    def _on_done(self, worker: "AsyncChunkWorker"):
+        with self.condition:
+            self.tasks.pop(worker, None)
+            self.pending -= 1
+
+            self.condition.notify_all()
+
+    def clear(self):
+        # 与 QThreadPool.clear 一致：只丢弃尚未开始的分片
+        with self.condition:
+            for worker in self.queued:
+                worker.discarded = True
+
+            for worker in self.tasks:
+                if not worker.started:
+                    worker.discarded = True
+
+    def abort(self):
+        # 立即中断本任务全部分片。已收到的数据在协程的 finally 中写出缓冲区、记录断点后才退出，
+        # 相当于线程池引擎下关闭会话让阻塞的读取出错返回
+        with self.condition:
+            # 尚在排队的分片进入事件循环后由 _run 直接返回
+            for worker in self.queued:
+                worker.discarded = True
+
+            tasks = list(self.tasks.items())
+
+        for worker, task in tasks:
+            worker.discarded = True
+
+            AsyncDownloadEngine.call_soon(task.cancel)
+
+    def waitForDone(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.pending <= 0)
+
+class AsyncChunkWorker(ChunkTask):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.started = False
+        self.discarded = False
+
+    async def _interruptible_sleep(self, seconds: float):
+        # 分段休眠，保证暂停、取消能够及时生效，而不必等满整个退避时间
+        while seconds > 0:
+            if self._is_stopped():
+                return
+
+            interval = min(0.1, seconds)
+
+            await asyncio.sleep(interval)
+
+            seconds -= interval
+
+    async def run(self):
+        if self._is_stopped():
+            return
+
+        if self.on_chunk_start:
+            self.on_chunk_start(self)
+
+        try:
+            await self._download_chunk()
+        finally:
+            if self.on_chunk_end:
+                self.on_chunk_end(self)
+
+    async def _download_chunk(self):
+        try:
+            await self._download_chunk_range()
+
+        finally:
+            self._close_file()
+
+    async def _download_chunk_range(self):
+        # 流程与 ChunkWorker._download_chunk_range 一致，断点、拆分、完成通知的约定完全相同，
+        # 两种引擎之间切换不影响已有任务的续传
+        client = AsyncDownloadEngine.get_client()
+        chunk_start = self.chunk_range[0]
+
+        written = self._load_offset()
+        attempt = 0
+
+        while not self._is_stopped() and attempt < self.max_retries:
+            chunk_end = self._reset_position(written)
+
+            if chunk_start + written >= chunk_end:
+                self._notify_chunk_finished()
+
+                break
+
+            headers = {
+                "Range": f"bytes={chunk_start + written}-{chunk_end - 1}",
+                "Referer": self.referer,
+                "User-Agent": config.get(config.user_agent)
+            }
+
+            downloaded = 0
+            pending = 0
+            expected_size = 0
+            flushed = False
+            truncated = False
+            started_time = time.monotonic()
+            url = self.sources.pick()
+
+            try:
+                # 文件写入仍是同步调用：每次 pwrite 的只是页缓存，耗时远小于一次网络读取
+                writer = RangeWriter(self._open_file(), chunk_start + written, self._get_buffer())
+
+                try:
+                    async with client.stream("GET", url, headers = headers, follow_redirects = True) as response:
+                        try:
+                            expected_size = self._check_response(response, written)
+
+                        except StopIteration:
+                            written = 0
+
+                            raise
+
+                        async for chunk in response.aiter_bytes():
+                            if self._is_stopped():
+                                break
+
+                            if chunk:
+                                chunk, truncated = self._accept(chunk)
+
+                            if chunk:
+                                chunk_len = len(chunk)
+
+                                if self.token_bucket:
+                                    delay = self.token_bucket.reserve(chunk_len)
+
+                                    if delay > 0:
+                                        await self._interruptible_sleep(delay)
+
+                                downloaded += chunk_len
+                                pending += chunk_len
+
+                                self._add_downloaded(chunk_len)
+
+                                persisted = writer.write(chunk)
+
+                                if persisted:
+                                    written += persisted
+                                    pending -= persisted
+
+                                    self._commit_offset(written)
+
+                            if truncated:
+                                break
+
+                finally:
+                    # 被 abort() 取消时同样会走到这里，写出成功的部分照常计入断点
+                    try:
+                        written += writer.flush()
+                        pending = 0
+                        flushed = True
+
+                        self._commit_offset(written)
+
+                    except Exception:
+                        logger.exception("写入分片数据失败，本轮数据将重新下载: %s", self.file_path)
+
+                    self._report_round(url, downloaded, started_time)
+
+                if self._is_stopped():
+                    break
+
+                if self._is_round_complete(truncated, downloaded, expected_size, written):
+                    self._notify_chunk_finished()
+
+                    break
+                else:
+                    raise StopIteration(f"Chunk mismatch (Expected: {expected_size}, Got: {downloaded}), triggering retry.")
+
+            except Exception as exc:
+                if self.stop_event.is_set():
+                    break
+
+                if not flushed and pending:
+                    self._add_downloaded(-pending)
+
+                attempt, delay = self._handle_failure(exc, url, attempt)
+
+                if delay is None:
+                    break
+
+                await self._interruptible_sleep(delay)
@@ -0,0 +1,460 @@
+from PySide6.QtCore import QMetaObject, Q_ARG
+from PySide6.QtCore import Qt
+
+from ...network.cdn import CDN
+from ...common.io.file import File
+
+from ..task.info import TaskInfo
+
+from .planner import ChunkPlanner, ThroughputEstimator
+from .source import SourcePool, SourceMismatchError
+from .rate_limit import TokenBucket
+
+from threading import Event, Lock
+from pathlib import Path
+import logging
+import errno
+import os
+import httpx
+import time
+
+logger = logging.getLogger(__name__)
+
+class RangeWriter:
+    """
+    把一段 Range 响应按绝对偏移写进文件
+
+    原先每读 8KB 就生成一个 bytes 再拷进 Python 的文件缓冲区，还要为每轮请求 open、seek 一次。
+    这里把数据拷进预先分配的缓冲区，攒满一整块才 pwrite 一次，不需要打开文件对象
+    """
+    def __init__(self, fd: int, offset: int, buffer: memoryview):
+        self.fd = fd
+        self.offset = offset
+        self.buffer = buffer
+        self.filled = 0
+
+    def write(self, data: bytes) -> int:
+        # 返回本次交给操作系统的字节数，未写满缓冲区时为 0
+        view = memoryview(data)
+        persisted = 0
+
+        while view:
+            size = min(len(view), len(self.buffer) - self.filled)
+
+            self.buffer[self.filled:self.filled + size] = view[:size]
+            self.filled += size
+            view = view[size:]
+
+            if self.filled == len(self.buffer):
+                persisted += self.flush()
+
+        return persisted
+
+    def flush(self) -> int:
+        size = self.filled
+
+        if size:
+            File.pwrite(self.fd, self.buffer[:size], self.offset)
+
+            self.offset += size
+            self.filled = 0
+
+        return size
+
+class SharedFile:
+    """
+    同一文件的全部分片共用的文件描述符
+
+    原先每个分片的每轮请求都要 open、seek、close 一次，大文件动辄上千次。
+    现在由 Downloader 为正在下载的文件打开一次，分片按绝对偏移 pwrite，互不影响读写位置。
+    close() 只是登记关闭，要等最后一个仍在写入的分片释放之后才真正关闭，
+    暂停、取消时不会把描述符从还没退出的分片手里抽走
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.fd = File.open_for_write(path)
+        self.lock = Lock()
+        self.users = 0
+        self.closing = False
+        self.sync = False
+
+    def acquire(self) -> int:
+        with self.lock:
+            if self.closing:
+                raise OSError(errno.EBADF, "文件已关闭", str(self.path))
+
+            self.users += 1
+
+            return self.fd
+
+    def release(self):
+        with self.lock:
+            self.users -= 1
+
+            should_close = self.closing and self.users == 0
+
+        if should_close:
+            self._close()
+
+    def close(self, sync: bool = False):
+        """
+        :param sync: 关闭前是否 fsync，文件下载完成时传入 True
+        """
+        with self.lock:
+            if self.closing:
+                return
+
+            self.closing = True
+            self.sync = sync
+
+            should_close = self.users == 0
+
+        if should_close:
+            self._close()
+
+    def _close(self):
+        try:
+            if self.sync:
+                os.fsync(self.fd)
+
+        except OSError:
+            logger.exception("同步文件到磁盘失败: %s", self.path)
+
+        finally:
+            try:
+                os.close(self.fd)
+
+            except OSError:
+                logger.exception("关闭文件失败: %s", self.path)
+
+class ChunkTask:
+    """
+    单个分片的下载状态与断点记录
+
+    线程池引擎（ChunkWorker）与异步引擎（AsyncChunkWorker）共用这一部分：
+    断点的读写、Range 的拆分与领取、错误分类和完成通知都在这里，
+    两者只在发请求、读响应、等待的方式上不同
+    """
+    max_retries = 5
+    # 写缓冲区大小。收到的数据先攒进这块可复用的缓冲区，满了再一次 pwrite 并记录断点。
+    # 进程崩溃时缓冲区里的数据会丢，pwrite 之后数据已交给操作系统，
+    # 即便进程被强杀也仍在磁盘上，断点因此是可信的
+    buffer_size = 256 * 1024
+    retryable_status_codes = {408, 429, 500, 502, 503, 504}
+    permanent_status_codes = {400, 401, 403, 404, 405, 410, 416}
+    permanent_errnos = {
+        errno.EACCES,
+        errno.EPERM,
+        errno.ENOENT,
+        errno.ENOSPC,
+        errno.EROFS,
+        errno.EISDIR,
+        errno.ENOTDIR,
+    }
+    retryable_errnos = {
+        errno.EAGAIN,
+        errno.EWOULDBLOCK,
+        errno.EINTR,
+        errno.ETIMEDOUT,
+        errno.ECONNRESET,
+        errno.ECONNABORTED,
+        errno.ECONNREFUSED,
+        errno.ENETDOWN,
+        errno.ENETUNREACH,
+        errno.EHOSTUNREACH,
+        errno.EPIPE,
+    }
+
+    def __init__(self, file_key: str, chunk_index: int, chunk_range: tuple[int, int], file_path: Path, sources: SourcePool, referer: str, task_info: TaskInfo, stop_event: Event, lock: Lock, token_bucket: TokenBucket, generation: int, parent=None, on_chunk_start=None, on_chunk_end=None, shared_file: SharedFile = None):
+        self.file_key = file_key
+        self.chunk_index = chunk_index
+        self.offset_key = str(chunk_index)      # 断点表随任务快照走 JSON，键统一用字符串
+        self.chunk_range = chunk_range
+        self.chunk_size = chunk_range[1] - chunk_range[0]
+        # 结束偏移可能被 split() 提前，读写一律持有 range_lock。
+        # position 为本分片已领取（已写入或即将写入）的绝对偏移，开始下载前为 None
+        self.chunk_end = chunk_range[1]
+        self.position = None
+        self.range_lock = Lock()
+        self.file_path = file_path
+        self.sources = sources
+        self.referer = referer
+        self.task_info = task_info
+        self.stop_event = stop_event
+        self.lock = lock
+        self.token_bucket = token_bucket
+        self.generation = generation
+        self.parent = parent
+        self.on_chunk_start = on_chunk_start
+        self.on_chunk_end = on_chunk_end
+        # 本分片计入进度的字节数（重试回退时会减少），只由本分片自己的线程写入，不加锁。
+        # Downloader 在测速定时器与分片结束时把它与 reported 的差值汇总进 downloaded_size，
+        # reported 只在 Downloader 的 count_lock 下读写
+        self.progress = 0
+        self.reported = 0
+        # 写缓冲区与文件描述符在本分片的全部重试之间复用，首次写入时才分配
+        self.buffer: memoryview = None
+        self.fd: int = None
+        # Downloader 为该文件打开的共享描述符，未提供时由本分片自行打开
+        self.shared_file = shared_file
+
+    def _is_stopped(self):
+        return self.stop_event.is_set() or not self.parent.is_generation_active(self.generation)
+
+    def _invoke_download_error(self, message: str):
+        if self.parent:
+            logger.error(message)
+
+            QMetaObject.invokeMethod(
+                self.parent,
+                "on_download_error",
+                Qt.ConnectionType.QueuedConnection,
+                Q_ARG(str, message)
+            )
+
+    def _is_retryable_exception(self, exc: Exception):
+        if isinstance(exc, StopIteration):
+            return True
+
+        if isinstance(exc, httpx.HTTPStatusError):
+            status_code = getattr(getattr(exc, "response", None), "status_code", None)
+            if status_code in self.permanent_status_codes:
+                return False
+            if status_code in self.retryable_status_codes:
+                return True
+            return bool(status_code and status_code >= 500)
+
+        if isinstance(exc, httpx.RequestError):
+            return True
+
+        if isinstance(exc, OSError):
+            return exc.errno in self.retryable_errnos
+
+        return False
+
+    def _is_source_failure(self, exc: Exception):
+        # 这类错误归咎于节点本身，多节点模式下换一个节点续传即可
+        # 等不到共享连接池的空闲连接与节点无关，不能据此停用节点
+        if isinstance(exc, httpx.PoolTimeout):
+            return False
+
+        return isinstance(exc, (httpx.HTTPStatusError, httpx.TransportError, SourceMismatchError))
+
+    def _build_error_message(self, exc: Exception):
+        if isinstance(exc, httpx.HTTPStatusError):
+            response = getattr(exc, "response", None)
+            status_code = getattr(response, "status_code", None)
+            return f"请求返回异常状态码 {status_code}: {exc}"
+
+        if isinstance(exc, httpx.RequestError):
+            return str(exc)
+
+        if isinstance(exc, OSError):
+            return f"文件读写失败: {exc}"
+
+        if isinstance(exc, (StopIteration, SourceMismatchError)):
+            return str(exc)
+
+        return f"未知异常: {exc}"
+
+    def _report_download_failure(self, exc: Exception, attempt: int, retryable: bool):
+        reason = self._build_error_message(exc)
+
+        if retryable:
+            message = f"分片 {self.chunk_index + 1} 下载失败，已尝试 {attempt} 次仍未成功：{reason}"
+        else:
+            message = f"分片 {self.chunk_index + 1} 遇到不可重试错误：{reason}"
+
+        self.stop_event.set()
+        self._invoke_download_error(message)
+
+    def _notify_chunk_finished(self):
+        QMetaObject.invokeMethod(
+            self.parent, "on_chunk_finished",
+            Qt.ConnectionType.QueuedConnection,
+            Q_ARG(str, self.file_key),
+            Q_ARG(int, self.chunk_index)
+        )
+
+    def split(self):
+        """
+        把尚未下载的剩余部分对半拆开，本分片只保留前半段
+
+        成功时返回后半段的 (start, end)，剩余部分太小或尚未开始下载时返回 None。
+        本轮请求的 Range 仍按原先的结束偏移发出，写到新的结束偏移后即主动断开。
+        """
+        with self.range_lock:
+            if self.position is None:
+                return None
+
+            middle = ChunkPlanner.split_point(self.position, self.chunk_end)
+
+            if middle is None:
+                return None
+
+            end = self.chunk_end
+
+            self.chunk_end = middle
+            self.chunk_size = middle - self.chunk_range[0]
+
+            return middle, end
+
+    def remaining_size(self) -> int:
+        # 尚未领取的字节数，尚未开始下载时为 0。与 split() 持有同一把锁，读到的 position 与 chunk_end 是一致的
+        with self.range_lock:
+            if self.position is None:
+                return 0
+
+            return self.chunk_end - self.position
+
+    def _reset_position(self, written: int):
+        with self.range_lock:
+            self.position = self.chunk_range[0] + written
+
+            return self.chunk_end
+
+    def _claim(self, size: int) -> int:
+        # 领取接下来要写入的字节数，超出（可能已被拆分缩短的）结束偏移的部分不写
+        with self.range_lock:
+            size = max(min(size, self.chunk_end - self.position), 0)
+            self.position += size
+
+            return size
+
+    def _accept(self, chunk: bytes):
+        # 返回本次实际要写入的数据，以及是否已写到（拆分后的）结束偏移
+        chunk_len = self._claim(len(chunk))
+
+        if chunk_len < len(chunk):
+            return chunk[:chunk_len], True
+
+        return chunk, False
+
+    def _get_buffer(self) -> memoryview:
+        if self.buffer is None:
+            self.buffer = memoryview(bytearray(self.buffer_size))
+
+        return self.buffer
+
+    def _open_file(self) -> int:
+        if self.fd is None:
+            if self.shared_file is not None:
+                self.fd = self.shared_file.acquire()
+            else:
+                self.fd = File.open_for_write(self.file_path)
+
+        return self.fd
+
+    def _close_file(self):
+        fd = self.fd
+        self.fd = None
+
+        if fd is None:
+            return
+
+        if self.shared_file is not None:
+            self.shared_file.release()
+
+            return
+
+        try:
+            os.close(fd)
+
+        except OSError:
+            logger.exception("关闭分片文件失败: %s", self.file_path)
+
+    def _add_downloaded(self, size: int):
+        # 每次读取都会走到这里，原先在此争抢 update_lock，线程越多越明显
+        self.progress += size
+
+    def _get_offsets(self):
+        # 分片断点表由 calc_chunk_list 预先建好，此处只会改写已有键的值
+        file_info = self.task_info.Download.files.get(self.file_key)
+
+        if isinstance(file_info, dict):
+            offsets = file_info.get("chunk_offsets")
+
+            if isinstance(offsets, dict):
+                return offsets
+
+        return None
+
+    def _commit_offset(self, written: int):
+        # 记录本分片已写入文件的字节数。只在 pwrite 成功之后调用，
+        # 保证记录的断点绝不会超过磁盘上真实存在的数据。
+        offsets = self._get_offsets()
+
+        if offsets is None:
+            return
+
+        with self.lock:
+            offsets[self.offset_key] = written
+
+    def _load_offset(self):
+        offsets = self._get_offsets()
+
+        if offsets is None:
+            return 0
+
+        with self.lock:
+            try:
+                return max(min(int(offsets.get(self.offset_key, 0)), self.chunk_range[1] - self.chunk_range[0]), 0)
+
+            except (TypeError, ValueError):
+                return 0
+
+    def _check_response(self, response: httpx.Response, written: int):
+        """
+        校验本轮响应，返回服务端承诺下发的字节数
+
+        服务端忽略 Range 时已写入的部分作废，抛出 StopIteration 让分片从头重来
+        """
+        response.raise_for_status()
+
+        self.sources.check_content_range(response.headers)
+
+        if written and response.status_code != 206:
+            # 服务端忽略了 Range，续传位置无从谈起，只能整片从头重来
+            self._add_downloaded(-written)
+            self._commit_offset(0)
+
+            raise StopIteration("服务端未按 Range 返回 206，分片将从头重新下载")
+
+        # 获取服务端实际承诺下发的体量。若是最后一个切片且 CDN 数据缩水，它将以实际值为准
+        return int(response.headers.get("Content-Length", self.chunk_size - written))
+
+    def _report_round(self, url: str, downloaded: int, started_time: float):
+        # 本轮实测吞吐量交给分片规划器，后续文件据此调整分片大小；
+        # 同时计入该节点的权重，多节点模式下快的节点分到更多分片
+        elapsed = time.monotonic() - started_time
+
+        ThroughputEstimator.report(downloaded, elapsed)
+        self.sources.report_success(url, downloaded, elapsed)
+
+    def _is_round_complete(self, truncated: bool, downloaded: int, expected_size: int, written: int):
+        # 检查区块是否真下载到了服务端承诺的大小（原为严格检测 self.chunk_size），
+        # 被拆分的分片则以写到新的结束偏移为准
+        return truncated or downloaded >= expected_size or written >= self.chunk_size
+
+    def _handle_failure(self, exc: Exception, url: str, attempt: int):
+        """
+        处理一轮下载中的异常，返回 (新的尝试次数, 重试前的等待秒数)
+
+        等待秒数为 None 表示放弃，错误已上报
+        """
+        if self._is_source_failure(exc) and self.sources.report_failure(url):
+            # 节点已停用，剩余部分立即改从其他节点续传，不计入重试次数。
+            # 每次都会停用一个节点，因此最多换完全部节点就会回到常规重试
+            logger.warning("分片 %s 从节点 %s 下载失败，改用其他节点：%s", self.chunk_index + 1, CDN.get_netloc(url), self._build_error_message(exc))
+
+            return attempt, 0
+
+        attempt += 1
+        retryable = self._is_retryable_exception(exc)
+
+        if not retryable or attempt >= self.max_retries:
+            self._report_download_failure(exc, attempt, retryable)
+
+            return attempt, None
+
+        return attempt, min(2 ** (attempt - 1), 8)
@@ -1,7 +1,7 @@
 from PySide6.QtCore import QRunnable, QThreadPool, QObject, QTimer, Slot, QMetaObject, Q_ARG
 from PySide6.QtCore import Qt
 
-from ...common.enum import DownloadStatus, DownloadType, MediaType, ToastNotificationCategory
+from ...common.enum import DownloadStatus, DownloadType, DownloadEngine, MediaType, ToastNotificationCategory
 from ...common.data import reversed_video_quality_map
 from ...common.io.directory import Directory
 from ...common.translator import Translator
@@ -13,189 +13,42 @@ from ...common.io.file import File
 from ...parse.additional.worker import AdditionalParseWorker
 from ...parse.additional.chapter import ChapterParser
 from ...thread.pool import GlobalThreadPoolTask
-from ...network.request import get_cookies, get_proxy_mounts, get_ssl_context
+from ...network.request import get_cookies
+from ...network.connection_pool import create_download_client, get_pool_stats
 from ...thread.async_ import AsyncTask
 
 from ..task.manager import task_manager
 from ..task.info import TaskInfo
 
 from .parse_worker import ParseWorker
+from .prefetch import PlayurlPrefetcher
+from .planner import ChunkPlanner
+from .source import SourcePool
+from .chunk import ChunkTask, RangeWriter, SharedFile
+from .rate_limit import TokenBucket, RateLimiter
+from .async_engine import AsyncChunkPool, AsyncChunkWorker
 from .merger import Merger
+from .stream_merger import StreamMerger
 
 from threading import Event, Lock, Thread
 from pathlib import Path
 import logging
-import errno
 import httpx
 import time
 
 logger = logging.getLogger(__name__)
 
-class TokenBucket:
-    """线程安全的令牌桶，用于平滑限制下载速度"""
-    def __init__(self, rate: float):
-        """
-        :param rate: 令牌产生速率（字节/秒），若为0则不限速
-        """
-        self.rate = rate
-        self.tokens = rate
-        self.last_update = time.monotonic()
-        self.lock = Lock()
-
-    def consume(self, amount: int, stop_event: Event = None):
-        if self.rate <= 0:
-            return
+class ChunkWorker(QRunnable, ChunkTask):
+    def __init__(self, session: httpx.Client, file_key: str, chunk_index: int, chunk_range: tuple[int, int], file_path: Path, sources: SourcePool, referer: str, task_info: TaskInfo, stop_event: Event, lock: Lock, token_bucket: TokenBucket, generation: int, parent=None, on_chunk_start=None, on_chunk_end=None, shared_file: SharedFile = None):
+        QRunnable.__init__(self)
+        ChunkTask.__init__(self, file_key, chunk_index, chunk_range, file_path, sources, referer, task_info, stop_event, lock, token_bucket, generation, parent, on_chunk_start, on_chunk_end, shared_file)
 
-        sleep_time = 0
-        with self.lock:
-            now = time.monotonic()
-            elapsed = now - self.last_update
-            self.last_update = now
-
-            self.tokens += elapsed * self.rate
-            if self.tokens > self.rate:
-                self.tokens = self.rate
-            
-            self.tokens -= amount
-            if self.tokens < 0:
-                sleep_time = -self.tokens / self.rate
-
-        if sleep_time > 0:
-            # 分段休眠，防止阻塞暂停信号
-            while sleep_time > 0:
-                if stop_event and stop_event.is_set():
-                    break
-                s = min(0.1, sleep_time)
-                time.sleep(s)
-                sleep_time -= s
-
-    def set_rate(self, rate: float):
-        with self.lock:
-            self.rate = rate
-            self.tokens = rate
-            self.last_update = time.monotonic()
-
-class ChunkWorker(QRunnable):
-    max_retries = 5
-    # 每写满这么多字节就 flush 一次并记录断点。进程崩溃时 Python 缓冲区里的数据会丢，
-    # flush 之后数据已交给操作系统，即便进程被强杀也仍在磁盘上，断点因此是可信的。
-    flush_interval = 1024 * 1024
-    retryable_status_codes = {408, 429, 500, 502, 503, 504}
-    permanent_status_codes = {400, 401, 403, 404, 405, 410, 416}
-    permanent_errnos = {
-        errno.EACCES,
-        errno.EPERM,
-        errno.ENOENT,
-        errno.ENOSPC,
-        errno.EROFS,
-        errno.EISDIR,
-        errno.ENOTDIR,
-    }
-    retryable_errnos = {
-        errno.EAGAIN,
-        errno.EWOULDBLOCK,
-        errno.EINTR,
-        errno.ETIMEDOUT,
-        errno.ECONNRESET,
-        errno.ECONNABORTED,
-        errno.ECONNREFUSED,
-        errno.ENETDOWN,
-        errno.ENETUNREACH,
-        errno.EHOSTUNREACH,
-        errno.EPIPE,
-    }
-
-    def __init__(self, session: httpx.Client, file_key: str, chunk_index: int, chunk_range: tuple[int, int], file_path: Path, url: str, referer: str, task_info: TaskInfo, stop_event: Event, lock: Lock, token_bucket: TokenBucket, generation: int, parent=None, on_chunk_start=None, on_chunk_end=None):
-        super().__init__()
         self.session = session
-        self.file_key = file_key
-        self.chunk_index = chunk_index
-        self.offset_key = str(chunk_index)      # 断点表随任务快照走 JSON，键统一用字符串
-        self.chunk_range = chunk_range
-        self.chunk_size = chunk_range[1] - chunk_range[0]
-        self.file_path = file_path
-        self.url = url
-        self.referer = referer
-        self.task_info = task_info
-        self.stop_event = stop_event
-        self.lock = lock
-        self.token_bucket = token_bucket
-        self.generation = generation
-        self.parent = parent
-        self.on_chunk_start = on_chunk_start
-        self.on_chunk_end = on_chunk_end
-
-    def _invoke_download_error(self, message: str):
-        if self.parent:
-            logger.error(message)
-
-            QMetaObject.invokeMethod(
-                self.parent,
-                "on_download_error",
-                Qt.ConnectionType.QueuedConnection,
-                Q_ARG(str, message)
-            )
-
-    def _is_retryable_exception(self, exc: Exception):
-        if isinstance(exc, StopIteration):
-            return True
-
-        if isinstance(exc, httpx.HTTPStatusError):
-            status_code = getattr(getattr(exc, "response", None), "status_code", None)
-            if status_code in self.permanent_status_codes:
-                return False
-            if status_code in self.retryable_status_codes:
-                return True
-            return bool(status_code and status_code >= 500)
-
-        if isinstance(exc, httpx.RequestError):
-            return True
-
-        if isinstance(exc, OSError):
-            return exc.errno in self.retryable_errnos
-
-        return False
-
-    def _build_error_message(self, exc: Exception):
-        if isinstance(exc, httpx.HTTPStatusError):
-            response = getattr(exc, "response", None)
-            status_code = getattr(response, "status_code", None)
-            return f"请求返回异常状态码 {status_code}: {exc}"
-
-        if isinstance(exc, httpx.RequestError):
-            return str(exc)
-
-        if isinstance(exc, OSError):
-            return f"文件读写失败: {exc}"
-
-        if isinstance(exc, StopIteration):
-            return str(exc)
-
-        return f"未知异常: {exc}"
-
-    def _report_download_failure(self, exc: Exception, attempt: int, retryable: bool):
-        reason = self._build_error_message(exc)
-
-        if retryable:
-            message = f"分片 {self.chunk_index + 1} 下载失败，已尝试 {attempt} 次仍未成功：{reason}"
-        else:
-            message = f"分片 {self.chunk_index + 1} 遇到不可重试错误：{reason}"
-
-        self.stop_event.set()
-        self._invoke_download_error(message)
-
-    def _notify_chunk_finished(self):
-        QMetaObject.invokeMethod(
-            self.parent, "on_chunk_finished",
-            Qt.ConnectionType.QueuedConnection,
-            Q_ARG(str, self.file_key),
-            Q_ARG(int, self.chunk_index)
-        )
 
     def _interruptible_sleep(self, seconds: float):
         # 分段休眠，保证暂停、取消能够及时生效，而不必等满整个退避时间
         while seconds > 0:
-            if self.stop_event.is_set() or not self.parent.is_generation_active(self.generation):
+            if self._is_stopped():
                 return
 
             interval = min(0.1, seconds)
@@ -205,70 +58,40 @@ class ChunkWorker(QRunnable):
             seconds -= interval
 
     def run(self):
-        if self.stop_event.is_set() or not self.parent.is_generation_active(self.generation):
+        if self._is_stopped():
             return
 
         if self.on_chunk_start:
-            self.on_chunk_start()
+            self.on_chunk_start(self)
 
         try:
             self._download_chunk()
         finally:
             if self.on_chunk_end:
-                self.on_chunk_end()
-
-    def _get_offsets(self):
-        # 分片断点表由 calc_chunk_list 预先建好，此处只会改写已有键的值
-        file_info = self.task_info.Download.files.get(self.file_key)
-
-        if isinstance(file_info, dict):
-            offsets = file_info.get("chunk_offsets")
-
-            if isinstance(offsets, dict):
-                return offsets
-
-        return None
-
-    def _commit_offset(self, written: int):
-        # 记录本分片已 flush 落盘的字节数。只在 flush/close 成功之后调用，
-        # 保证记录的断点绝不会超过磁盘上真实存在的数据。
-        offsets = self._get_offsets()
+                self.on_chunk_end(self)
 
-        if offsets is None:
-            return
-
-        with self.lock:
-            offsets[self.offset_key] = written
-
-    def _load_offset(self):
-        offsets = self._get_offsets()
-
-        if offsets is None:
-            return 0
-
-        with self.lock:
-            try:
-                return max(min(int(offsets.get(self.offset_key, 0)), self.chunk_size), 0)
+    def _download_chunk(self):
+        try:
+            self._download_chunk_range()
 
-            except (TypeError, ValueError):
-                return 0
+        finally:
+            self._close_file()
 
-    def _download_chunk(self):
-        chunk_start, chunk_end = self.chunk_range
+    def _download_chunk_range(self):
+        chunk_start = self.chunk_range[0]
 
-        # 本分片已确认落盘的字节数。重试时从这里断点续传，而不是整片重下：
+        # 本分片已确认写入文件的字节数。重试时从这里断点续传，而不是整片重下：
         # 原先一次网络抖动就会让最多 4MB 已下载的数据作废，界面上直接表现为进度回退。
         # 该值同时会写进任务快照，进程崩溃后重启也能从这里继续，而不是退回到上一个整片边界。
         written = self._load_offset()
         attempt = 0
 
-        while (
-            not self.stop_event.is_set()
-            and self.parent.is_generation_active(self.generation)
-            and attempt < self.max_retries
-        ):
-            if written >= self.chunk_size:
-                # 整片已写满。服务端返回的 Content-Length 大于分片实际剩余时会走到这里，
+        while not self._is_stopped() and attempt < self.max_retries:
+            chunk_end = self._reset_position(written)
+
+            if chunk_start + written >= chunk_end:
+                # 整片已写满。服务端返回的 Content-Length 大于分片实际剩余、
+                # 或剩余部分已被拆给其他线程时会走到这里，
                 # 此时再发请求只会得到一个非法 Range（416），直接按完成处理。
                 self._notify_chunk_finished()
 
@@ -279,86 +102,80 @@ class ChunkWorker(QRunnable):
             }
 
             downloaded = 0      # 本轮从服务端收到的字节数
-            pending = 0         # 已 write 但尚未 flush、因而还不能计入断点的字节数
+            pending = 0         # 还在写缓冲区里、尚未 pwrite，因而还不能计入断点的字节数
             expected_size = 0
             flushed = False
+            truncated = False   # 本分片的后半段已被拆走，写到新的结束偏移后主动断开
+            started_time = time.monotonic()
+            url = self.sources.pick()
 
             try:
-                f = open(self.file_path, "r+b")
+                writer = RangeWriter(self._open_file(), chunk_start + written, self._get_buffer())
 
                 try:
-                    f.seek(chunk_start + written)
-
-                    with self.session.stream("GET", self.url, headers = headers, follow_redirects = True, timeout = 10) as response:
-                        response.raise_for_status()
-
-                        if written and response.status_code != 206:
-                            # 服务端忽略了 Range，续传位置无从谈起，只能整片从头重来
-                            with self.lock:
-                                self.task_info.Download.downloaded_size = max(self.task_info.Download.downloaded_size - written, 0)
+                    # 超时沿用会话的设置：读写 10 秒，等待共享连接池的空闲连接则放宽
+                    with self.session.stream("GET", url, headers = headers, follow_redirects = True) as response:
+                        try:
+                            expected_size = self._check_response(response, written)
 
+                        except StopIteration:
                             written = 0
-                            self._commit_offset(0)
 
-                            raise StopIteration("服务端未按 Range 返回 206，分片将从头重新下载")
+                            raise
 
-                        # 获取服务端实际承诺下发的体量。若是最后一个切片且 CDN 数据缩水，它将以实际值为准
-                        expected_size = int(response.headers.get("Content-Length", self.chunk_size - written))
-
-                        for chunk in response.iter_bytes(chunk_size = 8192):
-                            if (
-                                self.stop_event.is_set()
-                                or not self.parent.is_generation_active(self.generation)
-                            ):
+                        # 不指定 chunk_size，按网络层实际收到的大小产出，省去 httpx 再切一次 8KB
+                        for chunk in response.iter_bytes():
+                            if self._is_stopped():
                                 break
 
+                            if chunk:
+                                chunk, truncated = self._accept(chunk)
+
                             if chunk:
                                 chunk_len = len(chunk)
+
                                 if self.token_bucket:
                                     self.token_bucket.consume(chunk_len, self.stop_event)
 
-                                f.write(chunk)
                                 downloaded += chunk_len
                                 pending += chunk_len
 
-                                with self.lock:
-                                    self.task_info.Download.downloaded_size += chunk_len
+                                self._add_downloaded(chunk_len)
 
-                                if pending >= self.flush_interval:
-                                    # 定期把缓冲区交给操作系统并推进断点，
-                                    # 这样崩溃后恢复最多只损失 flush_interval 字节，而不是整个分片
-                                    f.flush()
+                                # 写缓冲区满了就 pwrite 一次并推进断点，
+                                # 这样崩溃后恢复最多只损失一个缓冲区的数据，而不是整个分片
+                                persisted = writer.write(chunk)
 
-                                    written += pending
-                                    pending = 0
+                                if persisted:
+                                    written += persisted
+                                    pending -= persisted
 
                                     self._commit_offset(written)
 
+                            if truncated:
+                                break
+
                 finally:
-                    # 无论正常结束还是中途抛错，都要先关闭文件（隐含 flush）。
-                    # 这一步必须在外层 except 之前完成：关闭成功即代表本轮写入的字节
-                    # 确实落盘，可以计入断点，重试时从这里续传而不是整片重下。
+                    # 无论正常结束还是中途抛错，都要先把缓冲区里剩下的数据写出去。
+                    # 这一步必须在外层 except 之前完成：写入成功即代表本轮收到的字节
+                    # 确实交给了操作系统，可以计入断点，重试时从这里续传而不是整片重下。
                     try:
-                        f.close()
-
-                        written += pending
+                        written += writer.flush()
                         pending = 0
                         flushed = True
 
                         self._commit_offset(written)
 
                     except Exception:
-                        logger.exception("关闭分片文件失败，本轮数据将重新下载: %s", self.file_path)
+                        logger.exception("写入分片数据失败，本轮数据将重新下载: %s", self.file_path)
+
+                    self._report_round(url, downloaded, started_time)
 
                 # 如果中途被停止，跳出循环退出
-                if (
-                    self.stop_event.is_set()
-                    or not self.parent.is_generation_active(self.generation)
-                ):
+                if self._is_stopped():
                     break
 
-                # 检查区块是否真下载到了服务端承诺的大小（原为严格检测 self.chunk_size）
-                if downloaded >= expected_size:
+                if self._is_round_complete(truncated, downloaded, expected_size, written):
                     self._notify_chunk_finished()
 
                     break
@@ -371,19 +188,16 @@ class ChunkWorker(QRunnable):
                     break
 
                 if not flushed and pending:
-                    # 文件没能正常关闭，只有最后一次 flush 之后的那部分数据无法确认落盘，
-                    # 回退这部分计数并从上一个确认过的断点重来；已 flush 的部分依旧有效
-                    with self.lock:
-                        self.task_info.Download.downloaded_size = max(self.task_info.Download.downloaded_size - pending, 0)
+                    # 缓冲区没能写出，只有最后一次 pwrite 之后的那部分数据没有落到文件里，
+                    # 回退这部分计数并从上一个确认过的断点重来；已写入的部分依旧有效
+                    self._add_downloaded(-pending)
 
-                attempt += 1
-                retryable = self._is_retryable_exception(exc)
+                attempt, delay = self._handle_failure(exc, url, attempt)
 
-                if not retryable or attempt >= self.max_retries:
-                    self._report_download_failure(exc, attempt, retryable)
+                if delay is None:
                     break
 
-                self._interruptible_sleep(min(2 ** (attempt - 1), 8))
+                self._interruptible_sleep(delay)
 
 # 正在销毁流程中的下载器。
 #
@@ -399,20 +213,21 @@ class Downloader(QObject):
         super().__init__()
         self.task_info = task_info
         self.init_session()
-        self.thread_pool = QThreadPool()
+        # 下载引擎在任务开始时确定，运行中途切换设置不影响已创建的任务
+        self.engine = config.get(config.download_engine)
+        self.thread_pool = AsyncChunkPool() if self.engine == DownloadEngine.ASYNCIO else QThreadPool()
         self.thread_pool.setMaxThreadCount(config.get(config.download_thread))
 
-        # 实例化令牌桶（0 为不限速，单位：字节/秒）。此处从已有配置文件中取值或直接扩展
-        if config.get(config.speed_limit_enabled):
-            rate = config.get(config.speed_limit_rate) * 1024 * 1024
-        else:
-            rate = 0
-        
-        self.token_bucket = TokenBucket(rate = rate)
+        # 限速由全部任务共享（见 RateLimiter），本任务的令牌桶只是从全局额度中分出的一份
+        self.token_bucket = RateLimiter.create_bucket(self.task_info.Basic.task_id)
 
-        self.chunk_size = 4 * 1024 * 1024
         self.download_list = {}
+        # 各文件的下载来源（单节点或多节点），在开始下载该文件时建立
+        self.source_pools: dict[str, SourcePool] = {}
         self.merger = None
+        self.stream_merger: StreamMerger = None
+        # 下载已经结束，正等着 StreamMerger 收尾
+        self._stream_merge_pending = False
 
         # 线程池交由 GUI 线程释放，见 _release_thread_pool
         self._releasing_pool = None
@@ -422,6 +237,8 @@ class Downloader(QObject):
         self.count_lock = Lock()
 
         self.active_workers = 0
+        # 正在运行的分片，供空闲线程从中拆分剩余部分。读写持有 count_lock
+        self.running_workers: set[ChunkTask] = set()
         self.last_sampled_size = 0
         self.wait_flag = False
         self.wait_callback = None
@@ -476,9 +293,21 @@ class Downloader(QObject):
                 if not self._acquire_ref():
                     return
 
+                # 排队期间可能已经在后台解析好了，直接取用，拿到结果即可开始下载分片
+                prefetched = PlayurlPrefetcher.take(self.task_info)
+
+                if prefetched:
+                    prefetched.apply(self.task_info)
+
                 # 解析失败会自动重试，等待期间用户可能暂停或取消任务，
                 # 因此把停止标记一并交给 worker，让它能及时放弃
-                parse_worker = ParseWorker(self.task_info, self, on_finished = self._release_ref, stop_event = self._stop_event)
+                parse_worker = ParseWorker(
+                    self.task_info,
+                    self,
+                    on_finished = self._release_ref,
+                    stop_event = self._stop_event,
+                    prefetched_info = prefetched.download_info if prefetched else None
+                )
 
                 try:
                     GlobalThreadPoolTask.run(parse_worker)
@@ -514,6 +343,7 @@ class Downloader(QObject):
     @Slot(str)
     def on_parse_error(self, error_message: str):
         self._close_session()
+        self._release_stream_merger()
         self.task_info.Download.status = DownloadStatus.FAILED
 
         self.update_item(self.task_info)
@@ -543,6 +373,7 @@ class Downloader(QObject):
 
         self._close_session()
         self.speed_timer.stop()
+        self._release_stream_merger()
 
         self.update_item(self.task_info)
 
@@ -574,9 +405,114 @@ class Downloader(QObject):
 
             self._dispatch_start_worker()
 
+            self._start_stream_merge()
+
         except Exception as e:
             self.on_download_error(str(e))
 
+    def _start_stream_merge(self):
+        # 只剩最后一个文件要下载时才启动：另一路已经完整落盘，FFmpeg 可以直接读取，
+        # 仍在下载的这一路经由 stdin 边下边送
+        queue = self.task_info.Download.queue
+
+        if self.stream_merger is not None or len(queue) != 1 or set(self.download_list) != {"video", "audio"}:
+            return
+
+        if not StreamMerger.is_supported(self.task_info):
+            return
+
+        file_key = queue[0]
+        file_size = (self.task_info.Download.files.get(file_key) or {}).get("file_size", 0)
+
+        if file_size <= 0:
+            return
+
+        self.stream_merger = StreamMerger(self.task_info, parent = self)
+        self.stream_merger.finished_signal.connect(self._on_stream_merge_finished)
+        self.stream_merger.start(
+            cwd = Path(self.task_info.File.download_path, self.task_info.File.folder),
+            video_file_name = self.download_list["video"].get("file_name", ""),
+            audio_file_name = self.download_list["audio"].get("file_name", ""),
+            stream_audio = file_key == "audio",
+            file_size = file_size,
+            get_available = lambda: self.get_contiguous_size(file_key)
+        )
+
+    def _release_stream_merger(self):
+        # 与 _release_merger 相同，先停掉 FFmpeg 线程再释放对象
+        stream_merger = self.stream_merger
+        self.stream_merger = None
+        self._stream_merge_pending = False
+
+        if stream_merger is None:
+            return
+
+        try:
+            stream_merger.stop()
+            stream_merger.deleteLater()
+
+        except RuntimeError:
+            pass
+
+    @Slot(bool)
+    def _on_stream_merge_finished(self, succeeded: bool):
+        # 下载仍在进行时只记下结果，等下载结束后由 wait_merge 处理
+        if not self._stream_merge_pending:
+            return
+
+        self._stream_merge_pending = False
+
+        if succeeded:
+            self.start_merge(premuxed = True)
+
+        else:
+            self._queue_merge()
+
+    def get_contiguous_size(self, file_key: str):
+        """
+        返回从文件开头起连续、且已确认写入的字节数
+
+        分片乱序完成，拆分过的分片又不按下标排列，因此按各分片的实际起点排序后依次累加，
+        遇到第一个缺口即停止
+        """
+        ranges = []
+
+        with self.update_lock:
+            file_info = self.task_info.Download.files.get(file_key) or {}
+            total_chunks = file_info.get("total_chunks", 0)
+            file_size = file_info.get("file_size", 0)
+            remaining = set(file_info.get("chunks_list") or [])
+            offsets = file_info.get("chunk_offsets") or {}
+
+            for i in range(total_chunks):
+                start, end = self.calc_chunk_range(file_info, i, file_size)
+
+                if i in remaining:
+                    try:
+                        done = max(min(int(offsets.get(str(i), 0)), end - start), 0)
+
+                    except (TypeError, ValueError):
+                        done = 0
+
+                else:
+                    done = end - start
+
+                ranges.append((start, end, done))
+
+        ranges.sort()
+        position = 0
+
+        for start, end, done in ranges:
+            if start > position:
+                break
+
+            position = max(position, start + done)
+
+            if done < end - start:
+                break
+
+        return position
+
     @Slot()
     def _dispatch_start_worker(self):
         try:
@@ -683,7 +619,15 @@ class Downloader(QObject):
         self._check_disk_space(path, required_space)
 
         info["file_path"] = path
-        chunk_list = self.calc_chunk_list(file_key, file_size, self.chunk_size)
+
+        # 该文件的全部分片共用一个描述符，文件下载完成时在 on_file_completed 中 fsync 并关闭
+        shared_file = info.get("shared_file")
+
+        if shared_file is None or shared_file.closing:
+            info["shared_file"] = SharedFile(path)
+        self.source_pools[file_key] = SourcePool(info.get("url_list") or [info.get("url", "")], file_size)
+        chunk_list = self.calc_chunk_list(file_key, file_size)
+        file_info = self.task_info.Download.files[file_key]
         self.calc_downloaded_size()
 
         if not chunk_list:
@@ -706,28 +650,118 @@ class Downloader(QObject):
             ):
                 break
 
-            chunk_range = self.calc_chunk_range(chunk_index, self.chunk_size, file_size)
-            worker = ChunkWorker(
-                session = self.session,
-                file_key = file_key,
-                chunk_index = chunk_index,
-                chunk_range = chunk_range,
-                file_path = path,
-                url = info.get("url", ""),
-                referer = self.task_info.Episode.url,
-                task_info = self.task_info,
-                stop_event = self._stop_event,
-                lock = self.update_lock,
-                token_bucket = self.token_bucket,
-                generation = generation,
-                parent = self,
-                on_chunk_start = self.on_chunk_start,
-                on_chunk_end = self.on_chunk_end
-            )
-            self.thread_pool.start(worker)
+            with self.update_lock:
+                chunk_range = self.calc_chunk_range(file_info, chunk_index, file_size)
+
+            self.thread_pool.start(self._create_chunk_worker(file_key, chunk_index, chunk_range, generation))
+
+        task_manager.update_async(self.task_info)
+
+    def _create_chunk_worker(self, file_key: str, chunk_index: int, chunk_range: tuple[int, int], generation: int):
+        info = self.download_list.get(file_key, {})
+
+        if self.engine == DownloadEngine.ASYNCIO:
+            worker_class = AsyncChunkWorker
+            kwargs = {}
+        else:
+            worker_class = ChunkWorker
+            kwargs = {"session": self.session}
+
+        return worker_class(
+            **kwargs,
+            file_key = file_key,
+            chunk_index = chunk_index,
+            chunk_range = chunk_range,
+            file_path = info["file_path"],
+            sources = self.source_pools[file_key],
+            referer = self.task_info.Episode.url,
+            task_info = self.task_info,
+            stop_event = self._stop_event,
+            lock = self.update_lock,
+            token_bucket = self.token_bucket,
+            generation = generation,
+            parent = self,
+            on_chunk_start = self.on_chunk_start,
+            on_chunk_end = self.on_chunk_end,
+            shared_file = info.get("shared_file")
+        )
+
+    def _steal_work(self, file_key: str):
+        # 文件只有在最慢的分片完成后才算完成。一条被限速的连接落在最后一片上时，
+        # 其余线程只能干等。这里在有线程空闲、且没有排队中的分片时，
+        # 把剩余最多的分片对半拆开，后半段交给空闲线程
+        if (
+            self._stop_event.is_set()
+            or self.task_info.Download.status != DownloadStatus.DOWNLOADING
+            or self.thread_pool is None
+            or self.session is None
+        ):
+            return
+
+        with self.count_lock:
+            workers = [
+                worker for worker in self.running_workers
+                if worker.file_key == file_key and self.is_generation_active(worker.generation)
+            ]
+
+        if not workers:
+            return
+
+        generation = workers[0].generation
+        new_workers = []
+
+        with self.update_lock:
+            file_info = self.task_info.Download.files.get(file_key)
+
+            if not isinstance(file_info, dict):
+                return
+
+            remaining = set(file_info.get("chunks_list") or [])
+            running = [worker for worker in workers if worker.chunk_index in remaining]
+
+            if len(remaining) > len(running):
+                # 还有分片在线程池里排队，空闲线程马上会被它们占上
+                return
+
+            idle = self.thread_pool.maxThreadCount() - len(running)
+
+            # 剩余越多的分片越先拆。剩余量在各分片的 range_lock 下取快照，排序期间分片仍在写入，
+            # 快照可能已经过时，split() 会在锁内重新检查，拆不动的跳过，接着试下一个
+            candidates = sorted(((worker.remaining_size(), worker) for worker in running), key = lambda item: item[0], reverse = True)
+
+            for _, worker in candidates:
+                if len(new_workers) >= idle:
+                    break
+
+                split_range = worker.split()
+
+                if split_range is None:
+                    continue
+
+                new_index = file_info["total_chunks"]
+
+                # 拆分结果与断点表一同落盘：两段各自记下实际区间，
+                # 崩溃后按记录的区间恢复，不会再按下标推算回拆分前的整片
+                chunk_ranges = file_info.setdefault("chunk_ranges", {})
+                chunk_ranges[str(worker.chunk_index)] = [worker.chunk_range[0], split_range[0]]
+                chunk_ranges[str(new_index)] = list(split_range)
+
+                file_info["chunk_offsets"][str(new_index)] = 0
+                file_info["chunks_list"].append(new_index)
+                file_info["total_chunks"] = new_index + 1
+
+                new_workers.append((new_index, split_range))
+
+        if not new_workers:
+            return
 
         task_manager.update_async(self.task_info)
 
+        for chunk_index, chunk_range in new_workers:
+            logger.debug("分片拆分：%s 新增分片 %s，区间 %s", file_key, chunk_index, chunk_range)
+
+            self.thread_pool.start(self._create_chunk_worker(file_key, chunk_index, chunk_range, generation))
+
     def _reset_file_progress(self, file_key: str):
         file_info = self.task_info.Download.files.get(file_key)
 
@@ -739,15 +773,18 @@ class Downloader(QObject):
             file_info["total_chunks"] = 0
             file_info["finished_chunks"] = 0
             file_info["chunk_offsets"] = {}
+            file_info.pop("chunk_size", None)
+            file_info.pop("chunk_ranges", None)
 
-    def start_merge(self):
+    def start_merge(self, premuxed: bool = False):
         # 合并失败后可以重试，上一次的 Merger 不再需要。它挂在本对象的 parent 链上，
         # 不主动释放就会一直累积到任务结束
         self._release_merger()
+        self._release_stream_merger()
 
         self.task_info.Download.status = DownloadStatus.MERGING
 
-        self.merger = Merger(self.task_info, parent = self)
+        self.merger = Merger(self.task_info, parent = self, premuxed = premuxed)
         self.merger.start()
 
     def _release_merger(self):
@@ -769,6 +806,10 @@ class Downloader(QObject):
             pass
 
     def pause(self):
+        # 赶在代次失效之前汇总一次，暂停时保存的进度与界面显示一致
+        with self.count_lock:
+            self._collect_progress()
+
         with self.start_worker_lock:
             self.download_generation += 1
             self.start_worker_requested = False
@@ -779,6 +820,9 @@ class Downloader(QObject):
         self._close_session()
         self.speed_timer.stop()
 
+        # 暂停期间不保留 FFmpeg 进程，继续下载时重新开始，已下载的部分很快就能追上
+        self._release_stream_merger()
+
         # 暂停后测速定时器不再触发，这里补一次快照，否则最近一秒内完成的分片不会落盘
         task_manager.update_async(self.task_info)
 
@@ -794,7 +838,7 @@ class Downloader(QObject):
             case DownloadStatus.FFMPEG_FAILED:
                 self.start_merge()
 
-    def calc_chunk_list(self, file_key: str, total_size: int, chunk_size: int) -> list:
+    def calc_chunk_list(self, file_key: str, total_size: int) -> list:
         file_info = self.task_info.Download.files[file_key]
 
         with self.update_lock:
@@ -807,11 +851,16 @@ class Downloader(QObject):
                 chunk_list = list(file_info.get("chunks_list") or [])
 
             else:
+                # 分片大小只在建表时确定一次，并随断点表一同保存。chunk_offsets 以分片下标为键，
+                # 续传时必须按同一个大小还原字节区间，不能再按当下的测速结果重新规划
+                chunk_size = ChunkPlanner.plan(total_size, config.get(config.download_thread))
+
                 total_chunks = (total_size + chunk_size - 1) // chunk_size if total_size > 0 else 0
                 if total_chunks == 0:
                     total_chunks = 1
 
                 chunk_list = list(range(total_chunks))
+                file_info["chunk_size"] = chunk_size
                 file_info["total_chunks"] = total_chunks
                 file_info["chunks_list"] = chunk_list.copy()
 
@@ -828,7 +877,15 @@ class Downloader(QObject):
 
         return chunk_list
 
-    def calc_chunk_range(self, chunk_index: int, chunk_size: int, total_size: int):
+    def calc_chunk_range(self, file_info: dict, chunk_index: int, total_size: int):
+        # 调用方需持有 update_lock。拆分过的分片以记录的实际区间为准
+        chunk_range = (file_info.get("chunk_ranges") or {}).get(str(chunk_index))
+
+        if chunk_range:
+            return int(chunk_range[0]), int(chunk_range[1])
+
+        chunk_size = ChunkPlanner.get_chunk_size(file_info)
+
         start = chunk_index * chunk_size
         end = min(start + chunk_size, total_size) if total_size > 0 else 0
         return start, end
@@ -847,8 +904,7 @@ class Downloader(QObject):
                     remaining = set(chunks_list)
 
                     for i in range(total_chunks):
-                        start = i * self.chunk_size
-                        end = min(start + self.chunk_size, file_size) if file_size > 0 else 0
+                        start, end = self.calc_chunk_range(file_info, i, file_size)
 
                         if i not in remaining:
                             # 已完整下载的区块，累加其实际大小
@@ -883,6 +939,8 @@ class Downloader(QObject):
             self.on_file_completed(file_key)
             return
 
+        self._steal_work(file_key)
+
         task_manager.update_async(self.task_info)
 
         # 若队列全空，且任务没被暂停/取消，意味着所有文件下载完成
@@ -898,6 +956,12 @@ class Downloader(QObject):
 
         task_manager.update_async(self.task_info)
 
+        # 文件已完整写入，fsync 之后再关闭。大文件 fsync 可能耗时数秒，放到后台执行
+        shared_file = (self.download_list.get(file_key) or {}).pop("shared_file", None)
+
+        if shared_file is not None:
+            GlobalThreadPoolTask.run_func(shared_file.close, True)
+
         if self.task_info.Download.queue and not self._stop_event.is_set():
             self.start_download()
             return
@@ -936,26 +1000,14 @@ class Downloader(QObject):
             task_manager._update_media_info(self.task_info)
 
     def init_session(self):
-        # SSL 上下文全局复用，避免每次创建 Client 时重新加载 CA 证书（约 170ms，且发生在 GUI 线程）
-        ssl_context = get_ssl_context()
-
-        limits = httpx.Limits(max_keepalive_connections = config.get(config.download_thread), max_connections = config.get(config.download_thread))
-        transport = httpx.HTTPTransport(retries = 5, verify = ssl_context)
-        # 与解析请求共用同一套代理模式判定
-        mounts = get_proxy_mounts()
-
+        # 连接由全部下载任务共享（见 connection_pool），这里的 Client 只承载本任务的请求头与 Cookie。
+        # 暂停后恢复、或者下一个任务连同一批 CDN 节点时，可以直接复用已握手的连接
         headers = {
             "Referer": self.task_info.Episode.url,
             "User-Agent": config.get(config.user_agent)
         }
 
-        self.session = httpx.Client(
-            limits = limits,
-            transport = transport,
-            mounts = mounts,
-            headers = headers,
-            verify = ssl_context
-        )
+        self.session = create_download_client(headers)
 
         cookies = get_cookies()
 
@@ -1003,28 +1055,63 @@ class Downloader(QObject):
             self.wait_merge()
 
     def wait_merge(self):
-        self.task_info.Download.status = DownloadStatus.FFMPEG_QUEUED
-
         self._stop_event.set()
         self._close_session()
         self.speed_timer.stop()
 
+        stats = get_pool_stats()
+
+        logger.info(
+            "下载连接池：共 %s 次请求，复用连接 %s 次，新建连接 %s 条，握手累计 %.2fs",
+            stats["requests"], stats["hits"], stats["new_connections"], stats["handshake_time"]
+        )
+
+        stream_merger = self.stream_merger
+
+        if stream_merger is not None and stream_merger.succeeded:
+            # 合并已随下载一起完成，只剩重命名等收尾，无需再排队等待 FFmpeg
+            self.start_merge(premuxed = True)
+
+        elif stream_merger is not None and stream_merger.is_running():
+            # FFmpeg 还在写最后一段数据，几秒内就会结束，由 _on_stream_merge_finished 接着处理
+            self._stream_merge_pending = True
+
+            self.task_info.Download.status = DownloadStatus.MERGING
+            self.task_info.Download.progress = 0
+
+            self.update_item(self.task_info)
+
+        else:
+            self._queue_merge()
+
+    def _queue_merge(self):
+        self._release_stream_merger()
+
+        self.task_info.Download.status = DownloadStatus.FFMPEG_QUEUED
+
         task_manager.update_async(self.task_info)
         signal_bus.download.auto_manage_concurrent_downloads.emit()
 
-    def on_chunk_start(self):
+    def on_chunk_start(self, worker: ChunkTask):
         with self.count_lock:
             self.active_workers += 1
+            self.running_workers.add(worker)
 
-    def on_chunk_end(self):
+    def on_chunk_end(self, worker: ChunkTask):
         with self.count_lock:
             self.active_workers -= 1
+            self.running_workers.discard(worker)
+
+            # 分片结束后不再参与定时汇总，余下的进度在这里一次性计入
+            self._collect_progress([worker])
 
         self._queue_wait_callback_if_idle()
 
     def wait(self, on_end):
         self._stop_event.set()
 
+        self._release_stream_merger()
+
         with self.start_worker_lock:
             self.download_generation += 1
             self.start_worker_requested = False
@@ -1071,7 +1158,35 @@ class Downloader(QObject):
         self.last_sampled_time = time.monotonic()
         self.speed_timer.start()
 
+    def _collect_progress(self, workers: list[ChunkTask] = None):
+        """
+        把各分片自上次汇总以来的进度计入 downloaded_size
+
+        调用方需持有 count_lock，不传 workers 时汇总全部运行中的分片。
+        代次已失效的分片只推进 reported 不计数：下一次 start_worker 会按断点表重新统计，
+        迟到的增量再加上去就会重复计算
+        """
+        if workers is None:
+            workers = self.running_workers
+
+        with self.update_lock:
+            delta = 0
+
+            for worker in workers:
+                progress = worker.progress
+
+                if self.is_generation_active(worker.generation):
+                    delta += progress - worker.reported
+
+                worker.reported = progress
+
+            if delta:
+                self.task_info.Download.downloaded_size = max(self.task_info.Download.downloaded_size + delta, 0)
+
     def _calculate_speed(self):
+        with self.count_lock:
+            self._collect_progress()
+
         with self.update_lock:
             current_size = self.task_info.Download.downloaded_size
 
@@ -1120,11 +1235,14 @@ class Downloader(QObject):
         self._close_session()
 
         self._release_merger()
+        self._release_stream_merger()
 
     def on_delete(self):
         # 在移出管理器之前先登记，保证销毁期间始终有一份来自 GUI 线程的引用
         _pending_delete.add(self)
 
+        RateLimiter.set_prioritized(self.task_info.Basic.task_id, False)
+
         self._stop_event.set()
 
         # 提升代次，令仍在运行的分片线程尽快退出，并且不再回调本对象
@@ -1137,6 +1255,7 @@ class Downloader(QObject):
         # 必须赶在 deleteLater 之前停掉 FFmpeg，否则销毁 parent 链时
         # 会析构仍在运行的 FFmpegRunner
         self._release_merger()
+        self._release_stream_merger()
 
         with self._ref_lock:
             self._delete_pending = True
@@ -1264,6 +1383,15 @@ class Downloader(QObject):
         thread.start()
 
     def _close_session(self):
+        # 异步引擎的分片不经过本任务的会话，需要直接取消协程
+        pool = self.thread_pool or self._releasing_pool
+
+        if isinstance(pool, AsyncChunkPool):
+            pool.abort()
+
+        # 会话与文件描述符一同释放。仍在写入的分片退出后描述符才会真正关闭
+        self._close_files()
+
         session = self.session
         self.session = None
 
@@ -1276,6 +1404,13 @@ class Downloader(QObject):
         except Exception:
             logger.exception("无法关闭 HTTP 会话，可能存在资源泄漏风险")
     
+    def _close_files(self):
+        for info in list((self.download_list or {}).values()):
+            shared_file = info.pop("shared_file", None)
+
+            if shared_file is not None:
+                shared_file.close()
+
     def update_item(self, task_info: TaskInfo):
         signal_bus.download.update_downloading_item.emit(task_info)
         task_manager.update_async(self.task_info)
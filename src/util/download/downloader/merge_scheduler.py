@@ -0,0 +1,175 @@
+from ...common.enum import MergeJobKind
+
+from dataclasses import dataclass
+from threading import Lock
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# 新样本在估算值中所占的比重
+SMOOTHING = 0.3
+
+# 平均占用超过这么多核，说明任务卡在 CPU 上，磁盘并未跑满
+CPU_BOUND_CORES = 0.8
+
+# 任务卡在 CPU 上时，把磁盘带宽估算放宽到实测值的这么多倍，让下一轮试着多并发一个
+PROBE_FACTOR = 2.0
+
+# 耗时太短的任务测不准，不参与估算
+MIN_SAMPLE_SECONDS = 0.5
+
+@dataclass
+class MergeProfile:
+    # 单个任务平均占用的 CPU 核数
+    cores: float
+    # 单独运行时的读取速度（字节/秒），0 表示尚未测得
+    rate: float = 0.0
+    # 是否主要消耗磁盘读写，受磁盘带宽预算约束
+    disk_bound: bool = True
+
+@dataclass
+class MergeJob:
+    kind: MergeJobKind
+    input_bytes: int
+    # 运行期间同时在读写磁盘的任务数的最大值（含自身）
+    disk_peers: int = 1
+
+class MergeScheduler:
+    """
+    按 CPU 核数与磁盘带宽两份预算调度合并任务
+
+    -c copy 封装只受磁盘速度限制，m4a 转 mp3 则主要吃 CPU，原先统一按「同时只跑一个」处理，
+    批量完成几百个任务时机器大部分时间是闲着的。这里按任务类型分别估算每个任务占用的核数
+    与读写速度（数据来自之前跑完的合并），只要两份预算都还有余量就放行，
+    既能把机器用满，又不会让多个任务争抢同一块磁盘
+
+    磁盘带宽没有直接测量手段，只能从已完成任务的总吞吐推算：任务卡在 CPU 上说明磁盘还有余量，
+    估算值翻倍，下一轮多放行一个试探；任务卡在磁盘上时估算值向实测值靠拢。
+    尚未测得带宽时，同一时间只跑一个读写磁盘的任务，与原先的行为一致
+    """
+    _lock = Lock()
+    _running: dict[object, MergeJob] = {}
+
+    # 各类任务的初始估算：FFmpeg 封装与转码基本都是单线程
+    _profiles: dict[MergeJobKind, MergeProfile] = {
+        MergeJobKind.COPY: MergeProfile(cores = 1.0),
+        MergeJobKind.EMBED: MergeProfile(cores = 1.0),
+        MergeJobKind.TRANSCODE: MergeProfile(cores = 1.0, disk_bound = False),
+    }
+
+    # 磁盘总带宽的估算（字节/秒），0 表示尚未测得
+    _disk_capacity = 0.0
+
+    @classmethod
+    def cpu_budget(cls) -> float:
+        return float(os.cpu_count() or 1)
+
+    @classmethod
+    def can_start(cls, kind: MergeJobKind) -> bool:
+        """
+        判断现在能否再启动一个该类型的合并任务
+
+        什么都没在跑时一律放行，保证估算得再离谱队列也不会卡死
+        """
+        if kind == MergeJobKind.RENAME:
+            return True
+
+        with cls._lock:
+            if not cls._running:
+                return True
+
+            profile = cls._profiles[kind]
+
+            cores = sum(cls._profiles[job.kind].cores for job in cls._running.values())
+
+            if cores + profile.cores > cls.cpu_budget():
+                return False
+
+            if not profile.disk_bound:
+                return True
+
+            disk_jobs = [job for job in cls._running.values() if cls._profiles[job.kind].disk_bound]
+
+            if not disk_jobs:
+                return True
+
+            if cls._disk_capacity <= 0 or profile.rate <= 0:
+                # 带宽或该类任务的速度还没测出来，稳妥起见不与其他读写磁盘的任务同时进行
+                return False
+
+            demand = sum(cls._profiles[job.kind].rate for job in disk_jobs)
+
+            return demand + profile.rate <= cls._disk_capacity
+
+    @classmethod
+    def is_saturated(cls) -> bool:
+        # 任何类型的任务都放不进去了，调度方可以不必再逐个检查排队的任务
+        return not any(cls.can_start(kind) for kind in cls._profiles)
+
+    @classmethod
+    def begin(cls, key: object, kind: MergeJobKind, input_bytes: int):
+        # key 为正在运行的 FFmpegRunner / RemuxRunner，同一任务回退重试时换用新的 key
+        with cls._lock:
+            cls._running[key] = MergeJob(kind, input_bytes)
+
+            if cls._profiles[kind].disk_bound:
+                disk_jobs = [job for job in cls._running.values() if cls._profiles[job.kind].disk_bound]
+
+                for disk_job in disk_jobs:
+                    disk_job.disk_peers = max(disk_job.disk_peers, len(disk_jobs))
+
+    @classmethod
+    def end(cls, key: object, elapsed: float = 0.0, cpu_time: float = 0.0):
+        """
+        任务结束，释放其占用的预算
+
+        elapsed 不为 0 表示任务成功完成，据此更新估算；失败、终止的任务耗时没有参考价值
+        """
+        with cls._lock:
+            job = cls._running.pop(key, None)
+
+            if job is None or elapsed < MIN_SAMPLE_SECONDS:
+                return
+
+            cls._record(job, elapsed, cpu_time)
+
+    @classmethod
+    def _record(cls, job: MergeJob, elapsed: float, cpu_time: float):
+        # 调用方需持有 _lock
+        profile = cls._profiles[job.kind]
+
+        cores = cpu_time / elapsed
+
+        if cores > 0:
+            profile.cores = cls._smooth(profile.cores, cores)
+
+        if not profile.disk_bound or job.input_bytes <= 0:
+            return
+
+        rate = job.input_bytes / elapsed
+
+        # 独占磁盘时测得的才是单个任务的真实速度；与别的任务共享时只能说明它至少这么快
+        if job.disk_peers == 1:
+            profile.rate = cls._smooth(profile.rate, rate)
+        else:
+            profile.rate = max(profile.rate, rate)
+
+        throughput = rate * job.disk_peers
+
+        if cores >= CPU_BOUND_CORES:
+            cls._disk_capacity = max(cls._disk_capacity, throughput * PROBE_FACTOR)
+        else:
+            cls._disk_capacity = cls._smooth(cls._disk_capacity, throughput)
+
+        logger.debug(
+            "合并任务 %s：%.1f MB/s，%.2f 核，同时读写磁盘 %d 个，估算磁盘带宽 %.1f MB/s",
+            job.kind.value, rate / 1024 / 1024, cores, job.disk_peers, cls._disk_capacity / 1024 / 1024
+        )
+
+    @staticmethod
+    def _smooth(current: float, sample: float):
+        if current <= 0:
+            return sample
+
+        return current + (sample - current) * SMOOTHING
@@ -1,19 +1,22 @@
 from PySide6.QtCore import QObject
 
-from ...common.enum import DownloadStatus, DownloadType, OriginalFileType, ToastNotificationCategory
+from ...common.enum import DownloadStatus, DownloadType, MergeJobKind, OriginalFileType, ToastNotificationCategory
 from ...common.io.file import safe_remove, safe_rename
 from ...common.timestamp import get_timestamp
 from ...common.signal_bus import signal_bus
 from ...common.translator import Translator
+from ...common.config import config
 from ..task.options import resolve
 
 from ...parse.additional.chapter import ChapterParser
 
 from ...ffmpeg.command import FFmpegCommand
-from ...ffmpeg.runner import FFmpegRunner
+from ...ffmpeg.runner import FFmpegRunner, RemuxRunner
+from ...ffmpeg.remux import MP4Remuxer, RemuxUnsupportedError
 
 from ..task.manager import task_manager
 from ..task.info import TaskInfo
+from .merge_scheduler import MergeScheduler
 
 from pathlib import Path
 import logging
@@ -21,10 +24,12 @@ import logging
 logger = logging.getLogger(__name__)
 
 class Merger(QObject):
-    def __init__(self, task_info: TaskInfo, parent = None):
+    def __init__(self, task_info: TaskInfo, parent = None, premuxed: bool = False):
         super().__init__(parent)
 
         self.task_info = task_info
+        # 输出文件已由 StreamMerger 在下载过程中生成，只需收尾
+        self.premuxed = premuxed
         self._has_error = False
         self._stopped = False
         self._ffmpeg_runner = None
@@ -51,6 +56,8 @@ class Merger(QObject):
         if runner is None:
             return True
 
+        MergeScheduler.end(runner)
+
         try:
             if not runner.isRunning():
                 return True
@@ -61,6 +68,33 @@ class Merger(QObject):
             # C++ 侧已经析构，无需再处理
             return True
 
+    @staticmethod
+    def classify(task_info: TaskInfo) -> MergeJobKind:
+        """
+        判断 start 将要执行哪一类合并，与 start 的分支保持一致，供 MergeScheduler 在启动前估算资源占用
+        """
+        if task_info.Download.merge_video_audio or task_info.Download.video_parts_count > 0:
+            cwd = Path(task_info.File.download_path, task_info.File.folder)
+
+            # 与 check_attach_cover、check_attach_chapter、check_embed_subtitles 的判断相同，只是不记录状态
+            cover_file_name = f"{task_info.File.name}.{resolve(task_info, 'cover_type').value}"
+
+            if resolve(task_info, "attach_cover") and Path(cwd, cover_file_name).exists():
+                return MergeJobKind.EMBED
+
+            if Path(cwd, ChapterParser.get_file_name(task_info.Basic.task_id)).exists():
+                return MergeJobKind.EMBED
+
+            if task_info.File.merge_file_ext == "mkv" and task_info.File.subtitle_track_list:
+                return MergeJobKind.EMBED
+
+            return MergeJobKind.COPY
+
+        if task_info.File.audio_file_ext == "m4a" and resolve(task_info, "m4a_to_mp3"):
+            return MergeJobKind.TRANSCODE
+
+        return MergeJobKind.RENAME
+
     def start(self):
         if self.task_info.Download.merge_video_audio:
             # 现代 dash 视频合并
@@ -91,17 +125,30 @@ class Merger(QObject):
         a_exists = Path(cwd, self.temp_audio_file_name).exists()
         o_exists = Path(cwd, self.temp_output_file_name).exists()
 
-        if v_exists and a_exists:
+        if self.premuxed:
+            self.finish_premuxed(o_exists)
+
+        elif v_exists and a_exists:
+            cover_path = self.check_attach_cover()
+            chapter_path = self.check_attach_chapter()
+            subtitle_list = self.check_embed_subtitles()
+
+            if self.can_remux_natively(cover_path, chapter_path, subtitle_list):
+                self._run_native_merge(cwd)
+                return
+
+            kind = MergeJobKind.EMBED if cover_path or chapter_path or subtitle_list else MergeJobKind.COPY
+
             merge_cmd = FFmpegCommand.merge_video_audio(
                 video_path = self.temp_video_file_name,
                 audio_path = self.temp_audio_file_name,
                 output_path = self.temp_output_file_name,
-                cover_path = self.check_attach_cover(),
-                chapter_path = self.check_attach_chapter(),
-                subtitle_list = self.check_embed_subtitles()
+                cover_path = cover_path,
+                chapter_path = chapter_path,
+                subtitle_list = subtitle_list
             )
 
-            self._run_merge_command(merge_cmd, cwd)
+            self._run_merge_command(merge_cmd, cwd, kind, self.temp_video_file_name, self.temp_audio_file_name)
 
         elif o_exists and not v_exists and not a_exists:
             self.on_merge_completed(0, "", "")
@@ -112,6 +159,18 @@ class Merger(QObject):
                 Translator.ERROR_MESSAGES("FILE_NOT_FOUND_DETAIL")
             )
 
+    def finish_premuxed(self, o_exists: bool):
+        # 章节等内容在下载完成后才生成，边下载边合并的输出里没有。此时放弃该输出，
+        # 重新排队完整合并，仍然遵守同一时间只跑一个 FFmpeg 的限制
+        if o_exists and not (self.check_attach_cover() or self.check_attach_chapter() or self.check_embed_subtitles()):
+            self.on_merge_completed(0, "", "")
+            return
+
+        self.task_info.Download.status = DownloadStatus.FFMPEG_QUEUED
+
+        signal_bus.download.update_downloading_item.emit(self.task_info)
+        signal_bus.download.auto_manage_concurrent_downloads.emit()
+
     def merge_video_parts(self):
         cwd = self.get_cwd()
 
@@ -119,32 +178,108 @@ class Merger(QObject):
 
         self.add_file(lists_path)
 
+        cover_path = self.check_attach_cover()
+        chapter_path = self.check_attach_chapter()
+        subtitle_list = self.check_embed_subtitles()
+
         merge_cmd = FFmpegCommand.merge_video_parts(
             lists_path = lists_path,
             output_path = self.temp_output_file_name,
-            cover_path = self.check_attach_cover(),
-            chapter_path = self.check_attach_chapter(),
-            subtitle_list = self.check_embed_subtitles()
+            cover_path = cover_path,
+            chapter_path = chapter_path,
+            subtitle_list = subtitle_list
         )
 
-        self._run_merge_command(merge_cmd, cwd)
+        kind = MergeJobKind.EMBED if cover_path or chapter_path or subtitle_list else MergeJobKind.COPY
 
-    def _run_merge_command(self, command: FFmpegCommand, cwd: Path):
-        self._start_ffmpeg(command, cwd, self.on_merge_completed)
+        self._run_merge_command(merge_cmd, cwd, kind, *self.video_part_file_names)
 
-    def _start_ffmpeg(self, command: FFmpegCommand, cwd: Path, on_finished):
+    def can_remux_natively(self, cover_path: str, chapter_path: str, subtitle_list: list):
+        # 只有「一路视频 + 一路音频、不写入任何附加内容、输出 MP4」这种最常见的情况才绕过 FFmpeg
+        if not config.get(config.native_remux) or self.task_info.File.merge_file_ext != "mp4":
+            return False
+
+        return not (cover_path or chapter_path or subtitle_list)
+
+    def _run_native_merge(self, cwd: Path):
+        remuxer = MP4Remuxer(
+            video_path = Path(cwd, self.temp_video_file_name),
+            audio_path = Path(cwd, self.temp_audio_file_name),
+            output_path = Path(cwd, self.temp_output_file_name)
+        )
+
+        runner = RemuxRunner(remuxer, parent = self)
+
+        self._start_runner(runner, cwd, MergeJobKind.COPY, (self.temp_video_file_name, self.temp_audio_file_name), self.on_merge_completed, self.on_native_merge_error)
+
+    def on_native_merge_error(self, error: Exception, stdout: str, stderr: str):
+        self._end_scheduled_run()
+
+        if self._stopped:
+            return
+
+        # 直接合并处理不了的输入（非分段 MP4、加密等）以及任何意外错误都交给 FFmpeg 再试一次
+        if isinstance(error, RemuxUnsupportedError):
+            logger.info("无法直接合并，改用 FFmpeg：%s", error)
+        else:
+            logger.warning("直接合并失败，改用 FFmpeg：%s", error)
+
+        merge_cmd = FFmpegCommand.merge_video_audio(
+            video_path = self.temp_video_file_name,
+            audio_path = self.temp_audio_file_name,
+            output_path = self.temp_output_file_name
+        )
+
+        self._run_merge_command(merge_cmd, self.get_cwd(), MergeJobKind.COPY, self.temp_video_file_name, self.temp_audio_file_name)
+
+    def _run_merge_command(self, command: FFmpegCommand, cwd: Path, kind: MergeJobKind, *input_files: str):
+        self._start_ffmpeg(command, cwd, kind, input_files, self.on_merge_completed)
+
+    def _start_ffmpeg(self, command: FFmpegCommand, cwd: Path, kind: MergeJobKind, input_files: tuple[str, ...], on_finished):
+        runner = FFmpegRunner.from_command(command, parent = self)
+        # FFmpeg 自己报的时长更准，这里给的只是它打印出 Duration 之前的兜底
+        runner.set_duration(self.task_info.Episode.duration)
+
+        self._start_runner(runner, cwd, kind, input_files, on_finished, self.on_merge_error)
+
+    def _start_runner(self, runner: FFmpegRunner | RemuxRunner, cwd: Path, kind: MergeJobKind, input_files: tuple[str, ...], on_finished, on_error):
         # 下载阶段结束时进度停在 100，这里必须归零，否则进度条会从满格开始重走
         self.task_info.Download.progress = 0
 
-        self._ffmpeg_runner = FFmpegRunner.from_command(command, parent = self)
+        MergeScheduler.begin(runner, kind, self.get_files_size(cwd, input_files))
+
+        self._ffmpeg_runner = runner
         self._ffmpeg_runner.set_cwd(cwd)
-        # FFmpeg 自己报的时长更准，这里给的只是它打印出 Duration 之前的兜底
-        self._ffmpeg_runner.set_duration(self.task_info.Episode.duration)
         self._ffmpeg_runner.progress_signal.connect(self.on_progress_updated)
         self._ffmpeg_runner.finished_signal.connect(on_finished)
-        self._ffmpeg_runner.error_signal.connect(self.on_merge_error)
+        self._ffmpeg_runner.error_signal.connect(on_error)
         self._ffmpeg_runner.start()
 
+    def _end_scheduled_run(self, succeeded: bool = False):
+        # 归还合并预算。成功完成的任务顺带把耗时交给 MergeScheduler 更新估算
+        runner = self._ffmpeg_runner
+
+        if runner is None:
+            return
+
+        if succeeded:
+            MergeScheduler.end(runner, runner.elapsed, runner.cpu_time)
+        else:
+            MergeScheduler.end(runner)
+
+    @staticmethod
+    def get_files_size(cwd: Path, file_names: tuple[str, ...]):
+        size = 0
+
+        for file_name in file_names:
+            try:
+                size += Path(cwd, file_name).stat().st_size
+
+            except OSError:
+                pass
+
+        return size
+
     def on_progress_updated(self, progress: int):
         if self._has_error or self._stopped:
             return
@@ -186,6 +321,8 @@ class Merger(QObject):
             self.set_error_message(Translator.ERROR_MESSAGES("RENAME_FAILED"), str(e))
 
     def on_merge_completed(self, return_code: int, stdout: str, stderr: str):
+        self._end_scheduled_run(succeeded = True)
+
         if getattr(self, "_has_error", False) or self._stopped:
             return
 
@@ -214,6 +351,8 @@ class Merger(QObject):
             self.set_error_message(Translator.ERROR_MESSAGES("RENAME_FAILED"), str(e))
 
     def on_convert_completed(self, return_code: int, stdout: str, stderr: str):
+        self._end_scheduled_run(succeeded = True)
+
         if getattr(self, "_has_error", False) or self._stopped:
             return
 
@@ -275,6 +414,8 @@ class Merger(QObject):
             return []
 
     def on_merge_error(self, error: Exception, stdout: str, stderr: str):
+        self._end_scheduled_run()
+
         # 主动终止 FFmpeg 必然带回一个非零返回码，这不是真正的合并失败，
         # 不能据此把任务标记为失败
         if self._stopped:
@@ -355,7 +496,7 @@ class Merger(QObject):
                 output_path = temp_output_audio_file_name
             )
 
-            self._start_ffmpeg(convert_cmd, cwd, self.on_convert_completed)
+            self._start_ffmpeg(convert_cmd, cwd, MergeJobKind.TRANSCODE, (self.temp_audio_file_name, ), self.on_convert_completed)
         else:
             self.set_error_message(
                 Translator.ERROR_MESSAGES("DOWNLOAD_FAILED"),
@@ -440,13 +581,7 @@ class Merger(QObject):
         lists_path = Path(cwd, f"lists_{self.task_info.Basic.task_id}.txt")
 
         with lists_path.open("w", encoding = "utf-8") as f:
-            for i in range(video_parts_count):
-                part_file_name = "video_{task_id}_{index}.{ext}".format(
-                    task_id = self.task_info.Basic.task_id,
-                    index = i,
-                    ext = self.task_info.File.video_file_ext
-                )
-
+            for part_file_name in self.video_part_file_names[:video_parts_count]:
                 f.write(f"file '{part_file_name}'\n")
 
         return lists_path.name
@@ -467,7 +602,7 @@ class Merger(QObject):
                 output_path = temp_output_audio_file_name
             )
 
-            self._start_ffmpeg(fix_command, cwd, self.on_convert_completed)
+            self._start_ffmpeg(fix_command, cwd, MergeJobKind.COPY, (self.temp_audio_file_name, ), self.on_convert_completed)
         else:
             self.set_error_message(
                 Translator.ERROR_MESSAGES("DOWNLOAD_FAILED"),
@@ -488,6 +623,17 @@ class Merger(QObject):
             file_ext = self.task_info.File.audio_file_ext
         )
     
+    @property
+    def video_part_file_names(self):
+        return tuple(
+            "video_{task_id}_{index}.{ext}".format(
+                task_id = self.task_info.Basic.task_id,
+                index = i,
+                ext = self.task_info.File.video_file_ext
+            )
+            for i in range(self.task_info.Download.video_parts_count)
+        )
+
     @property
     def temp_output_file_name(self):
         return "output_{task_id}.{file_ext}".format(
@@ -36,12 +36,15 @@ class ParseAbortError(RuntimeError):
     pass
 
 class ParseWorker(QRunnable, ParserBase):
-    def __init__(self, task_info: TaskInfo, parent = None, on_finished = None, stop_event = None):
+    def __init__(self, task_info: TaskInfo, parent = None, on_finished = None, stop_event = None, prefetched_info: dict = None):
         super().__init__()
 
         self.task_info = task_info
         self.info_data: dict = None
 
+        # PlayurlPrefetcher 提前解析好的结果，首次尝试直接使用，不再请求接口
+        self.prefetched_info = prefetched_info
+
         self.parent = parent
 
         # 用户暂停 / 取消 / 删除任务时置位，重试等待期间要能及时退出
@@ -74,11 +77,12 @@ class ParseWorker(QRunnable, ParserBase):
                 return
 
             try:
-                self.info_data = None
-
-                self.get_info()
+                if self.prefetched_info is not None:
+                    # 只用一次，若后续出错，重试时照常现场解析
+                    download_info, self.prefetched_info = self.prefetched_info, None
+                else:
+                    download_info = self.resolve()
 
-                download_info = self.parse_download_info()
                 download_info_json = json_dumps(download_info)
 
                 if self.is_stopped():
@@ -133,6 +137,15 @@ class ParseWorker(QRunnable, ParserBase):
 
         return True
 
+    def resolve(self) -> dict:
+        # 请求 playurl 接口并选出要下载的流，会就地改写 task_info 的画质、编码、扩展名等字段。
+        # 不涉及 Qt 对象，PlayurlPrefetcher 在自己的线程上对任务副本调用
+        self.info_data = None
+
+        self.get_info()
+
+        return self.parse_download_info()
+
     def get_info(self):
         attr = self.task_info.Episode.attribute
 
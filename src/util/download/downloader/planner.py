@@ -0,0 +1,119 @@
+from threading import Lock
+import math
+
+# 旧版本固定按 4MB 切片，断点表里没有记录分片大小的文件一律按它还原，
+# 否则 chunk_offsets 中的下标会对应到错误的字节区间上
+LEGACY_CHUNK_SIZE = 4 * 1024 * 1024
+
+MIN_CHUNK_SIZE = 512 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# 分片大小按 64KB 对齐，避免出现零碎的尾巴
+CHUNK_ALIGNMENT = 64 * 1024
+
+# 尚无测速数据时，每个线程大致分到这么多片，留出余量给快慢不一的连接互相平衡
+SLICES_PER_THREAD = 4
+
+# 有测速数据时，让单个分片在一条连接上大约跑这么久。
+# 太短则 Range 请求与 on_chunk_finished 回调过于频繁，太长则慢连接拖尾严重
+TARGET_CHUNK_SECONDS = 8
+
+# 剩余未下载部分不足该值的分片不再对半拆分，拆出来的后半段至少有 MIN_CHUNK_SIZE
+MIN_SPLIT_SIZE = MIN_CHUNK_SIZE * 2
+
+# 吞吐量滑动平均的权重，以及参与统计的最小样本
+EWMA_WEIGHT = 0.3
+MIN_SAMPLE_BYTES = 256 * 1024
+MIN_SAMPLE_SECONDS = 0.5
+
+class ThroughputEstimator:
+    # 单条连接的实测吞吐量（字节/秒），跨任务共享：
+    # 同一时刻各任务连的多是同一批 CDN 节点，前一个任务测得的速度对下一个任务同样有参考价值
+    _lock = Lock()
+    _rate: float = 0.0
+
+    @classmethod
+    def report(cls, size: int, elapsed: float):
+        if size < MIN_SAMPLE_BYTES or elapsed < MIN_SAMPLE_SECONDS:
+            # 样本过小时测出的速度主要是握手与首包延迟，没有参考价值
+            return
+
+        rate = size / elapsed
+
+        with cls._lock:
+            if cls._rate <= 0:
+                cls._rate = rate
+            else:
+                cls._rate = cls._rate * (1 - EWMA_WEIGHT) + rate * EWMA_WEIGHT
+
+    @classmethod
+    def get_rate(cls) -> float:
+        with cls._lock:
+            return cls._rate
+
+class ChunkPlanner:
+    @staticmethod
+    def plan(file_size: int, thread_count: int) -> int:
+        """
+        为一个文件挑选分片大小
+
+        :param file_size: 文件大小（字节）
+        :param thread_count: 下载线程数
+        """
+        if file_size <= 0:
+            return LEGACY_CHUNK_SIZE
+
+        thread_count = max(thread_count, 1)
+
+        # 上限：至少切出与线程数相同的分片，小文件也能吃满并发
+        upper = math.ceil(file_size / thread_count)
+
+        rate = ThroughputEstimator.get_rate()
+
+        if rate > 0:
+            preferred = rate * TARGET_CHUNK_SECONDS
+        else:
+            preferred = file_size / (thread_count * SLICES_PER_THREAD)
+
+        chunk_size = min(preferred, upper)
+        chunk_size = min(max(chunk_size, MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+        return ChunkPlanner.align(int(chunk_size))
+
+    @staticmethod
+    def align(chunk_size: int) -> int:
+        return max((chunk_size + CHUNK_ALIGNMENT - 1) // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT, CHUNK_ALIGNMENT)
+
+    @staticmethod
+    def get_chunk_size(file_info: dict) -> int:
+        # 断点表建立时记下的分片大小。旧记录没有该字段，按旧版固定值还原
+        try:
+            chunk_size = int(file_info.get("chunk_size") or 0)
+
+        except (TypeError, ValueError):
+            chunk_size = 0
+
+        return chunk_size if chunk_size > 0 else LEGACY_CHUNK_SIZE
+
+    @staticmethod
+    def split_point(position: int, end: int) -> int:
+        """
+        计算正在下载的分片 [position, end) 的对半拆分点，剩余部分太小时返回 None
+
+        :param position: 分片当前已写到的绝对偏移
+        :param end: 分片的结束偏移（不含）
+        """
+        remaining = end - position
+
+        if remaining < MIN_SPLIT_SIZE:
+            return None
+
+        middle = position + remaining // 2
+
+        # 拆分点向后对齐，两段都不能为空
+        middle = (middle + CHUNK_ALIGNMENT - 1) // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT
+
+        if middle <= position or middle >= end:
+            return None
+
+        return middle
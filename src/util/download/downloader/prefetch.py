@@ -0,0 +1,207 @@
+from ...common.enum import DownloadType
+from ...common._json import json_dumps
+
+from ..task.info import TaskInfo
+from .parse_worker import ParseWorker
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# 同时进行的预解析数
+PREFETCH_WORKERS = 2
+
+# 最多缓存这么多个任务的解析结果
+PREFETCH_CACHE_SIZE = 32
+
+# 距离链接过期不足这么多秒的结果不再使用，留出下载所需的时间
+DEADLINE_MARGIN = 300
+
+# 链接里找不到 deadline 参数时的有效期
+DEFAULT_TTL = 600
+
+# 节点的健康状况随时在变，探测结果最多使用这么久
+MAX_TTL = 1800
+
+# 预解析失败后，这么多秒内不再为同一任务重试，免得反复撞上接口风控
+FAILURE_BACKOFF = 60
+
+# 解析过程中会改写的字段。预解析改写的是副本，取用时再搬到真正的 TaskInfo 上
+PARSED_DOWNLOAD_FIELDS = ("type", "media_type", "video_quality_id", "audio_quality_id", "video_codec_id", "video_parts_count", "merge_video_audio", "keep_original_files")
+PARSED_FILE_FIELDS = ("video_file_ext", "audio_file_ext", "merge_file_ext")
+
+@dataclass
+class PrefetchResult:
+    # 解析前任务状态的指纹，取用时不一致说明任务被改过，结果作废
+    fingerprint: str
+    download_info: dict
+    download_fields: dict
+    file_fields: dict
+    relative_files: list[str]
+    # time.time() 时间戳
+    expires_at: float
+
+    def apply(self, task_info: TaskInfo):
+        # 与 ParseWorker 直接解析时对 task_info 的改动一致
+        for name, value in self.download_fields.items():
+            setattr(task_info.Download, name, value)
+
+        for name, value in self.file_fields.items():
+            setattr(task_info.File, name, value)
+
+        for file_name in self.relative_files:
+            if file_name not in task_info.File.relative_files:
+                task_info.File.relative_files.append(file_name)
+
+class PlayurlPrefetcher:
+    """
+    为即将开始的排队任务预先解析下载链接
+
+    任务原先要等拿到下载并发额度后才去请求 playurl 接口、探测 CDN 节点，
+    每个任务开头都要串行地等上几秒到几十秒。下载额度占满时，这里在后台为接下来的
+    几个排队任务先把这一步做完，额度空出后 Downloader 直接取用结果开始下载分片。
+
+    链接带有 deadline 参数，结果的有效期以此为准；取不到、过期或任务设置已变时照常现场解析
+    """
+    _lock = Lock()
+    _cache: OrderedDict[str, PrefetchResult] = OrderedDict()
+    _pending: set[str] = set()
+    _failed_until: dict[str, float] = {}
+
+    _executor: ThreadPoolExecutor = None
+
+    @classmethod
+    def schedule(cls, task_info_list: list[TaskInfo]):
+        """在 GUI 线程调用，传入接下来最先开始的若干个排队任务"""
+        now = time.time()
+
+        for task_info in task_info_list:
+            if not cls._needs_parse(task_info):
+                continue
+
+            task_id = task_info.Basic.task_id
+            fingerprint = cls._fingerprint(task_info)
+
+            with cls._lock:
+                if task_id in cls._pending or cls._failed_until.get(task_id, 0) > now:
+                    continue
+
+                cached = cls._cache.get(task_id)
+
+                if cached and cached.fingerprint == fingerprint and cached.expires_at > now:
+                    continue
+
+                cls._pending.add(task_id)
+
+            # 在调用方线程上取一份深拷贝（to_dict 会逐层复制），后台解析改写的是副本
+            snapshot = TaskInfo()
+            snapshot.from_dict(task_info.to_dict())
+
+            try:
+                cls._get_executor().submit(cls._prefetch, snapshot, fingerprint)
+
+            except RuntimeError:
+                # 解释器正在退出
+                with cls._lock:
+                    cls._pending.discard(task_id)
+
+    @classmethod
+    def take(cls, task_info: TaskInfo) -> PrefetchResult | None:
+        """取出该任务的预解析结果，没有可用的结果时返回 None"""
+        with cls._lock:
+            result = cls._cache.pop(task_info.Basic.task_id, None)
+
+        if result is None:
+            return None
+
+        if result.expires_at <= time.time() or result.fingerprint != cls._fingerprint(task_info):
+            return None
+
+        return result
+
+    @classmethod
+    def _prefetch(cls, snapshot: TaskInfo, fingerprint: str):
+        task_id = snapshot.Basic.task_id
+
+        try:
+            download_info = ParseWorker(snapshot).resolve()
+
+        except Exception as e:
+            # 预解析失败不影响任何东西，任务开始时照常解析，届时的错误才需要提示用户
+            logger.debug("预解析下载链接失败：%s，%s", task_id, e)
+
+            with cls._lock:
+                cls._pending.discard(task_id)
+                cls._failed_until[task_id] = time.time() + FAILURE_BACKOFF
+
+            return
+
+        result = PrefetchResult(
+            fingerprint = fingerprint,
+            download_info = download_info,
+            download_fields = {name: getattr(snapshot.Download, name) for name in PARSED_DOWNLOAD_FIELDS},
+            file_fields = {name: getattr(snapshot.File, name) for name in PARSED_FILE_FIELDS},
+            relative_files = list(snapshot.File.relative_files),
+            expires_at = cls._expires_at(download_info)
+        )
+
+        with cls._lock:
+            cls._pending.discard(task_id)
+            cls._failed_until.pop(task_id, None)
+
+            cls._cache[task_id] = result
+            cls._cache.move_to_end(task_id)
+
+            while len(cls._cache) > PREFETCH_CACHE_SIZE:
+                cls._cache.popitem(last = False)
+
+    @staticmethod
+    def _needs_parse(task_info: TaskInfo):
+        # 与 Downloader.start 的判断一致：只有要下载音视频流、且尚未下完的任务才会解析
+        if task_info.Download.progress >= 100 or (not task_info.Download.queue and task_info.Download.total_size > 0):
+            return False
+
+        return task_info.Download.type & (DownloadType.VIDEO | DownloadType.AUDIO) != 0
+
+    @staticmethod
+    def _fingerprint(task_info: TaskInfo):
+        # 解析结果取决于这些字段，以及决定输出格式的 video_container
+        return json_dumps([
+            [getattr(task_info.Download, name) for name in PARSED_DOWNLOAD_FIELDS],
+            task_info.Download.queue,
+            task_info.Options.video_container
+        ])
+
+    @staticmethod
+    def _expires_at(download_info: dict):
+        # 以各链接中最早的 deadline 为准
+        now = time.time()
+        deadlines = []
+
+        for entry in download_info.get("download_list", {}).values():
+            for url in [entry.get("url"), *(entry.get("url_list") or [])]:
+                if not url:
+                    continue
+
+                for value in parse_qs(urlsplit(url).query).get("deadline", []):
+                    if value.isdigit():
+                        deadlines.append(int(value))
+
+        if not deadlines:
+            return now + DEFAULT_TTL
+
+        return min(min(deadlines) - DEADLINE_MARGIN, now + MAX_TTL)
+
+    @classmethod
+    def _get_executor(cls):
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers = PREFETCH_WORKERS, thread_name_prefix = "playurl-prefetch")
+
+            return cls._executor
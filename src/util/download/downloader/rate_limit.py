@@ -0,0 +1,338 @@
+from ...common.config import config
+
+from threading import Event, Lock
+import logging
+import time
+import re
+
+logger = logging.getLogger(__name__)
+
+# 用户指定优先的任务分得的带宽权重，其余任务为 1
+PRIORITY_WEIGHT = 4
+
+# 最近这么久内有过下载的任务才参与分配带宽，暂停、排队、合并中的任务让出自己的份额
+ACTIVE_WINDOW = 2.0
+
+# 限速规则（设置、时间段、参与分配的任务）的刷新间隔，改动设置后最迟这么久生效
+REFRESH_INTERVAL = 1.0
+
+# 用不满份额的任务（节点慢、分片之间的空档）只保留实测速率再加这么多余量，
+# 其余额度让给别的任务；余量让它在条件好转时能逐步提速
+SHARE_HEADROOM = 1.25
+
+SCHEDULE_PATTERN = re.compile(r"(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*=\s*(\d+(?:\.\d+)?)")
+
+class TokenBucket:
+    """线程安全的令牌桶，用于平滑限制下载速度"""
+    def __init__(self, rate: float):
+        """
+        :param rate: 令牌产生速率（字节/秒），若为0则不限速
+        """
+        self.rate = rate
+        self.tokens = rate
+        self.last_update = time.monotonic()
+        self.lock = Lock()
+
+    def reserve(self, amount: int) -> float:
+        """
+        取走 amount 个令牌，返回调用方需要等待的秒数
+
+        不在这里休眠，异步下载引擎据此 await asyncio.sleep，不会阻塞事件循环
+        """
+        if self.rate <= 0:
+            return 0
+
+        sleep_time = 0
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.last_update
+            self.last_update = now
+
+            self.tokens += elapsed * self.rate
+            if self.tokens > self.rate:
+                self.tokens = self.rate
+
+            self.tokens -= amount
+            if self.tokens < 0:
+                sleep_time = -self.tokens / self.rate
+
+        return sleep_time
+
+    def consume(self, amount: int, stop_event: Event = None):
+        sleep_time = self.reserve(amount)
+
+        if sleep_time > 0:
+            # 分段休眠，防止阻塞暂停信号
+            while sleep_time > 0:
+                if stop_event and stop_event.is_set():
+                    break
+                s = min(0.1, sleep_time)
+                time.sleep(s)
+                sleep_time -= s
+
+    def set_rate(self, rate: float):
+        with self.lock:
+            if rate == self.rate:
+                return
+
+            # 运行中调整速率时保留已有的令牌（不超过新的上限），
+            # 否则每次刷新都会放出一整秒的突发流量
+            now = time.monotonic()
+
+            if self.rate > 0:
+                self.tokens = min(self.tokens + (now - self.last_update) * self.rate, self.rate)
+            else:
+                self.tokens = rate
+
+            self.rate = rate
+            self.tokens = min(self.tokens, rate)
+            self.last_update = now
+
+class TaskTokenBucket(TokenBucket):
+    """
+    单个任务的令牌桶
+
+    速率是 RateLimiter 分给本任务的份额。全局令牌桶是唯一的硬上限：只有全局额度
+    已经透支、各任务在争抢时，才按本任务的份额额外等待；全局额度有富余时不受份额约束，
+    总速度不会因为某个任务用不满份额而低于设置的限速。对 ChunkWorker 而言接口与 TokenBucket 完全一致
+    """
+    def __init__(self, task_id: str):
+        super().__init__(0)
+
+        self.task_id = task_id
+        self.last_active = 0.0
+
+        # 上次刷新以来取走的字节数，RateLimiter 据此估计本任务实际能跑多快
+        self.received = 0
+        self.measured_since = time.monotonic()
+
+    def reserve(self, amount: int) -> float:
+        with self.lock:
+            self.received += amount
+
+        wait = RateLimiter.reserve(self, amount)
+
+        if wait > 0 and self.rate > 0:
+            wait = max(super().reserve(amount), wait)
+
+        # 被限速而长时间等待的任务仍算作在下载，否则它会在等待期间让出份额，
+        # 各任务的速率随之来回抖动
+        self.last_active = time.monotonic() + wait
+
+        return wait
+
+    def take_measured_rate(self, now: float) -> float:
+        """
+        返回上次调用以来的实测速率（字节/秒）并重新开始计数
+
+        参与分配还不到一个刷新间隔的任务尚无可靠的测量，返回 None，按需求不受限处理
+        """
+        with self.lock:
+            elapsed = now - self.measured_since
+            received = self.received
+
+            self.received = 0
+            self.measured_since = now
+
+        if elapsed < REFRESH_INTERVAL / 2:
+            return None
+
+        return received / elapsed
+
+class RateSchedule:
+    @staticmethod
+    def parse(text: str) -> list[tuple[int, int, float]]:
+        """
+        解析分时段限速规则，返回 [(开始分钟, 结束分钟, 速率 MB/s)]
+
+        格式为逗号或换行分隔的「HH:MM-HH:MM=速率」，例如 "08:00-23:00=2, 23:00-08:00=0"，
+        结束时间早于开始时间表示跨过午夜，速率为 0 表示不限速。无法识别的条目忽略
+        """
+        rules = []
+
+        for item in RateSchedule._split(text):
+            rule = RateSchedule._parse_item(item)
+
+            if rule is None:
+                logger.warning("无法识别的分时段限速规则：%s", item)
+                continue
+
+            rules.append(rule)
+
+        return rules
+
+    @staticmethod
+    def is_valid(text: str) -> bool:
+        return all(RateSchedule._parse_item(item) is not None for item in RateSchedule._split(text))
+
+    @staticmethod
+    def _split(text: str) -> list[str]:
+        return [item.strip() for item in re.split(r"[,;\n]", text or "") if item.strip()]
+
+    @staticmethod
+    def _parse_item(item: str):
+        match = SCHEDULE_PATTERN.fullmatch(item)
+
+        if not match:
+            return None
+
+        start_hour, start_minute, end_hour, end_minute = (int(value) for value in match.groups()[:4])
+
+        if start_hour > 24 or end_hour > 24 or start_minute > 59 or end_minute > 59:
+            return None
+
+        return start_hour * 60 + start_minute, end_hour * 60 + end_minute, float(match.group(5))
+
+    @staticmethod
+    def get_rate(rules: list[tuple[int, int, float]], minutes: int):
+        # 返回当前时刻命中的第一条规则的速率（MB/s），都不命中时返回 None
+        for start, end, rate in rules:
+            if start <= end:
+                matched = start <= minutes < end
+            else:
+                matched = minutes >= start or minutes < end
+
+            if matched:
+                return rate
+
+        return None
+
+class RateLimiter:
+    """
+    进程级的分层限速
+
+    全部任务共用一个全局令牌桶，总速度不超过设置的限速（原先每个任务各自限速，
+    5 个任务同时下载就是 5 倍）。全局额度争抢时按权重分给正在下载的任务，
+    用户指定优先的任务分得更多；用不满份额的任务按实测速率让出多余的额度。
+    限速设置、分时段规则、优先任务的改动都在下一次刷新时生效，无需重新开始下载
+    """
+    _lock = Lock()
+    _global = TokenBucket(0)
+    _active: set[TaskTokenBucket] = set()
+    _prioritized: set[str] = set()
+    _last_refresh = 0.0
+
+    # 分时段规则按原文缓存，设置没有变化时不必每次刷新都重新解析
+    _schedule_text = ""
+    _schedule_rules: list[tuple[int, int, float]] = []
+
+    @classmethod
+    def create_bucket(cls, task_id: str) -> TaskTokenBucket:
+        return TaskTokenBucket(task_id)
+
+    @classmethod
+    def set_prioritized(cls, task_id: str, prioritized: bool):
+        with cls._lock:
+            if prioritized:
+                cls._prioritized.add(task_id)
+            else:
+                cls._prioritized.discard(task_id)
+
+            # 下一次取令牌时立即按新的权重重新分配
+            cls._last_refresh = 0.0
+
+    @classmethod
+    def is_prioritized(cls, task_id: str) -> bool:
+        with cls._lock:
+            return task_id in cls._prioritized
+
+    @classmethod
+    def reserve(cls, bucket: TaskTokenBucket, amount: int) -> float:
+        now = time.monotonic()
+
+        # 绝大多数读取只走到这里：规则未到刷新时间、任务已在参与分配，无需加锁
+        if bucket not in cls._active or now - cls._last_refresh >= REFRESH_INTERVAL:
+            with cls._lock:
+                bucket.last_active = max(bucket.last_active, now)
+
+                cls._active.add(bucket)
+                cls._refresh(now)
+
+        return cls._global.reserve(amount)
+
+    @classmethod
+    def _refresh(cls, now: float):
+        # 调用方需持有 _lock
+        cls._last_refresh = now
+
+        rate = cls._get_configured_rate()
+
+        cls._global.set_rate(rate)
+
+        cls._active = {bucket for bucket in cls._active if now - bucket.last_active <= ACTIVE_WINDOW}
+
+        weights = {bucket: PRIORITY_WEIGHT if bucket.task_id in cls._prioritized else 1 for bucket in cls._active}
+        demands = {bucket: bucket.take_measured_rate(now) for bucket in cls._active}
+
+        shares = cls._allocate(rate, weights, demands) if rate > 0 else {}
+
+        for bucket in cls._active:
+            bucket.set_rate(shares.get(bucket, 0))
+
+    @staticmethod
+    def _allocate(rate: float, weights: dict[TaskTokenBucket, int], demands: dict[TaskTokenBucket, float]) -> dict[TaskTokenBucket, float]:
+        """
+        按权重做注水式分配：实测速率（加余量）低于按权重应得份额的任务只拿到它用得了的部分，
+        省下的额度在其余任务之间按权重再分，直到剩下的任务都用得满自己的份额
+
+        :param rate: 全局限速（字节/秒）
+        :param weights: 各任务的权重
+        :param demands: 各任务的实测速率，None 表示尚无测量、需求不受限
+        """
+        shares = {}
+        pending = dict(weights)
+        remaining = rate
+
+        while pending:
+            total = sum(pending.values())
+
+            satisfied = [
+                bucket for bucket, weight in pending.items()
+                if demands[bucket] is not None and demands[bucket] * SHARE_HEADROOM < remaining * weight / total
+            ]
+
+            if not satisfied:
+                for bucket, weight in pending.items():
+                    shares[bucket] = remaining * weight / total
+
+                return shares
+
+            for bucket in satisfied:
+                shares[bucket] = demands[bucket] * SHARE_HEADROOM
+                remaining -= shares[bucket]
+
+                del pending[bucket]
+
+        # 所有任务都用不满份额，剩下的额度仍按权重分出去，份额只会比实测速率更宽松
+        total = sum(weights.values())
+
+        for bucket, weight in weights.items():
+            shares[bucket] += remaining * weight / total
+
+        return shares
+
+    @classmethod
+    def _get_configured_rate(cls) -> float:
+        # 当前生效的全局限速（字节/秒），0 为不限速。调用方需持有 _lock
+        if not config.get(config.speed_limit_enabled):
+            return 0
+
+        rate = config.get(config.speed_limit_rate)
+
+        schedule_text = config.get(config.speed_limit_schedule)
+
+        if schedule_text != cls._schedule_text:
+            cls._schedule_text = schedule_text
+            cls._schedule_rules = RateSchedule.parse(schedule_text)
+
+        rules = cls._schedule_rules
+
+        if rules:
+            local_time = time.localtime()
+
+            scheduled = RateSchedule.get_rate(rules, local_time.tm_hour * 60 + local_time.tm_min)
+
+            if scheduled is not None:
+                rate = scheduled
+
+        return max(rate, 0) * 1024 * 1024
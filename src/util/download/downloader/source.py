@@ -0,0 +1,136 @@
+from ...network.cdn import CDN, HostHealth
+
+from threading import Lock
+import random
+
+# 单个文件最多同时从这么多个节点取数据。节点再多，分到每个节点的分片就太少，
+# 测出的吞吐量没有参考价值，反而会让慢节点分到与快节点差不多的份额
+MAX_SOURCE_HOSTS = 4
+
+# 吞吐量滑动平均的权重
+EWMA_WEIGHT = 0.3
+
+# 尚无测速数据的节点按已知节点的平均吞吐量计权，保证它能分到分片、测出自己的速度
+MIN_WEIGHT = 1.0
+
+class SourceMismatchError(RuntimeError):
+    # 备用节点返回的文件与首选节点对不上（大小不同），该节点的数据不可用
+    pass
+
+class DownloadSource:
+    def __init__(self, url: str):
+        self.url = url
+        self.host = CDN.get_netloc(url)
+        self.rate = 0.0
+        self.disabled = False
+
+class SourcePool:
+    """
+    单个文件的下载来源
+
+    解析阶段只探测出一个可用节点，playurl 返回的 backup_url 与替换出的其他 CDN 节点
+    也指向同一个文件。多节点模式下各分片按节点的实测吞吐量加权选取来源，
+    某个节点出错时将其停用并降权（HostHealth），分片在重试时改从其余节点续传剩余部分。
+    只有一个来源时行为与原先完全一致。
+    """
+    def __init__(self, url_list: list[str], file_size: int = 0):
+        self.file_size = file_size
+        self.lock = Lock()
+
+        self.sources: list[DownloadSource] = []
+        hosts = set()
+
+        for url in url_list:
+            source = DownloadSource(url)
+
+            if not url or source.host in hosts:
+                continue
+
+            hosts.add(source.host)
+            self.sources.append(source)
+
+            if len(self.sources) >= MAX_SOURCE_HOSTS:
+                break
+
+    @property
+    def is_multiple(self) -> bool:
+        return len(self.sources) > 1
+
+    def pick(self) -> str:
+        with self.lock:
+            active = [source for source in self.sources if not source.disabled]
+
+            if not active:
+                # 全部停用时退回首选节点，由分片自身的重试次数兜底
+                return self.sources[0].url if self.sources else ""
+
+            if len(active) == 1:
+                return active[0].url
+
+            known = [source.rate for source in active if source.rate > 0]
+            default_weight = sum(known) / len(known) if known else MIN_WEIGHT
+
+            weights = [source.rate if source.rate > 0 else default_weight for source in active]
+
+            return random.choices(active, weights = weights)[0].url
+
+    def report_success(self, url: str, size: int, elapsed: float):
+        if size <= 0 or elapsed <= 0:
+            return
+
+        rate = size / elapsed
+
+        with self.lock:
+            source = self._find(url)
+
+            if source is None:
+                return
+
+            source.rate = rate if source.rate <= 0 else source.rate * (1 - EWMA_WEIGHT) + rate * EWMA_WEIGHT
+
+        if self.is_multiple:
+            HostHealth.report_success(source.host)
+
+    def report_failure(self, url: str) -> bool:
+        """
+        停用出错的节点，返回是否还有其他节点可以接手
+
+        单节点时不做任何处理，保持原有的重试逻辑
+        """
+        if not self.is_multiple:
+            return False
+
+        with self.lock:
+            source = self._find(url)
+
+            if source is None or source.disabled:
+                return any(not entry.disabled for entry in self.sources)
+
+            remaining = [entry for entry in self.sources if not entry.disabled and entry is not source]
+
+            if not remaining:
+                # 最后一个可用节点不停用，交给分片的常规重试
+                return False
+
+            source.disabled = True
+
+        HostHealth.report_failure(source.host)
+
+        return True
+
+    def check_content_range(self, headers):
+        # 备用节点没有经过探测，核对一下返回的文件总大小，防止把别的文件的数据拼进来
+        if not self.is_multiple or self.file_size <= 0:
+            return
+
+        total = headers.get("Content-Range", "").rpartition("/")[2].strip()
+
+        if total.isdigit() and int(total) != self.file_size:
+            raise SourceMismatchError("节点返回的文件大小不一致（{total} != {size}）".format(total = total, size = self.file_size))
+
+    def _find(self, url: str):
+        for source in self.sources:
+            if source.url == url:
+                return source
+
+        return None
@@ -0,0 +1,262 @@
+from PySide6.QtCore import QObject, Signal
+
+from ...common.enum import DownloadType
+from ...common.config import config
+from ...common.io.file import safe_remove
+from ..task.options import resolve
+from ..task.info import TaskInfo
+
+from ...ffmpeg.command import FFmpegCommand
+from ...ffmpeg.runner import FFmpegRunner
+
+from typing import Callable
+from threading import Event
+from pathlib import Path
+import logging
+import struct
+
+logger = logging.getLogger(__name__)
+
+class ContiguousFileReader:
+    """
+    边下载边读取文件，只交出从文件开头起连续、且已确认写入的部分
+
+    分片乱序完成，文件又可能是预分配的，读到文件末尾并不代表数据已经就绪，
+    因此可读范围一律以 get_available 返回的连续长度为准，没有新数据时轮询等待
+    """
+    block_size = 1024 * 1024
+    poll_interval = 0.2
+
+    # 文件头这么长的范围内仍找不到 moov，就认为它不能按顺序读取
+    probe_limit = 16 * 1024 * 1024
+
+    def __init__(self, path: Path, file_size: int, get_available: Callable[[], int]):
+        self.path = path
+        self.file_size = file_size
+        self.get_available = get_available
+
+        self.stop_event = Event()
+        self.unsupported = False
+
+    def stop(self):
+        self.stop_event.set()
+
+    def __iter__(self):
+        position = 0
+        file = None
+
+        try:
+            while not self.stop_event.is_set():
+                available = min(self.get_available(), self.file_size)
+
+                if available > position:
+                    if file is None:
+                        # 不能用带缓冲的读取：预读会越过可读范围，把尚未写入的内容（预分配的零）
+                        # 缓存下来，之后再读到这一段时拿到的仍是旧数据
+                        file = open(self.path, "rb", buffering = 0)
+
+                    if position == 0:
+                        streamable = self.find_moov(file, available)
+
+                        if streamable is False:
+                            # 直接结束输入，FFmpeg 读不到有效数据会报错退出，由调用方改回下载完成后合并
+                            self.unsupported = True
+                            return
+
+                        if streamable is None:
+                            self.stop_event.wait(self.poll_interval)
+                            continue
+
+                    file.seek(position)
+
+                    data = file.read(min(self.block_size, available - position))
+
+                    if not data:
+                        break
+
+                    position += len(data)
+
+                    yield data
+
+                elif position >= self.file_size:
+                    return
+
+                else:
+                    self.stop_event.wait(self.poll_interval)
+
+        finally:
+            if file is not None:
+                file.close()
+
+    def find_moov(self, file, available: int):
+        """
+        判断 MP4 能否按顺序读取：moov 必须出现在第一个 mdat / moof 之前
+
+        DASH 的 m4s 是分段 MP4，moov 位于开头；moov 在末尾的文件必须跳转读取，无法通过管道输入。
+        返回 True / False，已下载的部分还不足以判断时返回 None
+        """
+        offset = 0
+
+        while offset + 8 <= available:
+            file.seek(offset)
+            header = file.read(16)
+
+            size, box_type = struct.unpack(">I4s", header[:8])
+
+            if box_type == b"moov":
+                return True
+
+            if box_type in (b"mdat", b"moof"):
+                return False
+
+            if size == 1:
+                # 64 位的 largesize 紧跟在类型之后
+                if offset + 16 > available:
+                    return None
+
+                size = struct.unpack(">Q", header[8:16])[0]
+
+            if size < 8:
+                # size 为 0 表示该 box 一直延续到文件末尾，后面不会再有 moov
+                return False
+
+            offset += size
+
+            if offset > self.probe_limit:
+                return False
+
+        return None
+
+class StreamMerger(QObject):
+    """
+    边下载边合并音视频
+
+    只剩最后一路流在下载时启动 FFmpeg：已下载完成的那一路直接按文件读取，
+    仍在下载的这一路经由 ContiguousFileReader 从 stdin 边下边送。
+    FFmpeg 只做 copy 封装，速度远高于下载，最后一个字节到达后几秒内即可完成合并。
+
+    结果只是 Merger 的临时输出文件，重命名、删除中间文件等收尾仍交给 Merger
+    """
+    finished_signal = Signal(bool)  # 是否成功
+
+    def __init__(self, task_info: TaskInfo, parent = None):
+        super().__init__(parent)
+
+        self.task_info = task_info
+        self.reader: ContiguousFileReader = None
+        self.succeeded = False
+        self.failed = False
+
+        self._stopped = False
+        self._ffmpeg_runner = None
+
+    @staticmethod
+    def is_supported(task_info: TaskInfo):
+        if not config.get(config.stream_merge) or not task_info.Download.merge_video_audio:
+            return False
+
+        # 封面、弹幕与字幕轨要等附加内容下载完成才有，那时输出文件早已开始写入。
+        # 章节只有少数视频才有，不在这里排除，届时由 Merger 改回完整合并
+        if task_info.Download.type & DownloadType.COVER != 0 and resolve(task_info, "attach_cover"):
+            return False
+
+        if task_info.File.merge_file_ext == "mkv":
+            if task_info.Download.type & DownloadType.DANMAKU != 0 and resolve(task_info, "embed_danmaku"):
+                return False
+
+            if task_info.Download.type & DownloadType.SUBTITLE != 0 and resolve(task_info, "embed_subtitle"):
+                return False
+
+        return True
+
+    def start(self, cwd: Path, video_file_name: str, audio_file_name: str, stream_audio: bool, file_size: int, get_available: Callable[[], int]):
+        stream_file_name = audio_file_name if stream_audio else video_file_name
+
+        self.reader = ContiguousFileReader(Path(cwd, stream_file_name), file_size, get_available)
+
+        command = FFmpegCommand.merge_video_audio(
+            video_path = video_file_name if stream_audio else "pipe:0",
+            audio_path = "pipe:0" if stream_audio else audio_file_name,
+            output_path = self.output_file_name
+        )
+
+        self._ffmpeg_runner = FFmpegRunner.from_command(command, parent = self)
+        self._ffmpeg_runner.set_cwd(cwd)
+        self._ffmpeg_runner.set_stdin_source(self.reader)
+        self._ffmpeg_runner.finished_signal.connect(self.on_finished)
+        self._ffmpeg_runner.error_signal.connect(self.on_error)
+        self._ffmpeg_runner.start()
+
+    def stop(self, timeout: int = 3000):
+        """
+        终止合并并等待 FFmpeg 线程退出，未完成的输出文件随之删除
+
+        与 Merger.stop 一样，销毁本对象之前必须先把线程收干净
+        """
+        self._stopped = True
+
+        if self.reader is not None:
+            self.reader.stop()
+
+        runner = self._ffmpeg_runner
+        exited = True
+
+        if runner is not None:
+            try:
+                if runner.isRunning():
+                    exited = runner.stop(timeout)
+
+            except RuntimeError:
+                # C++ 侧已经析构，无需再处理
+                pass
+
+        if not self.succeeded and exited:
+            self.remove_output_file()
+
+        return exited
+
+    def is_running(self):
+        return self._ffmpeg_runner is not None and not (self.succeeded or self.failed or self._stopped)
+
+    def on_finished(self, return_code: int, stdout: str, stderr: str):
+        if self._stopped:
+            return
+
+        self.succeeded = True
+
+        self.finished_signal.emit(True)
+
+    def on_error(self, error: Exception, stdout: str, stderr: str):
+        # 主动终止 FFmpeg 必然带回一个非零返回码，不算合并失败
+        if self._stopped:
+            return
+
+        self.failed = True
+
+        if self.reader is not None and self.reader.unsupported:
+            logger.info("%s 不能按顺序读取，改为下载完成后合并", self.reader.path.name)
+        else:
+            logger.warning("边下载边合并失败，改为下载完成后合并: %s\n%s", error, stderr)
+
+        self.remove_output_file()
+
+        self.finished_signal.emit(False)
+
+    def remove_output_file(self):
+        try:
+            safe_remove(self.get_cwd(), self.output_file_name)
+
+        except Exception:
+            # 删除失败也无妨，之后的完整合并会覆盖该文件
+            pass
+
+    def get_cwd(self):
+        return Path(self.task_info.File.download_path, self.task_info.File.folder)
+
+    @property
+    def output_file_name(self):
+        # 与 Merger.temp_output_file_name 一致，Merger 据此直接接手输出文件
+        return "output_{task_id}.{file_ext}".format(
+            task_id = self.task_info.Basic.task_id,
+            file_ext = self.task_info.File.merge_file_ext
+        )
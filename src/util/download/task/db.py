@@ -3,25 +3,125 @@ from ...common.config import appdata_path, config
 from ...common.timestamp import get_timestamp
 from ...common.database import Database
 from .hash_id import calc_hash_id, HASH_ID_VERSION
-from .info import TaskInfo
+from .journal import ProgressJournal, ProgressDelta
+from .info import TaskInfo, COLD_SECTIONS
 
+from collections import Counter
+from dataclasses import dataclass
+from threading import Lock
 from pathlib import Path
-from typing import List
+from typing import List, NamedTuple
 import logging
+import sqlite3
 
 logger = logging.getLogger(__name__)
 
+# 单独成列、原地更新的进度字段
+HOT_DOWNLOAD_FIELDS = ("status", "progress", "total_size", "downloaded_size")
+
+# 不落盘的字段：速度只在下载过程中有意义，重启后本就该从 0 开始
+TRANSIENT_DOWNLOAD_FIELDS = ("speed", )
+
+# 下载中、已完成两张表除时间列之外的列，顺序即 TaskRecord.row 的顺序
+TASK_COLUMNS = ("task_id", "hash_id", "cover_id", "title", "created_time", "completed_time", "status", "progress", "total_size", "downloaded_size", "download", "data")
+
+# 列表可按这些键排序，分页读取时按对应的列排序，与界面上的顺序一致
+SORT_COLUMNS = {
+    "created_time": '"created_time"',
+    "completed_time": '"completed_time"',
+    "show_title": '"title" COLLATE CASEFOLD',
+    "file_size": '"total_size"',
+    "progress": '"progress"'
+}
+
+# 进度日志超过这个大小就并入主表，启动时重放的量也就以此为限
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+# SQLITE_MAX_VARIABLE_NUMBER 默认下限为 999，IN (...) 查询分批进行
+BATCH_SIZE = 500
+
+def _casefold_collation(left: str, right: str) -> int:
+    # 标题按 str.casefold 比较，与列表模型的排序一致。SQLite 自带的 NOCASE 只忽略 ASCII 字母的大小写，
+    # 带重音的拉丁字母等会排到别处，后面的页插进列表时就会落到已经翻过的行上方
+    left, right = left.casefold(), right.casefold()
+
+    return (left > right) - (left < right)
+
+class TaskRecord(NamedTuple):
+    # 一条待写入的任务记录，在调用方线程上组装
+    row: tuple
+    # 分片断点：(task_id, file_key, chunk_index, offset)
+    chunks: list[tuple]
+
+    @property
+    def task_id(self) -> str:
+        return self.row[0]
+
+class TaskState(NamedTuple):
+    # 一次进度快照，只包含会在下载过程中变化的部分
+    task_id: str
+    status: int
+    progress: int
+    total_size: int
+    downloaded_size: int
+    # Download 其余字段的 JSON（不含分片断点）
+    download: str
+    # 冷数据的 JSON，冷数据尚未展开（因而不可能被改动过）时为 None
+    data: str | None
+    # {(file_key, chunk_index): offset}
+    offsets: dict[tuple[str, int], int]
+
+@dataclass
+class WrittenState:
+    download: str = None
+    data: str = None
+    offsets: dict[tuple[str, int], int] = None
+
 class TaskDatabase(Database):
+    """
+    下载任务数据库
+
+    每个任务的 TaskInfo 拆成三部分存放：
+
+    - 状态、进度、已下载大小等高频变化的字段单独成列，原地 UPDATE
+    - 分片断点放在 download_chunk 表，每个分片一行，只写有变化的那几行
+    - File、Episode、Options 等冷数据仍是一个 JSON（data 列），内容没有变化时不重写，
+      读出时也先不解析，由 TaskInfo 在首次访问时展开
+
+    原先每次进度快照都要把整个 TaskInfo（包括越来越大的 chunk_offsets）重新序列化、整列重写，
+    启动时也要把每一行完整反序列化一遍
+
+    只有进度与分片断点变化的快照先追加到进度日志（task.journal），攒到一定大小，
+    或者遇到结构性的变化、删除任务时再一并写入上述各列，见 journal_task_states
+    """
     def __init__(self):
         super().__init__()
 
         self.path = Path(appdata_path) / "Bili23 Downloader" / "task.db"
         self.path.parent.mkdir(parents = True, exist_ok = True)
 
+        # 每个任务最近一次落盘的内容，只在写线程上读写，据此跳过没有变化的列与分片
+        self._written: dict[str, WrittenState] = {}
+
+        # 已追加到进度日志、尚未并入主表的最新快照，同样只在写线程上读写
+        self._journaled: dict[str, TaskState] = {}
+
+        self.journal = ProgressJournal(self.path.with_name("task.journal"))
+
+        # 两张表里全部 hash_id 的计数，供重复下载判定，首次使用时才建立，见 check_duplicates。
+        # 允许重复下载时同一个 hash_id 可能有多条记录，所以计数而不是集合
+        self._hash_index: Counter | None = None
+        self._hash_index_lock = Lock()
+
         self.check_and_create_table()
 
         self._check_should_upgrade()
 
+        self._replay_journal()
+
+    def _on_connect(self, conn: sqlite3.Connection):
+        conn.create_collation("CASEFOLD", _casefold_collation)
+
     def _check_should_upgrade(self):
         # 配置版本与任务数据库版本并不等价。始终检查实际表结构，
         # 避免配置升级成功但数据库迁移失败后永久跳过迁移。
@@ -59,7 +159,7 @@ class TaskDatabase(Database):
         self.set_user_version(HASH_ID_VERSION)
 
     def _rehash_all(self):
-        # data 列中保存着完整的 task_info，可据此重算 hash_id，无需用户重新下载
+        # data 列中保存着 Episode，可据此重算 hash_id，无需用户重新下载
         for table_name in ("download_task", "completed_task"):
             updates = []
 
@@ -67,6 +167,7 @@ class TaskDatabase(Database):
                 try:
                     task_info = TaskInfo()
                     task_info.from_dict(json_loads(data))
+                    task_info.Basic.task_id = task_id
 
                 except Exception:
                     # 单条记录损坏时跳过，不影响其余记录的重算
@@ -82,12 +183,10 @@ class TaskDatabase(Database):
                 logger.info("已重算 %s 表中 %d 条记录的 hash_id", table_name, len(updates))
 
     def _needs_upgrade(self):
-        required_columns = {"task_id", "hash_id", "cover_id", "title", "data"}
-
         for table_name in ("download_task", "completed_task"):
             column_names = self._get_table_columns(table_name)
 
-            if not required_columns.issubset(column_names):
+            if not set(TASK_COLUMNS).issubset(column_names):
                 return True
 
         return False
@@ -97,29 +196,41 @@ class TaskDatabase(Database):
 
         return {row[1] for row in result}
 
-    def check_and_create_table(self):
-        self.execute_script("""
-            PRAGMA journal_mode = WAL;
-            CREATE TABLE IF NOT EXISTS "download_task" (
+    @staticmethod
+    def _create_table_sql(table_name: str, if_not_exists: bool = True):
+        return f"""
+            CREATE TABLE {"IF NOT EXISTS " if if_not_exists else ""}"{table_name}" (
                 "id"	INTEGER UNIQUE,
                 "task_id"	TEXT UNIQUE,
                 "hash_id"   TEXT,
                 "cover_id"	TEXT,
                 "title"	TEXT,
                 "created_time"	INTEGER,
-                "data"	TEXT,
-                PRIMARY KEY("id" AUTOINCREMENT)
-            );
-            CREATE TABLE IF NOT EXISTS "completed_task" (
-                "id"	INTEGER UNIQUE,
-                "task_id"	TEXT UNIQUE,
-                "hash_id"   TEXT,
-                "cover_id"	TEXT,
-                "title"	TEXT,
                 "completed_time"	INTEGER,
+                "status"	INTEGER,
+                "progress"	INTEGER,
+                "total_size"	INTEGER,
+                "downloaded_size"	INTEGER,
+                "download"	TEXT,
                 "data"	TEXT,
                 PRIMARY KEY("id" AUTOINCREMENT)
             );
+            """
+
+    def check_and_create_table(self):
+        self.execute_script("PRAGMA journal_mode = WAL;" + self._create_table_sql("download_task") + self._create_table_sql("completed_task") + """
+            CREATE TABLE IF NOT EXISTS "download_chunk" (
+                "task_id"	TEXT,
+                "file_key"	TEXT,
+                "chunk_index"	INTEGER,
+                "offset"	INTEGER,
+                PRIMARY KEY("task_id", "file_key", "chunk_index")
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS "task_journal" (
+                "id"	INTEGER PRIMARY KEY CHECK ("id" = 0),
+                "generation"	INTEGER
+            );
+            INSERT OR IGNORE INTO "task_journal" ("id", "generation") VALUES (0, 0);
             """)
 
         # 旧版表可能还没有 hash_id，不能在迁移前直接创建索引。
@@ -131,33 +242,124 @@ class TaskDatabase(Database):
 
         # 按时间倒序取最近若干条是列表查询的固定形态，没有索引时 SQLite 要全表扫加排序。
         # 索引不改变数据本身，CREATE INDEX IF NOT EXISTS 是幂等的，无需递增表结构版本
-        self.execute_script("""
-            CREATE INDEX IF NOT EXISTS "idx_download_task_created_time" ON "download_task" ("created_time");
-            CREATE INDEX IF NOT EXISTS "idx_completed_task_completed_time" ON "completed_task" ("completed_time");
-            """)
+        if "completed_time" in self._get_table_columns("completed_task"):
+            self.execute_script("""
+                CREATE INDEX IF NOT EXISTS "idx_download_task_created_time" ON "download_task" ("created_time");
+                CREATE INDEX IF NOT EXISTS "idx_completed_task_completed_time" ON "completed_task" ("completed_time");
+                """)
 
-    def query_tasks(self, completed: bool = False, limit: int = None):
+    def query_tasks(self, completed: bool = False, limit: int = None) -> List[TaskInfo]:
         """
         读取任务记录
 
         limit 为空时返回全部（界面启动时要恢复整个列表）。传入 limit 则按时间
         倒序只取最近的若干条 —— 已完成的任务是长期累积的，调用方只要最近几条时
-        不该把几百条 JSON 全反序列化一遍。
+        不该把几百条记录全读一遍。冷数据一律推迟到首次访问时再解析
         """
         table, order_column = ("completed_task", "completed_time") if completed else ("download_task", "created_time")
 
+        columns = ", ".join(f'"{column}"' for column in TASK_COLUMNS)
+
         if limit is None:
-            return self.query(f'SELECT data FROM "{table}"')
+            rows = self.query(f'SELECT {columns} FROM "{table}"')
+        else:
+            rows = self.query(f'SELECT {columns} FROM "{table}" ORDER BY "{order_column}" DESC LIMIT ?', (limit,))
 
-        return self.query(
-            f'SELECT data FROM "{table}" ORDER BY "{order_column}" DESC LIMIT ?', (limit,)
-        )
+        return self._to_task_info_list(rows, completed, whole_table = limit is None)
+
+    def query_task_page(self, completed: bool, sort_key: str, ascending: bool, cursor: tuple = None, limit: int = 200):
+        """
+        按排序键分页读取，返回 (任务列表, 下一页的游标)
+
+        游标为上一页最后一行的 (排序值, id)，下一页从它之后接着取（keyset 分页）。
+        不用 OFFSET：翻到后面时 OFFSET 要从头数过所有跳过的行，
+        而且两次翻页之间有任务增删时，按偏移取会重复或漏掉记录
+        """
+        table = "completed_task" if completed else "download_task"
+        order_column = SORT_COLUMNS.get(sort_key, '"completed_time"' if completed else '"created_time"')
+        direction, operator = ("ASC", ">") if ascending else ("DESC", "<")
+
+        columns = ", ".join(f'"{column}"' for column in TASK_COLUMNS)
 
-    def query_task_by_id(self, task_id: str, completed: bool = False):
+        sql = f'SELECT {columns}, {order_column.split()[0]}, "id" FROM "{table}"'
+        params = ()
+
+        if cursor is not None:
+            sql += f' WHERE ({order_column}, "id") {operator} (?, ?)'
+            params = tuple(cursor)
+
+        sql += f' ORDER BY {order_column} {direction}, "id" {direction} LIMIT ?'
+
+        rows = self.query(sql, params + (limit,))
+
+        next_cursor = tuple(rows[-1][-2:]) if rows else cursor
+
+        return self._to_task_info_list([row[:-2] for row in rows], completed), next_cursor
+
+    def query_task_by_id(self, task_id: str, completed: bool = False) -> List[TaskInfo]:
         """按 task_id 直接取一条，task_id 上有 UNIQUE 约束，不必扫全表"""
         table = "completed_task" if completed else "download_task"
 
-        return self.query(f'SELECT data FROM "{table}" WHERE "task_id" = ?', (task_id,))
+        columns = ", ".join(f'"{column}"' for column in TASK_COLUMNS)
+
+        rows = self.query(f'SELECT {columns} FROM "{table}" WHERE "task_id" = ?', (task_id,))
+
+        return self._to_task_info_list(rows, completed)
+
+    def _to_task_info_list(self, rows: list[tuple], completed: bool, whole_table: bool = False):
+        offsets = {} if completed else self._query_chunk_offsets([row[0] for row in rows], whole_table)
+
+        return [self._to_task_info(row, offsets.get(row[0], {})) for row in rows]
+
+    def _query_chunk_offsets(self, task_id_list: List[str], whole_table: bool = False):
+        # 返回 {task_id: {file_key: {str(chunk_index): offset}}}，与 Download.files 中 chunk_offsets 的结构一致
+        if whole_table:
+            rows = self.query('SELECT task_id, file_key, chunk_index, "offset" FROM download_chunk')
+        else:
+            rows = []
+
+            for index in range(0, len(task_id_list), BATCH_SIZE):
+                batch = task_id_list[index:index + BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+
+                rows += self.query(f'SELECT task_id, file_key, chunk_index, "offset" FROM download_chunk WHERE task_id IN ({placeholders})', tuple(batch))
+
+        offsets = {}
+
+        for task_id, file_key, chunk_index, offset in rows:
+            offsets.setdefault(task_id, {}).setdefault(file_key, {})[str(chunk_index)] = offset
+
+        return offsets
+
+    @staticmethod
+    def _to_task_info(row: tuple, offsets: dict) -> TaskInfo:
+        task_id, hash_id, cover_id, title, created_time, completed_time, status, progress, total_size, downloaded_size, download, data = row
+
+        task_info = TaskInfo()
+
+        task_info.Basic.task_id = task_id
+        task_info.Basic.cover_id = cover_id
+        task_info.Basic.show_title = title
+        task_info.Basic.created_time = created_time or 0
+        task_info.Basic.completed_time = completed_time or 0
+
+        if download:
+            task_info.Download.from_dict(json_loads(download))
+
+        task_info.Download.status = status or 0
+        task_info.Download.progress = progress or 0
+        task_info.Download.total_size = total_size or 0
+        task_info.Download.downloaded_size = downloaded_size or 0
+
+        for file_key, file_offsets in offsets.items():
+            file_info = task_info.Download.files.get(file_key)
+
+            if file_info is not None:
+                file_info["chunk_offsets"] = file_offsets
+
+        task_info.set_cold_data(data)
+
+        return task_info
 
     def count_tasks(self, completed: bool = False) -> int:
         table = "completed_task" if completed else "download_task"
@@ -166,60 +368,260 @@ class TaskDatabase(Database):
 
         return result[0][0] if result else 0
 
-    def build_record(self, task_info: TaskInfo, completed: bool = False) -> tuple:
+    def build_record(self, task_info: TaskInfo, completed: bool = False) -> TaskRecord:
         # 组装一条待写入的记录。调用方可在自己的线程上预先组装，避免写线程读到中途被改写的 task_info
-        timestamp = task_info.Basic.completed_time if completed else task_info.Basic.created_time
+        created_time = task_info.Basic.created_time or get_timestamp()
+        completed_time = (task_info.Basic.completed_time or get_timestamp()) if completed else 0
 
-        if not timestamp:
-            timestamp = get_timestamp()
+        state = self.build_state(task_info, include_cold_data = True)
 
-        return (
+        row = (
             task_info.Basic.task_id,                                    # task_id
             self._calc_hash_id(task_info),                              # hash_id
             task_info.Basic.cover_id,                                   # cover_id
             task_info.Basic.show_title,                                 # title
-            timestamp,                                                  # created_time or completed_time
-            json_dumps(task_info.to_dict())                             # data
+            created_time,                                               # created_time
+            completed_time,                                             # completed_time
+            state.status,                                               # status
+            state.progress,                                             # progress
+            state.total_size,                                           # total_size
+            state.downloaded_size,                                      # downloaded_size
+            state.download,                                             # download
+            state.data                                                  # data
+        )
+
+        # 已完成的任务不会再续传，分片断点没有保留的必要
+        chunks = [] if completed else [(state.task_id, file_key, chunk_index, offset) for (file_key, chunk_index), offset in state.offsets.items()]
+
+        return TaskRecord(row, chunks)
+
+    def build_state(self, task_info: TaskInfo, include_cold_data: bool = False) -> TaskState:
+        """
+        组装一次进度快照，在调用方线程上执行
+
+        冷数据尚未展开时不可能被改动过，直接跳过；展开过的冷数据仍要序列化，
+        但写线程会与上次写入的内容比较，没有变化就不会重写 data 列
+        """
+        download = task_info.Download
+
+        download_data = {}
+        offsets = {}
+
+        for name, value in download.items():
+            if name in HOT_DOWNLOAD_FIELDS or name in TRANSIENT_DOWNLOAD_FIELDS:
+                continue
+
+            if name == "files":
+                value = {key: self._strip_chunk_offsets(key, file_info, offsets) for key, file_info in value.items()}
+
+            download_data[name] = value
+
+        data = None
+
+        if include_cold_data or task_info.is_cold_data_loaded():
+            data = json_dumps({name: getattr(task_info, name) for name in COLD_SECTIONS})
+
+        return TaskState(
+            task_info.Basic.task_id,
+            download.status,
+            download.progress,
+            download.total_size,
+            download.downloaded_size,
+            json_dumps(download_data),
+            data,
+            offsets
         )
 
+    @staticmethod
+    def _strip_chunk_offsets(file_key: str, file_info: dict, offsets: dict):
+        # 分片断点移到 download_chunk 表，其余部分仍随 download 列保存
+        for chunk_index, offset in list((file_info.get("chunk_offsets") or {}).items()):
+            offsets[(file_key, int(chunk_index))] = offset
+
+        return {key: value for key, value in file_info.items() if key != "chunk_offsets"}
+
     def add_tasks(self, task_info_list: List[TaskInfo], completed: bool = False):
         # 通过 completed 参数来区分是插入到 download_task 还是 completed_task 表
         self.add_task_records([self.build_record(task_info, completed) for task_info in task_info_list], completed)
 
-    def add_task_records(self, info_list: List[tuple], completed: bool = False):
+    def add_task_records(self, record_list: List[TaskRecord], completed: bool = False):
         # 记录由调用方预先组装，此处只负责写入，便于把写操作统一投递到写线程执行
-        if not info_list:
+        if not record_list:
             return
 
-        if completed:
-            self.executemany("""
-                INSERT INTO completed_task (task_id, hash_id, cover_id, title, completed_time, data)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, info_list)
-        else:
-            self.executemany("""
-                INSERT INTO download_task (task_id, hash_id, cover_id, title, created_time, data)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, info_list)
-
-    def update_task(self, task_info: TaskInfo):
-        self.execute("""
-            UPDATE download_task SET data = ? WHERE task_id = ?
-        """, (json_dumps(task_info.to_dict()), task_info.Basic.task_id))
-
-    def update_task_json(self, task_id: str, data: str):
-        self.execute("""
-            UPDATE download_task SET data = ? WHERE task_id = ?
-        """, (data, task_id))
-
-    def update_task_json_many(self, updates: List[tuple]):
-        # updates 中每一项为 (task_id, data)，在单个事务中一次性提交
-        if not updates:
+        table = "completed_task" if completed else "download_task"
+
+        statements = [(self._insert_sql(table), [record.row for record in record_list], True)]
+
+        if not completed:
+            statements.append((self._upsert_chunk_sql(), [chunk for record in record_list for chunk in record.chunks], True))
+
+        with self._hash_index_lock:
+            self.execute_batch(statements)
+
+            self._update_hash_index(added = [record.row[1] for record in record_list])
+
+        if not completed:
+            for record in record_list:
+                self._remember_record(record)
+
+    def journal_task_states(self, states: List[TaskState]):
+        """
+        写入一批进度快照，在写线程上调用
+
+        进度字段、download 列与分片断点的变化量追加到进度日志；
+        冷数据有变化、分片被移除，或者本次启动后第一次写这个任务时，连同日志一起并入主表
+        """
+        deltas = []
+
+        for state in states:
+            written = self._written.get(state.task_id)
+
+            if written is None or written.offsets is None or (state.data is not None and state.data != written.data):
+                return self.compact_journal(states)
+
+            previous = self._journaled.get(state.task_id)
+            previous_offsets = previous.offsets if previous else written.offsets
+            previous_download = previous.download if previous else written.download
+
+            if previous_offsets.keys() - state.offsets.keys():
+                # 分片被移除只会发生在重置文件时，按结构性变化处理
+                return self.compact_journal(states)
+
+            deltas.append(ProgressDelta(
+                state.task_id,
+                state.status,
+                state.progress,
+                state.total_size,
+                state.downloaded_size,
+                state.download if state.download != previous_download else None,
+                {key: offset for key, offset in state.offsets.items() if previous_offsets.get(key) != offset}
+            ))
+
+        self.journal.append(deltas)
+
+        for state in states:
+            self._journaled[state.task_id] = state
+
+        if self.journal.size > JOURNAL_COMPACT_BYTES:
+            self.compact_journal()
+
+    def compact_journal(self, states: List[TaskState] = ()):
+        # 把日志里的最新快照连同 states 在同一事务中写入主表，记下已并入的代号后换一份新日志
+        merged = {**self._journaled, **{state.task_id: state for state in states}}
+
+        if merged:
+            self.update_task_states(list(merged.values()), journal_generation = self.journal.generation)
+
+        self._journaled.clear()
+
+        self.journal.reset(self.journal.generation + 1)
+
+    def _compact_if_journaled(self, task_id_list: List[str]):
+        # 删除或移走任务之前先并入日志，日志里不能留下指向已不存在的任务的记录
+        if any(task_id in self._journaled for task_id in task_id_list):
+            self.compact_journal()
+
+    def _replay_journal(self):
+        """
+        启动时重放上次未并入主表的进度日志
+
+        日志的代号不大于主表记下的代号，说明上次退出前已经并入过，直接丢弃
+        """
+        generation, deltas = self.journal.read()
+
+        compacted = self.query('SELECT "generation" FROM "task_journal" WHERE "id" = 0')[0][0]
+
+        if generation > compacted and deltas:
+            progress = {}
+            downloads = {}
+            offsets = {}
+
+            # 同一任务的多条记录依次覆盖，留下的就是最新的值
+            for delta in deltas:
+                progress[delta.task_id] = (delta.status, delta.progress, delta.total_size, delta.downloaded_size)
+
+                if delta.download is not None:
+                    downloads[delta.task_id] = delta.download
+
+                for (file_key, chunk_index), offset in delta.offsets.items():
+                    offsets[(delta.task_id, file_key, chunk_index)] = offset
+
+            self.execute_batch([
+                ('UPDATE download_task SET status = ?, progress = ?, total_size = ?, downloaded_size = ?, download = COALESCE(?, download) WHERE task_id = ?', [(*values, downloads.get(task_id), task_id) for task_id, values in progress.items()], True),
+                ("""
+                    INSERT INTO download_chunk (task_id, file_key, chunk_index, "offset")
+                    SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM download_task WHERE task_id = ?)
+                    ON CONFLICT (task_id, file_key, chunk_index) DO UPDATE SET "offset" = excluded."offset"
+                """, [(task_id, file_key, chunk_index, offset, task_id) for (task_id, file_key, chunk_index), offset in offsets.items()], True),
+                ('UPDATE "task_journal" SET "generation" = ? WHERE "id" = 0', (generation, ))
+            ])
+
+            logger.info("已重放下载进度日志：%d 条记录，涉及 %d 个任务", len(deltas), len(progress))
+
+        self.journal.reset(max(generation, compacted) + 1)
+
+    def update_task_states(self, states: List[TaskState], journal_generation: int = None):
+        """
+        在单个事务中写入一批进度快照
+
+        进度字段原地更新；download、data 两列与分片断点只写与上次相比有变化的部分。
+        本次启动后第一次写某个任务时不知道库里的内容，按全部变化处理。
+        journal_generation 不为空时，同一事务里记下进度日志已并入到哪一代
+        """
+        if not states:
             return
 
-        self.executemany("""
-            UPDATE download_task SET data = ? WHERE task_id = ?
-        """, [(data, task_id) for task_id, data in updates])
+        rows = []
+        upserts = []
+        deletes = []
+        full_rewrites = []
+        written_states = []
+
+        for state in states:
+            written = self._written.get(state.task_id)
+
+            download = state.download if written is None or written.download != state.download else None
+            data = state.data if state.data is not None and (written is None or written.data != state.data) else None
+
+            rows.append((state.status, state.progress, state.total_size, state.downloaded_size, download, data, state.task_id))
+
+            if written is None or written.offsets is None:
+                full_rewrites.append((state.task_id, ))
+                upserts += [(state.task_id, file_key, chunk_index, offset) for (file_key, chunk_index), offset in state.offsets.items()]
+            else:
+                upserts += [
+                    (state.task_id, file_key, chunk_index, offset)
+                    for (file_key, chunk_index), offset in state.offsets.items()
+                    if written.offsets.get((file_key, chunk_index)) != offset
+                ]
+                deletes += [(state.task_id, file_key, chunk_index) for (file_key, chunk_index) in written.offsets.keys() - state.offsets.keys()]
+
+            written_states.append((state, written))
+
+        self.execute_batch([
+            ("""
+                UPDATE download_task SET status = ?, progress = ?, total_size = ?, downloaded_size = ?,
+                    download = COALESCE(?, download), data = COALESCE(?, data)
+                WHERE task_id = ?
+            """, rows, True),
+            ("DELETE FROM download_chunk WHERE task_id = ?", full_rewrites, True),
+            ("DELETE FROM download_chunk WHERE task_id = ? AND file_key = ? AND chunk_index = ?", deletes, True),
+            (self._upsert_chunk_sql(), upserts, True),
+            *([('UPDATE "task_journal" SET "generation" = ? WHERE "id" = 0', (journal_generation, ))] if journal_generation is not None else [])
+        ])
+
+        # 事务提交之后才记下已写入的内容，写入失败时下次仍会完整重写
+        for state, written in written_states:
+            if written is None:
+                written = self._written[state.task_id] = WrittenState()
+
+            written.download = state.download
+
+            if state.data is not None:
+                written.data = state.data
+
+            written.offsets = state.offsets
 
     def delete_task(self, task_id: str, completed: bool = False):
         self.delete_tasks([task_id], completed)
@@ -231,88 +633,171 @@ class TaskDatabase(Database):
 
         table = "completed_task" if completed else "download_task"
 
-        # SQLITE_MAX_VARIABLE_NUMBER 默认下限为 999，分批处理以保证安全
-        for index in range(0, len(task_id_list), 500):
-            batch = task_id_list[index:index + 500]
+        if not completed:
+            self._compact_if_journaled(task_id_list)
+
+        for index in range(0, len(task_id_list), BATCH_SIZE):
+            batch = task_id_list[index:index + BATCH_SIZE]
             placeholders = ", ".join("?" * len(batch))
 
-            self.execute(f"DELETE FROM {table} WHERE task_id IN ({placeholders})", tuple(batch))
+            statements = [(f"DELETE FROM {table} WHERE task_id IN ({placeholders})", tuple(batch))]
 
-    def move_to_completed(self, record: tuple):
-        # 从下载中表移出并写入已完成表，两步在同一事务内完成，避免中途失败导致任务丢失
-        self.execute_batch([
-            ("DELETE FROM download_task WHERE task_id = ?", (record[0],)),
-            ("""
-                INSERT OR REPLACE INTO completed_task (task_id, hash_id, cover_id, title, completed_time, data)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, record)
-        ])
+            if not completed:
+                statements.append((f"DELETE FROM download_chunk WHERE task_id IN ({placeholders})", tuple(batch)))
+
+            with self._hash_index_lock:
+                removed = self._query_hash_ids(table, batch)
+
+                self.execute_batch(statements)
+
+                self._update_hash_index(removed = removed)
+
+        if not completed:
+            for task_id in task_id_list:
+                self._written.pop(task_id, None)
+
+    def move_to_completed(self, record: TaskRecord):
+        # 从下载中表移出并写入已完成表，在同一事务内完成，避免中途失败导致任务丢失
+        self._compact_if_journaled([record.task_id])
 
-    def recreate_task(self, record: tuple):
+        with self._hash_index_lock:
+            removed = self._query_hash_ids("download_task", [record.task_id]) + self._query_hash_ids("completed_task", [record.task_id])
+
+            self.execute_batch([
+                ("DELETE FROM download_task WHERE task_id = ?", (record.task_id,)),
+                ("DELETE FROM download_chunk WHERE task_id = ?", (record.task_id,)),
+                (self._insert_sql("completed_task", replace = True), record.row)
+            ])
+
+            self._update_hash_index([record.row[1]], removed)
+
+        self._written.pop(record.task_id, None)
+
+    def recreate_task(self, record: TaskRecord):
         # 从已完成表移回下载中表，同样在单个事务内完成
-        self.execute_batch([
-            ("DELETE FROM completed_task WHERE task_id = ?", (record[0],)),
-            ("""
-                INSERT OR REPLACE INTO download_task (task_id, hash_id, cover_id, title, created_time, data)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, record)
-        ])
+        with self._hash_index_lock:
+            removed = self._query_hash_ids("completed_task", [record.task_id]) + self._query_hash_ids("download_task", [record.task_id])
+
+            self.execute_batch([
+                ("DELETE FROM completed_task WHERE task_id = ?", (record.task_id,)),
+                ("DELETE FROM download_chunk WHERE task_id = ?", (record.task_id,)),
+                (self._insert_sql("download_task", replace = True), record.row),
+                (self._upsert_chunk_sql(), record.chunks, True)
+            ])
+
+            self._update_hash_index([record.row[1]], removed)
+
+        self._remember_record(record)
+
+    def _remember_record(self, record: TaskRecord):
+        download, data = record.row[-2:]
+
+        self._written[record.task_id] = WrittenState(download, data, {(file_key, chunk_index): offset for _, file_key, chunk_index, offset in record.chunks})
+
+    @staticmethod
+    def _insert_sql(table: str, replace: bool = False):
+        columns = ", ".join(TASK_COLUMNS)
+        placeholders = ", ".join("?" * len(TASK_COLUMNS))
+
+        return f"INSERT {'OR REPLACE ' if replace else ''}INTO {table} ({columns}) VALUES ({placeholders})"
+
+    @staticmethod
+    def _upsert_chunk_sql():
+        return """
+            INSERT INTO download_chunk (task_id, file_key, chunk_index, "offset") VALUES (?, ?, ?, ?)
+            ON CONFLICT (task_id, file_key, chunk_index) DO UPDATE SET "offset" = excluded."offset"
+        """
 
     def check_duplicate(self, hash_id: str):
-        # 合并为一次查询，避免两次独立的数据库往返
-        result = self.query("""
-            SELECT
-                EXISTS(SELECT 1 FROM completed_task WHERE hash_id = ?)
-                OR EXISTS(SELECT 1 FROM download_task WHERE hash_id = ?)
-        """, (hash_id, hash_id))
+        return self.check_duplicates([hash_id])[0]
 
-        return bool(result and result[0][0])
+    def check_duplicates(self, hash_id_list: List[str]) -> List[bool]:
+        """
+        逐个判断 hash_id 是否已在下载中或已完成的任务里出现过
 
-    def _upgrade(self):
-        def _to_task_list(result):
-            _task_info_list = []
+        原先每个条目各查一次库，加入一个上千条的收藏夹就是上千次串行查询；
+        现在查内存里的计数，一次遍历给出全部结果
+        """
+        with self._hash_index_lock:
+            index = self._ensure_hash_index()
 
-            for entry in result:
-                task_info = TaskInfo()
-                task_info.from_dict(json_loads(entry[0]))
+            return [index[hash_id] > 0 for hash_id in hash_id_list]
 
-                _task_info_list.append(task_info)
+    def build_hash_index(self):
+        # 启动时由写线程预先建立，免得第一次添加任务时再等
+        with self._hash_index_lock:
+            self._ensure_hash_index()
 
-            return _task_info_list
+    def _ensure_hash_index(self) -> Counter:
+        # 调用方需持有 _hash_index_lock。
+        # 会改动 hash_id 的写入都在持锁期间提交并同步更新计数，因此这里读到的库与之后的增量不会重叠
+        if self._hash_index is None:
+            index = Counter()
 
-        if not self._needs_upgrade():
-            logger.info("数据库已是最新版本，无需升级")
+            for table in ("download_task", "completed_task"):
+                # hash_id 上有索引，只读索引即可，不必回表
+                cursor = self.get_connection().execute(f'SELECT "hash_id" FROM "{table}"')
+
+                while rows := cursor.fetchmany(BATCH_SIZE):
+                    index.update(row[0] for row in rows)
+
+            self._hash_index = index
+
+        return self._hash_index
+
+    def _update_hash_index(self, added: List[str] = (), removed: List[str] = ()):
+        # 调用方需持有 _hash_index_lock。尚未建立时无需维护，建立时会从库里读到最新的内容
+        index = self._hash_index
+
+        if index is None:
             return
 
-        # 取出原有数据
-        download_tasks = self.query_tasks(completed = False)
-        completed_tasks = self.query_tasks(completed = True)
+        index.update(added)
+
+        for hash_id in removed:
+            index[hash_id] -= 1
+
+            if index[hash_id] <= 0:
+                del index[hash_id]
+
+    def _query_hash_ids(self, table: str, task_id_list: List[str]) -> List[str]:
+        # 删除前先取出这些任务的 hash_id，用于维护计数；计数尚未建立时不必多查这一次
+        if self._hash_index is None:
+            return []
 
-        download_task_list = _to_task_list(download_tasks)
-        completed_task_list = _to_task_list(completed_tasks)
+        placeholders = ", ".join("?" * len(task_id_list))
 
-        def _task_records(task_info_list: List[TaskInfo], completed: bool):
+        return [row[0] for row in self.query(f'SELECT "hash_id" FROM "{table}" WHERE "task_id" IN ({placeholders})', tuple(task_id_list))]
+
+    def _upgrade(self):
+        """
+        把旧版「整个 TaskInfo 一个 JSON」的记录拆成新的列与分片表
+
+        旧版各个时期的表都有 data 列且存着完整的 TaskInfo，统一从它重建
+        """
+        if not self._needs_upgrade():
+            logger.info("数据库已是最新版本，无需升级")
+            return
+
+        def _to_records(table_name: str, completed: bool):
             records = []
 
-            for task_info in task_info_list:
-                timestamp = task_info.Basic.completed_time if completed else task_info.Basic.created_time
+            for (data, ) in self.query(f"SELECT data FROM {table_name}"):
+                try:
+                    task_info = TaskInfo()
+                    task_info.from_dict(json_loads(data))
 
-                if not timestamp:
-                    timestamp = get_timestamp()
+                except Exception:
+                    logger.exception("解析下载任务记录失败，已跳过")
+
+                    continue
 
-                records.append((
-                    task_info.Basic.task_id,
-                    self._calc_hash_id(task_info),
-                    task_info.Basic.cover_id,
-                    task_info.Basic.show_title,
-                    timestamp,
-                    json_dumps(task_info.to_dict())
-                ))
+                records.append(self.build_record(task_info, completed))
 
             return records
 
-        download_records = _task_records(download_task_list, completed = False)
-        completed_records = _task_records(completed_task_list, completed = True)
+        download_records = _to_records("download_task", completed = False)
+        completed_records = _to_records("completed_task", completed = True)
 
         # 在同一个事务中重建表，避免迁移中途失败后留下空表或半成品表。
         conn = self.get_connection()
@@ -323,42 +808,18 @@ class TaskDatabase(Database):
 
             cursor.execute("DROP TABLE IF EXISTS download_task")
             cursor.execute("DROP TABLE IF EXISTS completed_task")
+            cursor.execute("DELETE FROM download_chunk")
 
-            cursor.execute("""
-                CREATE TABLE download_task (
-                    id INTEGER UNIQUE,
-                    task_id TEXT UNIQUE,
-                    hash_id TEXT,
-                    cover_id TEXT,
-                    title TEXT,
-                    created_time INTEGER,
-                    data TEXT,
-                    PRIMARY KEY(id AUTOINCREMENT)
-                )
-            """)
-            cursor.execute("""
-                CREATE TABLE completed_task (
-                    id INTEGER UNIQUE,
-                    task_id TEXT UNIQUE,
-                    hash_id TEXT,
-                    cover_id TEXT,
-                    title TEXT,
-                    completed_time INTEGER,
-                    data TEXT,
-                    PRIMARY KEY(id AUTOINCREMENT)
-                )
-            """)
+            cursor.execute(self._create_table_sql("download_task", if_not_exists = False))
+            cursor.execute(self._create_table_sql("completed_task", if_not_exists = False))
             cursor.execute("CREATE INDEX idx_download_task_hash_id ON download_task (hash_id)")
             cursor.execute("CREATE INDEX idx_completed_task_hash_id ON completed_task (hash_id)")
+            cursor.execute("CREATE INDEX idx_download_task_created_time ON download_task (created_time)")
+            cursor.execute("CREATE INDEX idx_completed_task_completed_time ON completed_task (completed_time)")
 
-            cursor.executemany("""
-                INSERT INTO download_task (task_id, hash_id, cover_id, title, created_time, data)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, download_records)
-            cursor.executemany("""
-                INSERT INTO completed_task (task_id, hash_id, cover_id, title, completed_time, data)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, completed_records)
+            cursor.executemany(self._insert_sql("download_task"), [record.row for record in download_records])
+            cursor.executemany(self._insert_sql("completed_task"), [record.row for record in completed_records])
+            cursor.executemany(self._upsert_chunk_sql(), [chunk for record in download_records for chunk in record.chunks])
 
             conn.commit()
 
@@ -1,21 +1,52 @@
+from ...common._json import json_loads
+
 from dataclasses import dataclass, field, fields, asdict
 from functools import lru_cache
+from threading import Lock
+import sys
+
+# 这几部分只在命名、合并、打开文件等少数时候用到，从数据库读出时先不解析，首次访问时再展开
+COLD_SECTIONS = ("File", "Episode", "Options")
+
+SECTIONS = ("Basic", "File", "Episode", "Download", "Options")
+
+# 不超过这个长度的字符串值在反序列化时驻留（sys.intern）。扩展名、容器格式、
+# 画质与编码名称等取值只有寥寥几种，几万个任务共用同一个对象，而不是各存一份
+INTERN_MAX_LENGTH = 16
 
+_cold_data_lock = Lock()
+
+
+@lru_cache(maxsize=None)
+def _field_names(cls) -> tuple[str, ...]:
+    return tuple(f.name for f in fields(cls))
 
 @lru_cache(maxsize=None)
-def _field_names(cls) -> frozenset[str]:
-    return frozenset(f.name for f in fields(cls))
+def _field_name_set(cls) -> frozenset[str]:
+    return frozenset(_field_names(cls))
 
-@dataclass
+def _intern(value):
+    if type(value) is str and len(value) <= INTERN_MAX_LENGTH:
+        return sys.intern(value)
+
+    return value
+
+# 各部分都声明 __slots__：下载列表里可能同时有上万个任务，每个对象省下一个 __dict__ 也很可观。
+# 因此不能再给这些对象临时挂上未声明的属性
+@dataclass(slots = True)
 class InfoBase:
     def from_dict(self, data: dict) -> None:
-        field_names = _field_names(type(self))
+        field_names = _field_name_set(type(self))
 
         for k, v in data.items():
             if k in field_names:
-                setattr(self, k, v)
+                setattr(self, k, _intern(v))
+
+    def items(self):
+        # 按声明顺序逐项给出 (字段名, 值)，代替 vars()
+        return ((name, getattr(self, name)) for name in _field_names(type(self)))
 
-@dataclass
+@dataclass(slots = True)
 class BasicInfo(InfoBase):
     task_id: str = ""
     cover_id: str = ""
@@ -23,7 +54,7 @@ class BasicInfo(InfoBase):
     created_time: int = 0
     completed_time: int = 0
 
-@dataclass
+@dataclass(slots = True)
 class FileInfo(InfoBase):
     name: str = ""
     
@@ -41,7 +72,7 @@ class FileInfo(InfoBase):
     # 文件名中带有随界面语言变化的限定词和语言后缀，Merger 无法自行反推，因此必须在此登记
     subtitle_track_list: list[dict] = field(default_factory = list)
 
-@dataclass
+@dataclass(slots = True)
 class EpisodeInfo(InfoBase):
     attribute: int = 0
 
@@ -106,7 +137,7 @@ class EpisodeInfo(InfoBase):
     audio_quality: str = ""
     video_codec: str = ""
 
-@dataclass
+@dataclass(slots = True)
 class DownloadInfo(InfoBase):
     # 类型相关
     type: int = 0
@@ -137,7 +168,7 @@ class DownloadInfo(InfoBase):
     info_label: str = ""
     status_label: str = ""
 
-@dataclass
+@dataclass(slots = True)
 class OptionsInfo(InfoBase):
     """
     下载选项快照
@@ -174,16 +205,69 @@ class OptionsInfo(InfoBase):
 
     keep_original_files_type: int = None
 
-@dataclass
-class TaskInfo:
+class _ColdDataSlot:
+    # _cold_data 不是 dataclass 字段，slots = True 不会为它留位置，放在基类里声明。
+    # 冷数据尚未展开时持有其 JSON，展开后即删除
+    __slots__ = ("_cold_data", )
+
+@dataclass(slots = True)
+class TaskInfo(_ColdDataSlot):
     Basic: BasicInfo = field(default_factory = BasicInfo)
     File: FileInfo = field(default_factory = FileInfo)
     Episode: EpisodeInfo = field(default_factory = EpisodeInfo)
     Download: DownloadInfo = field(default_factory = DownloadInfo)
     Options: OptionsInfo = field(default_factory = OptionsInfo)
 
+    def __getattr__(self, name: str):
+        # 只有冷数据尚未展开时（对应的槽还是空的），访问 COLD_SECTIONS 才会走到这里
+        if name not in COLD_SECTIONS:
+            raise AttributeError(name)
+
+        # 界面线程与下载线程可能同时首次访问，展开必须只做一次
+        with _cold_data_lock:
+            if not self.is_cold_data_loaded():
+                data = self._cold_data
+                del self._cold_data
+
+                self._load_cold_data(data)
+
+        return object.__getattribute__(self, name)
+
+    def set_cold_data(self, data: str | bytes):
+        """
+        暂存数据库中的冷数据（File、Episode、Options 的 JSON），待首次访问时再解析
+
+        以 UTF-8 字节保存：JSON 里只要有一个中文字符，str 就得按每字符两字节存放整段文本
+        """
+        for name in COLD_SECTIONS:
+            try:
+                delattr(self, name)
+
+            except AttributeError:
+                pass
+
+        self._cold_data = data.encode("utf-8") if isinstance(data, str) else data
+
+    def is_cold_data_loaded(self):
+        try:
+            object.__getattribute__(self, "_cold_data")
+
+        except AttributeError:
+            return True
+
+        return False
+
+    def _load_cold_data(self, data: bytes):
+        cold_data = json_loads(data) if data else {}
+
+        for name, info_cls in (("File", FileInfo), ("Episode", EpisodeInfo), ("Options", OptionsInfo)):
+            section = info_cls()
+            section.from_dict(cold_data.get(name, {}))
+
+            setattr(self, name, section)
+
     def to_dict(self):
-        return asdict(self)
+        return {name: asdict(getattr(self, name)) for name in SECTIONS}
     
     def from_dict(self, data: dict):
         basic_data = data.get("Basic", {})
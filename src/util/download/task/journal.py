@@ -0,0 +1,162 @@
+from pathlib import Path
+from typing import Iterator, NamedTuple
+import logging
+import struct
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# 文件头：魔数 + 日志代号
+_HEADER = struct.Struct("<4sQ")
+_MAGIC = b"BTJ1"
+
+# 每条记录前的帧头：载荷长度 + CRC32，进程被杀时末尾可能只写了半条，据此识别并丢弃
+_FRAME = struct.Struct("<II")
+
+# 载荷：status、progress、total_size、downloaded_size、download 列的长度（0 表示没有变化）、变化的分片数
+_PROGRESS = struct.Struct("<iiqqII")
+
+# 每个变化的分片：chunk_index、offset
+_OFFSET = struct.Struct("<Iq")
+
+class ProgressDelta(NamedTuple):
+    # 一个任务在一次刷写中的变化量。进度字段每次都在变，总是整组写入；
+    # download 列（分片完成时 chunks_list 会变）与分片断点只写变化了的
+    task_id: str
+    status: int
+    progress: int
+    total_size: int
+    downloaded_size: int
+    download: str | None
+    # {(file_key, chunk_index): offset}
+    offsets: dict[tuple[str, int], int]
+
+class ProgressJournal:
+    """
+    下载进度日志，只追加写入
+
+    进度快照每秒都有，原先每次都要在 SQLite 里开一个事务改写整行与对应的分片行；
+    改为把变化量编码成几十字节追加到这里，由 TaskDatabase 定期并入主表。
+    记录的都是绝对值而不是增量，重放多少次结果都一样
+
+    文件头带有代号，并入主表时同一事务里记下已并入的代号，之后再换新文件。
+    并入后、换文件前进程退出，下次启动也能凭代号认出这份日志已经并入过，不会拿旧值覆盖新值
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.generation = 0
+
+        self._file = None
+
+    @property
+    def size(self) -> int:
+        return self._file.tell() if self._file else 0
+
+    def read(self) -> tuple[int, list[ProgressDelta]]:
+        """读出日志的代号与全部完整的记录，日志不存在或已损坏时代号为 0"""
+        try:
+            data = self.path.read_bytes()
+
+        except FileNotFoundError:
+            return 0, []
+
+        if len(data) < _HEADER.size:
+            return 0, []
+
+        magic, generation = _HEADER.unpack_from(data)
+
+        if magic != _MAGIC:
+            logger.warning("下载进度日志格式无法识别，已忽略：%s", self.path)
+
+            return 0, []
+
+        return generation, list(self._iter_deltas(data, _HEADER.size))
+
+    def reset(self, generation: int):
+        # 开始一份新日志，旧内容随之丢弃
+        self.close()
+
+        self.generation = generation
+
+        self._file = open(self.path, "wb", buffering = 0)
+        self._file.write(_HEADER.pack(_MAGIC, generation))
+
+    def append(self, deltas: list[ProgressDelta]):
+        # 一次 write 写完整批，写到操作系统缓冲区即返回。
+        # 进程崩溃不会丢数据，断电时与 SQLite 的 synchronous = NORMAL 一样可能丢掉最近的一小段
+        if not deltas:
+            return
+
+        buffer = bytearray()
+
+        for delta in deltas:
+            payload = self._encode(delta)
+
+            buffer += _FRAME.pack(len(payload), zlib.crc32(payload))
+            buffer += payload
+
+        self._file.write(buffer)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+            self._file = None
+
+    @staticmethod
+    def _encode(delta: ProgressDelta) -> bytes:
+        download = delta.download.encode("utf-8") if delta.download else b""
+
+        payload = bytearray(ProgressJournal._pack_str(delta.task_id))
+        payload += _PROGRESS.pack(delta.status, delta.progress, delta.total_size, delta.downloaded_size, len(download), len(delta.offsets))
+        payload += download
+
+        for (file_key, chunk_index), offset in delta.offsets.items():
+            payload += ProgressJournal._pack_str(file_key)
+            payload += _OFFSET.pack(chunk_index, offset)
+
+        return bytes(payload)
+
+    @staticmethod
+    def _iter_deltas(data: bytes, position: int) -> Iterator[ProgressDelta]:
+        while position + _FRAME.size <= len(data):
+            length, crc = _FRAME.unpack_from(data, position)
+            position += _FRAME.size
+
+            payload = data[position:position + length]
+            position += length
+
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                # 末尾残缺的一条，之后不会再有完整的记录
+                return
+
+            task_id, offset = ProgressJournal._unpack_str(payload, 0)
+            status, progress, total_size, downloaded_size, download_length, count = _PROGRESS.unpack_from(payload, offset)
+            offset += _PROGRESS.size
+
+            download = payload[offset:offset + download_length].decode("utf-8") if download_length else None
+            offset += download_length
+
+            offsets = {}
+
+            for _ in range(count):
+                file_key, offset = ProgressJournal._unpack_str(payload, offset)
+                chunk_index, chunk_offset = _OFFSET.unpack_from(payload, offset)
+                offset += _OFFSET.size
+
+                offsets[(file_key, chunk_index)] = chunk_offset
+
+            yield ProgressDelta(task_id, status, progress, total_size, downloaded_size, download, offsets)
+
+    @staticmethod
+    def _pack_str(value: str) -> bytes:
+        encoded = value.encode("utf-8")
+
+        return struct.pack("<B", len(encoded)) + encoded
+
+    @staticmethod
+    def _unpack_str(payload: bytes, offset: int) -> tuple[str, int]:
+        length = payload[offset]
+        offset += 1
+
+        return payload[offset:offset + length].decode("utf-8"), offset + length
@@ -1,6 +1,5 @@
 from ...common.enum import DownloadStatus, DownloadType, NumberingType, DuplicateDownloadResolution, ToastNotificationCategory
 from ...common.data import reversed_video_quality_map, reversed_audio_quality_map, video_codec_str_map
-from ...common._json import json_dumps, json_loads
 from ...common.timestamp import get_timestamp_ms
 from ...common.translator import Translator
 from ...common.signal_bus import signal_bus
@@ -15,7 +14,7 @@ from ..cover.manager import cover_manager
 from .reparse_worker import ReparseWorker
 from .options import pick_option, snapshot
 from .hash_id import calc_hash_id
-from .db import TaskDatabase
+from .db import TaskDatabase, TaskRecord, TaskState
 from .info import TaskInfo
 
 from threading import Event, Lock, Timer
@@ -23,11 +22,28 @@ from pathlib import Path
 from typing import List
 from uuid import uuid4
 from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from copy import deepcopy
 import logging
 import re
 
 logger = logging.getLogger(__name__)
 
+@dataclass
+class TaskDefaults:
+    # 同一批任务共用的设置，整批只从配置里读一次
+    download_type: int
+    video_quality_id: int
+    audio_quality_id: int
+    video_codec_id: int
+    merge_video_audio: bool
+    keep_original_files: bool
+    download_path: str
+    # 下载选项快照，每个任务各拷贝一份
+    options: dict
+    # {命名规则类型: 命名规则}，按需填充
+    naming_rules: dict
+
 class TaskManager:
     def __init__(self):
         self.db_manager = TaskDatabase()
@@ -47,6 +63,8 @@ class TaskManager:
 
         signal_bus.download.create_task.connect(self._create_async)
 
+        self._update_executor.submit(self.db_manager.build_hash_index)
+
     def _create_async(self, episode_info_list: List[dict], show_toast: bool = False, options: dict = None):
         GlobalThreadPoolTask.run_func(self.create, episode_info_list, show_toast, options)
 
@@ -71,7 +89,20 @@ class TaskManager:
         with self._add_to_queue_toast_lock:
             self._add_to_queue_toast_shown = False
 
-    def __episode_info_to_task_info(self, episode_info: dict, number, options: dict = None) -> TaskInfo:
+    def __build_task_defaults(self, options: dict = None) -> TaskDefaults:
+        return TaskDefaults(
+            download_type = self.__determine_download_type(options),
+            video_quality_id = pick_option(options, "video_quality_id", config.video_quality_id),
+            audio_quality_id = pick_option(options, "audio_quality_id", config.audio_quality_id),
+            video_codec_id = pick_option(options, "video_codec_id", config.video_codec_id),
+            merge_video_audio = pick_option(options, "merge_video_audio", config.merge_video_audio),
+            keep_original_files = pick_option(options, "keep_original_files", config.keep_original_files),
+            download_path = config.get(config.download_path),
+            options = snapshot(options),
+            naming_rules = {}
+        )
+
+    def __episode_info_to_task_info(self, episode_info: dict, number, defaults: TaskDefaults) -> TaskInfo:
         task_info = TaskInfo()
 
         # BasicInfo
@@ -82,13 +113,13 @@ class TaskManager:
         
         # DownloadInfo
         task_info.Download.status = DownloadStatus.QUEUED
-        task_info.Download.type = self.__determine_download_type(options)
+        task_info.Download.type = defaults.download_type
 
-        task_info.Download.video_quality_id = pick_option(options, "video_quality_id", config.video_quality_id)
-        task_info.Download.audio_quality_id = pick_option(options, "audio_quality_id", config.audio_quality_id)
-        task_info.Download.video_codec_id = pick_option(options, "video_codec_id", config.video_codec_id)
-        task_info.Download.merge_video_audio = pick_option(options, "merge_video_audio", config.merge_video_audio)
-        task_info.Download.keep_original_files = pick_option(options, "keep_original_files", config.keep_original_files)
+        task_info.Download.video_quality_id = defaults.video_quality_id
+        task_info.Download.audio_quality_id = defaults.audio_quality_id
+        task_info.Download.video_codec_id = defaults.video_codec_id
+        task_info.Download.merge_video_audio = defaults.merge_video_audio
+        task_info.Download.keep_original_files = defaults.keep_original_files
 
         # EpisodeInfo
         task_info.Episode.from_dict(self.__update_episode_info(episode_info, number))
@@ -98,13 +129,13 @@ class TaskManager:
         # OptionsInfo
         # 弹幕格式、输出容器等原先要到下载过程中才读全局设置，任务在队列里排队
         # 期间用户改了设置就会波及它。与下载目录一样，在这里一并固化下来
-        task_info.Options.from_dict(snapshot(options))
+        task_info.Options.from_dict(deepcopy(defaults.options))
 
         # FileNameInfo
         # 下载目录在生成 TaskInfo 时就确定，后续即便修改了下载目录的设置，也不会影响已生成的 TaskInfo 中的下载目录，避免下载过程中下载目录发生变化导致的问题
-        task_info.File.download_path = config.get(config.download_path)
+        task_info.File.download_path = defaults.download_path
 
-        self.__update_file_name_info(task_info)
+        self.__update_file_name_info(task_info, defaults.naming_rules)
 
         return task_info
 
@@ -159,12 +190,21 @@ class TaskManager:
 
         return data
 
-    def __update_file_name_info(self, task_info: TaskInfo):
+    def __update_file_name_info(self, task_info: TaskInfo, naming_rules: dict = None):
         formatter = FileNameFormatter()
         formatter.set_variable_data(task_info)
 
-        if config.target_naming_rule_id is not None:
-            formatter.set_rule(formatter.get_rule_by_id(config.target_naming_rule_id))
+        # 命名规则要在配置的规则列表里逐条查找，批量创建时同一类型只查一次
+        if naming_rules is None:
+            naming_rules = {}
+
+        if formatter.type_id not in naming_rules:
+            if config.target_naming_rule_id is not None:
+                naming_rules[formatter.type_id] = formatter.get_rule_by_id(config.target_naming_rule_id)
+            else:
+                naming_rules[formatter.type_id] = formatter.get_rule_from_config(formatter.type_id)
+
+        formatter.set_rule(naming_rules[formatter.type_id])
 
         path = Path(formatter.format())
 
@@ -200,57 +240,87 @@ class TaskManager:
                 # 过滤文件系统非法字符
                 episode_info[title] = re.sub(r'[\/\\\:\*\?\"\<\>\|]', '_', episode_info.get(title, ""))
 
-    def __get_number(self, episode_info: dict = None):
-        # 调用方已持有 _numbering_lock
-        match config.get(config.numbering_type):
-            case NumberingType.CONTINUOUS:
-                # 全局顺序编号
-                return config.global_starting_number
+    def __allocate_numbers(self, episode_info_list: List[dict]) -> list:
+        # 整批在一次加锁内分配连续的编号。
+        # 取号与自增必须在同一把锁内完成，否则并发创建任务时会分配出重复的编号
+        count = len(episode_info_list)
+
+        with self._numbering_lock:
+            match config.get(config.numbering_type):
+                case NumberingType.CONTINUOUS:
+                    # 全局顺序编号
+                    numbers = list(range(config.global_starting_number, config.global_starting_number + count))
+
+                case NumberingType.FROM_SPECIFIED:
+                    # 从 current_starting_number 开始，然后自增
+                    numbers = list(range(config.current_starting_number, config.current_starting_number + count))
 
-            case NumberingType.FROM_SPECIFIED:
-                # 返回 current_starting_number，然后自增
-                _current = config.current_starting_number
-                config.current_starting_number += 1
+                    config.current_starting_number += count
 
-                return _current
+                case _:
+                    numbers = [episode_info.get("number", "") for episode_info in episode_info_list]
 
-            case _:
-                return episode_info.get("number", "")
+            # 全局起始编号自增
+            config.global_starting_number += count
+
+        return numbers
 
     def create(self, episode_info_list: List[dict], show_toast: bool = False, options: dict = None):
+        """
+        批量创建下载任务
+
+        加入整季番剧或上千条的个人空间投稿时，原先每个条目都要单独查库判重、加锁取号、
+        重新读一遍全局设置与命名规则。现在分几步整批处理：一次判重，一次取号，
+        设置与命名规则整批只读一次，最后一次写库、一次通知下载列表
+        """
         task_info_list = []
 
-        for episode_info in episode_info_list:
+        # 整批一次判定是否重复下载
+        duplicates = self._check_duplicates_silently(episode_info_list)
+
+        accepted_list = []
+
+        for episode_info, duplicate in zip(episode_info_list, duplicates):
             try:
                 # 判断是否需要重新解析
                 if self.__check_reparse_needed(episode_info, show_toast, options):
                     continue
 
                 # 判断是否重复下载
-                if self._check_duplicate(episode_info, options):
+                if duplicate and self._resolve_duplicate(episode_info, options):
                     continue
 
-                # 先判断重复下载，再分配编号。
-                # 取号与自增必须在同一把锁内完成，否则并发创建任务时会分配出重复的编号
-                with self._numbering_lock:
-                    number = self.__get_number(episode_info)
+                accepted_list.append(episode_info)
+
+            except Exception as error:
+                self.__show_create_error(episode_info, error)
+
+        if not accepted_list:
+            return
 
-                    # 全局起始编号自增
-                    config.global_starting_number += 1
+        # 先判断重复下载，再分配编号
+        try:
+            numbers = self.__allocate_numbers(accepted_list)
 
-                task_info = self.__episode_info_to_task_info(episode_info, number, options)
+            defaults = self.__build_task_defaults(options)
 
-                task_info_list.append(task_info)
+        except Exception as error:
+            logger.exception("读取下载设置失败")
 
-            except Exception as error:
-                title = episode_info.get("title", "")
-                logger.exception("创建下载任务失败：%s", title)
+            signal_bus.toast.show_long_message.emit(
+                ToastNotificationCategory.ERROR,
+                Translator.ERROR_MESSAGES("DOWNLOAD_FAILED"),
+                str(error)
+            )
 
-                signal_bus.toast.show_long_message.emit(
-                    ToastNotificationCategory.ERROR,
-                    Translator.ERROR_MESSAGES("DOWNLOAD_FAILED"),
-                    f"{title}\n\n{error}"
-                )
+            return
+
+        for episode_info, number in zip(accepted_list, numbers):
+            try:
+                task_info_list.append(self.__episode_info_to_task_info(episode_info, number, defaults))
+
+            except Exception as error:
+                self.__show_create_error(episode_info, error)
 
         if task_info_list:
             # 存储到数据库，并添加到下载列表。
@@ -279,11 +349,23 @@ class TaskManager:
             if show_toast:
                 self._show_add_to_queue_toast()
 
+    def __show_create_error(self, episode_info: dict, error: Exception):
+        title = episode_info.get("title", "")
+        logger.exception("创建下载任务失败：%s", title)
+
+        signal_bus.toast.show_long_message.emit(
+            ToastNotificationCategory.ERROR,
+            Translator.ERROR_MESSAGES("DOWNLOAD_FAILED"),
+            f"{title}\n\n{error}"
+        )
+
     def query(self, completed: bool = False, limit: int = None) -> List[TaskInfo]:
-        # limit 为空时取全部；传入后只反序列化最近的若干条，见 db.query_tasks
-        result = self.db_manager.query_tasks(completed, limit)
+        # limit 为空时取全部；传入后只读最近的若干条，见 db.query_tasks
+        return self.db_manager.query_tasks(completed, limit)
 
-        return [self._build_task_info(entry) for entry in result]
+    def query_page(self, completed: bool, sort_key: str, ascending: bool, cursor: tuple = None, limit: int = 200):
+        # 分页读取，返回 (任务列表, 下一页的游标)，见 db.query_task_page
+        return self.db_manager.query_task_page(completed, sort_key, ascending, cursor, limit)
 
     def query_by_id(self, task_id: str) -> TaskInfo:
         """按 task_id 取单条，未完成与已完成两张表都找。找不到返回 None"""
@@ -291,48 +373,65 @@ class TaskManager:
             result = self.db_manager.query_task_by_id(task_id, completed)
 
             if result:
-                return self._build_task_info(result[0])
+                return result[0]
 
         return None
 
     def count(self, completed: bool = False) -> int:
         return self.db_manager.count_tasks(completed)
 
-    def _build_task_info(self, entry) -> TaskInfo:
-        task_info = TaskInfo()
-        task_info.from_dict(json_loads(entry[0]))  # 取 data 列
-
-        return task_info
-
     def update(self, task_info: TaskInfo):
         self.update_async(task_info)
 
     def update_async(self, task_info: TaskInfo):
         # 高频进度更新只保留每个任务最新快照，并由单独线程串行写入数据库。
+        # 第一个快照到来后等待 progress_save_interval 秒再统一写入，期间的快照互相覆盖，
+        # 崩溃时至多丢失这么久的进度
         task_id = task_info.Basic.task_id
 
-        # 取样必须在锁内完成。若把 json_dumps 放在锁外，同一个任务的两个调用方
+        # 取样必须在锁内完成。若把取样放在锁外，同一个任务的两个调用方
         # （GUI 线程的测速定时器、后台线程的 start_worker）可能先后取样却以相反的
         # 顺序写入 _pending_updates，旧快照覆盖新快照，重启后表现为下载进度倒退。
+        # 快照只含进度相关的部分，冷数据没有展开过就不会序列化，见 TaskDatabase.build_state
         with self._update_lock:
-            self._pending_updates[task_id] = (task_id, json_dumps(task_info.to_dict()))
+            self._pending_updates[task_id] = self.db_manager.build_state(task_info)
 
             if self._update_flush_scheduled:
                 return
 
             self._update_flush_scheduled = True
 
-        self._update_executor.submit(self._flush_updates)
+        timer = Timer(config.get(config.progress_save_interval), self._schedule_flush)
+        timer.daemon = True
+        timer.start()
+
+    def _schedule_flush(self):
+        try:
+            self._update_executor.submit(self._flush_updates)
+
+        except RuntimeError:
+            # 解释器正在退出，shutdown 已经把挂起的快照写完
+            pass
 
     def shutdown(self, timeout: float = 5.0):
         # 退出前把已投递的写入落盘。写入都在同一个线程上排队，
         # 因此只要等待队尾的任务完成即可，超时后不再继续阻塞退出流程。
         try:
-            self._update_executor.submit(self._flush_pending_snapshots).result(timeout = timeout)
+            self._update_executor.submit(self._shutdown_storage).result(timeout = timeout)
 
         except Exception:
             logger.exception("等待下载任务写入完成超时")
 
+    def _shutdown_storage(self):
+        # 正常退出时顺便把进度日志并入主表，下次启动就不必重放
+        self._flush_pending_snapshots()
+
+        try:
+            self.db_manager.compact_journal()
+
+        except Exception:
+            logger.exception("合并下载进度日志失败")
+
     def _discard_pending_updates(self, task_id_list: List[str]):
         # 任务即将被删除，丢弃其尚未落盘的进度快照，避免无谓的写入
         with self._update_lock:
@@ -340,15 +439,14 @@ class TaskManager:
                 self._pending_updates.pop(task_id, None)
 
     def _flush_updates(self):
-        while True:
-            with self._update_lock:
-                if not self._pending_updates:
-                    self._update_flush_scheduled = False
-                    return
+        # 只写这一批。之后到来的快照会重新计时，而不是紧接着再写一次
+        with self._update_lock:
+            updates = list(self._pending_updates.values())
 
-                updates = list(self._pending_updates.values())
-                self._pending_updates.clear()
+            self._pending_updates.clear()
+            self._update_flush_scheduled = False
 
+        if updates:
             self._write_updates(updates)
 
     def _flush_pending_snapshots(self):
@@ -364,15 +462,15 @@ class TaskManager:
 
             self._write_updates(updates)
 
-    def _write_updates(self, updates: List[tuple]):
+    def _write_updates(self, updates: List[TaskState]):
         try:
-            # 一次事务写入全部快照。逐条提交时每条约 18ms，批量提交后整批不到 1ms。
-            self.db_manager.update_task_json_many(updates)
+            # 通常只是追加到进度日志，见 TaskDatabase.journal_task_states
+            self.db_manager.journal_task_states(updates)
 
         except Exception:
             logger.exception("异步保存下载任务失败，本批共 %d 条", len(updates))
 
-    def _add_storage(self, records: List[tuple]):
+    def _add_storage(self, records: List[TaskRecord]):
         self._flush_pending_snapshots()
 
         try:
@@ -462,14 +560,14 @@ class TaskManager:
 
         self._update_executor.submit(self._mark_as_completed_storage, record)
 
-    def _mark_as_completed_storage(self, record: tuple):
+    def _mark_as_completed_storage(self, record: TaskRecord):
         self._flush_pending_snapshots()
 
         try:
             self.db_manager.move_to_completed(record)
 
         except Exception:
-            logger.exception("标记下载任务为已完成失败: %s", record[0])
+            logger.exception("标记下载任务为已完成失败: %s", record.task_id)
 
     def reset(self, task_info: TaskInfo):
         # 重置下载状态为初始状态，适用于完全重新下载的场景
@@ -495,14 +593,14 @@ class TaskManager:
         signal_bus.download.add_to_downloading_list.emit([task_info])
         signal_bus.download.auto_manage_concurrent_downloads.emit()
 
-    def _recreate_storage(self, record: tuple):
+    def _recreate_storage(self, record: TaskRecord):
         self._flush_pending_snapshots()
 
         try:
             self.db_manager.recreate_task(record)
 
         except Exception:
-            logger.exception("重建下载任务记录失败: %s", record[0])
+            logger.exception("重建下载任务记录失败: %s", record.task_id)
 
     def _update_media_info(self, task_info: TaskInfo):
         # 更新媒体信息相关的变量，以便在文件命名规则中使用
@@ -527,50 +625,60 @@ class TaskManager:
         """
         查询条目是否已下载过，不触发任何界面交互
 
-        供无人值守的调用方（MCP）在提交前自行预检：_check_duplicate 会按用户
+        供无人值守的调用方（MCP）在提交前自行预检：_resolve_duplicate 会按用户
         设置弹窗或发提示，且被它跳过的条目不会出现在 add_to_downloading_list
         里 —— 调用方只能干等到超时，也无从得知哪些被跳过了。
         """
-        return self.db_manager.check_duplicate(self._calc_hash_id(episode_info))
+        return self.check_duplicates([episode_info])[0]
+
+    def check_duplicates(self, episode_info_list: List[dict]) -> List[bool]:
+        # is_duplicate 的批量版本，返回与 episode_info_list 一一对应的结果
+        return self.db_manager.check_duplicates([self._calc_hash_id(episode_info) for episode_info in episode_info_list])
 
-    def _check_duplicate(self, episode_info: dict, options: dict = None):
-        hash_id = self._calc_hash_id(episode_info)
+    def _check_duplicates_silently(self, episode_info_list: List[dict]) -> List[bool]:
+        try:
+            return self.check_duplicates(episode_info_list)
+
+        except Exception:
+            # 判定失败时按未重复处理，与单条计算 hash_id 失败时的结果一致
+            logger.exception("批量判定重复下载失败")
 
-        result = self.db_manager.check_duplicate(hash_id)
+            return [False] * len(episode_info_list)
 
-        if result:
-            # 触发重复下载，根据用户设置执行相应的操作。
-            #
-            # 无人值守的调用方（MCP）必须显式指定处理方式：ALWAYS_ASK 会弹窗
-            # 并在此无限等待用户点击，而那种场景下根本没有人会去点
-            match pick_option(options, "duplicate_resolution", config.get(config.duplicate_download_resolution)):
-                case DuplicateDownloadResolution.CONTINUE:
-                    # 返回 False 表示继续下载
-                    logger.info("已继续重复下载任务: %s", episode_info.get("title", ""))
+    def _resolve_duplicate(self, episode_info: dict, options: dict = None):
+        # 条目已经下载过，根据用户设置执行相应的操作，返回 True 表示跳过。
+        #
+        # 无人值守的调用方（MCP）必须显式指定处理方式：ALWAYS_ASK 会弹窗
+        # 并在此无限等待用户点击，而那种场景下根本没有人会去点
+        match pick_option(options, "duplicate_resolution", config.get(config.duplicate_download_resolution)):
+            case DuplicateDownloadResolution.CONTINUE:
+                # 返回 False 表示继续下载
+                logger.info("已继续重复下载任务: %s", episode_info.get("title", ""))
 
-                    return False
+                return False
 
-                case DuplicateDownloadResolution.SKIP:
-                    # 返回 True 表示跳过下载
-                    logger.info("已跳过重复下载任务: %s", episode_info.get("title", ""))
+            case DuplicateDownloadResolution.SKIP:
+                # 返回 True 表示跳过下载
+                logger.info("已跳过重复下载任务: %s", episode_info.get("title", ""))
 
-                    signal_bus.download.show_skip_duplicate_download_toast.emit(episode_info.get("title", ""))
-                    
-                    return True
+                signal_bus.download.show_skip_duplicate_download_toast.emit(episode_info.get("title", ""))
                 
-                case DuplicateDownloadResolution.ALWAYS_ASK:
-                    # 询问用户是否继续下载。后台线程等待主线程弹窗返回结果。
-                    result_info = {"skip": True, "not_ask_again": False}
-                    done_event = Event()
+                return True
+            
+            case DuplicateDownloadResolution.ALWAYS_ASK:
+                # 询问用户是否继续下载。后台线程等待主线程弹窗返回结果。
+                result_info = {"skip": True, "not_ask_again": False}
+                done_event = Event()
 
-                    signal_bus.download.show_duplicate_download_dialog.emit(episode_info, result_info, done_event)
-                    done_event.wait()
+                signal_bus.download.show_duplicate_download_dialog.emit(episode_info, result_info, done_event)
+                done_event.wait()
 
-                    logger.info("用户选择%s重复下载任务: %s", "跳过" if result_info["skip"] else "继续", episode_info.get("title", ""))
+                logger.info("用户选择%s重复下载任务: %s", "跳过" if result_info["skip"] else "继续", episode_info.get("title", ""))
 
-                    return result_info["skip"]
-                    
-        return result
+                return result_info["skip"]
+                
+        # 未知的处理方式一律跳过
+        return True
 
     def _calc_hash_id(self, episode_info: dict):
         # 根据 episode_info 计算 hash_id
@@ -0,0 +1,37 @@
+from .manager import task_manager
+from .info import TaskInfo
+
+from typing import List
+
+class TaskPager:
+    """
+    分页读取任务列表，供列表模型的 canFetchMore / fetchMore 按需取用
+
+    已完成的任务会长期累积到上万条，启动时全部读出既慢又占内存。
+    这里按界面当前的排序键从数据库一页页地取，滚动到底部时再取下一页
+    """
+    page_size = 200
+
+    def __init__(self, completed: bool = True, sort_key: str = None, ascending: bool = False):
+        self.completed = completed
+
+        self.reset(sort_key, ascending)
+
+    def reset(self, sort_key: str, ascending: bool):
+        # 排序方式改变后，此前的游标失效，从第一页重新读取
+        self.sort_key = sort_key
+        self.ascending = ascending
+        self.exhausted = False
+
+        self._cursor = None
+
+    def fetch(self) -> List[TaskInfo]:
+        if self.exhausted:
+            return []
+
+        task_info_list, self._cursor = task_manager.query_page(self.completed, self.sort_key, self.ascending, self._cursor, self.page_size)
+
+        if len(task_info_list) < self.page_size:
+            self.exhausted = True
+
+        return task_info_list
@@ -2,7 +2,10 @@ from PySide6.QtCore import QObject, Signal, Slot
 
 from ...common.enum import DownloadStatus
 
+from ...common.config import config
+
 from .manager import task_manager
+from .pager import TaskPager
 from .info import TaskInfo
 
 from typing import List
@@ -11,7 +14,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 class QueryWorker(QObject):
-    success = Signal(list, list)
+    success = Signal(list, list, object)  # 下载中的全部任务, 已完成任务的第一页, 读取后续页的 TaskPager
     error = Signal(str)
     finished = Signal()
 
@@ -34,13 +37,21 @@ class QueryWorker(QObject):
             self.finished.emit()
 
     def query(self):
+        # 下载中的任务都要参与调度，必须全部读出；已完成的任务只读第一页，其余的滚动到时再读
         downloading_tasks = task_manager.query()
-        completed_tasks = task_manager.query(completed = True)
+
+        completed_pager = TaskPager(
+            completed = True,
+            sort_key = config.get(config.completed_list_sort_by),
+            ascending = config.get(config.completed_list_sort_ascending)
+        )
+
+        completed_tasks = completed_pager.fetch()
 
         downloading_tasks = self.get_task_list(downloading_tasks, update_status = True)
         completed_tasks = self.get_task_list(completed_tasks, update_status = False)
 
-        self.success.emit(downloading_tasks, completed_tasks)
+        self.success.emit(downloading_tasks, completed_tasks, completed_pager)
 
     def get_task_list(self, task_info_list: List[TaskInfo], update_status = True):
         task_list = []
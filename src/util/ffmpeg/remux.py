@@ -0,0 +1,762 @@
+from ..common.io.file import File
+
+from typing import Callable, Optional
+from threading import Event
+from array import array
+from pathlib import Path
+import logging
+import struct
+import errno
+import sys
+import os
+
+logger = logging.getLogger(__name__)
+
+# 需要展开子 box 的容器，其余 box 一律按原始字节原样保留
+_CONTAINER_TYPES = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"edts", b"mvex"}
+
+# 加密内容的样本需要 senc / saiz 等辅助信息，逐字节拷贝无法正确还原
+_ENCRYPTED_TYPES = {b"encv", b"enca", b"senc", b"saiz", b"saio", b"pssh"}
+
+# tfhd 标志位
+_TFHD_BASE_DATA_OFFSET = 0x000001
+_TFHD_SAMPLE_DESCRIPTION_INDEX = 0x000002
+_TFHD_DEFAULT_DURATION = 0x000008
+_TFHD_DEFAULT_SIZE = 0x000010
+_TFHD_DEFAULT_FLAGS = 0x000020
+_TFHD_DEFAULT_BASE_IS_MOOF = 0x020000
+
+# trun 标志位
+_TRUN_DATA_OFFSET = 0x000001
+_TRUN_FIRST_SAMPLE_FLAGS = 0x000004
+_TRUN_DURATION = 0x000100
+_TRUN_SIZE = 0x000200
+_TRUN_FLAGS = 0x000400
+_TRUN_COMPOSITION_OFFSET = 0x000800
+
+# sample_flags 中的 sample_is_non_sync_sample
+_NON_SYNC_SAMPLE = 0x00010000
+
+_UINT32_MAX = 0xFFFFFFFF
+
+_COPY_BUFFER_SIZE = 1024 * 1024
+
+class RemuxUnsupportedError(Exception):
+    """输入不是本模块能处理的分段 MP4，调用方应改用 FFmpeg 合并"""
+
+class RemuxStoppedError(Exception):
+    pass
+
+class Box:
+    """
+    MP4 box。容器 box 的内容拆成 children，其余的保留原始 payload
+    """
+    __slots__ = ("type", "payload", "children")
+
+    def __init__(self, box_type: bytes, payload: bytes = b"", children: list["Box"] = None):
+        self.type = box_type
+        self.payload = payload
+        self.children = children
+
+    @classmethod
+    def parse(cls, data: bytes, offset: int = 0, end: int = None) -> list["Box"]:
+        boxes = []
+        end = len(data) if end is None else end
+
+        while offset + 8 <= end:
+            size, box_type = struct.unpack_from(">I4s", data, offset)
+            header_size = 8
+
+            if size == 1:
+                size = struct.unpack_from(">Q", data, offset + 8)[0]
+                header_size = 16
+
+            elif size == 0:
+                size = end - offset
+
+            if size < header_size or offset + size > end:
+                raise RemuxUnsupportedError(f"box {box_type!r} 的长度无效")
+
+            if box_type in _CONTAINER_TYPES:
+                box = cls(box_type, children = cls.parse(data, offset + header_size, offset + size))
+            else:
+                box = cls(box_type, data[offset + header_size:offset + size])
+
+            boxes.append(box)
+            offset += size
+
+        return boxes
+
+    def find(self, *path: bytes) -> Optional["Box"]:
+        box = self
+
+        for box_type in path:
+            box = next((child for child in box.children or [] if child.type == box_type), None)
+
+            if box is None:
+                return None
+
+        return box
+
+    def find_all(self, box_type: bytes) -> list["Box"]:
+        return [child for child in self.children or [] if child.type == box_type]
+
+    def to_bytes(self) -> bytes:
+        if self.children is None:
+            content = self.payload
+        else:
+            content = b"".join(child.to_bytes() for child in self.children)
+
+        return make_box(self.type, content)
+
+def make_box(box_type: bytes, content: bytes) -> bytes:
+    size = len(content) + 8
+
+    if size > _UINT32_MAX:
+        return struct.pack(">I4sQ", 1, box_type, size + 8) + content
+
+    return struct.pack(">I4s", size, box_type) + content
+
+def make_full_box(box_type: bytes, version: int, flags: int, content: bytes) -> bytes:
+    return make_box(box_type, struct.pack(">I", (version << 24) | flags) + content)
+
+def to_big_endian(values: array) -> bytes:
+    if sys.byteorder == "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+
+    return values.tobytes()
+
+def from_big_endian(typecode: str, data: bytes) -> array:
+    values = array(typecode, data)
+
+    if sys.byteorder == "little":
+        values.byteswap()
+
+    return values
+
+class FragmentedTrack:
+    """
+    单路分段 MP4（DASH m4s）的轨道信息
+
+    扫描全部 moof，把分散在各 trun 里的样本信息汇总成普通 MP4 的样本表，
+    每个 trun 对应的一段连续样本数据记为一个 chunk，合并时整段拷贝
+    """
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+        self.moov: Box = None
+        self.trak: Box = None
+        self.track_id = 0
+        self.timescale = 0
+
+        self.durations = array("I")
+        self.sizes = array("I")
+        self.composition_offsets = array("i")
+        self.has_composition_offsets = False
+        self.sync_samples: list[int] = []
+        self.all_sync = True
+
+        # (源文件偏移, 长度, 本 chunk 的样本数, 本 chunk 的解码时间)
+        self.chunks: list[tuple[int, int, int, int]] = []
+
+        # 首个分片的 tfdt。不为 0 时需要用编辑列表把整条轨道往后推
+        self.start_time = 0
+
+        self._decode_time = 0
+        self._defaults = (0, 0, 0)
+
+        self._parse()
+
+    @property
+    def media_duration(self) -> int:
+        return self._decode_time - self.start_time
+
+    @property
+    def handler(self) -> bytes:
+        hdlr = self.trak.find(b"mdia", b"hdlr")
+
+        return hdlr.payload[8:12] if hdlr else b""
+
+    def _parse(self):
+        file_size = self.path.stat().st_size
+
+        with open(self.path, "rb") as f:
+            offset = 0
+
+            while offset + 8 <= file_size:
+                f.seek(offset)
+                header = f.read(16)
+
+                size, box_type = struct.unpack_from(">I4s", header)
+                header_size = 8
+
+                if size == 1:
+                    size = struct.unpack_from(">Q", header, 8)[0]
+                    header_size = 16
+
+                elif size == 0:
+                    size = file_size - offset
+
+                if size < header_size or offset + size > file_size:
+                    raise RemuxUnsupportedError(f"{self.path.name} 不完整")
+
+                if box_type == b"moov":
+                    f.seek(offset + header_size)
+                    self._parse_moov(f.read(size - header_size))
+
+                elif box_type == b"moof":
+                    if self.moov is None:
+                        raise RemuxUnsupportedError(f"{self.path.name} 的 moof 出现在 moov 之前")
+
+                    f.seek(offset + header_size)
+                    self._parse_moof(f.read(size - header_size), offset)
+
+                elif box_type == b"mdat" and self.moov is None:
+                    raise RemuxUnsupportedError(f"{self.path.name} 不是分段 MP4")
+
+                offset += size
+
+        if not self.chunks:
+            raise RemuxUnsupportedError(f"{self.path.name} 中没有样本")
+
+    def _parse_moov(self, data: bytes):
+        self.moov = Box(b"moov", children = Box.parse(data))
+
+        traks = self.moov.find_all(b"trak")
+
+        if len(traks) != 1:
+            raise RemuxUnsupportedError(f"{self.path.name} 包含 {len(traks)} 条轨道")
+
+        if self.moov.find(b"mvex") is None:
+            raise RemuxUnsupportedError(f"{self.path.name} 不是分段 MP4")
+
+        if any(box.type in _ENCRYPTED_TYPES for box in self.moov.children):
+            raise RemuxUnsupportedError(f"{self.path.name} 已加密")
+
+        self.trak = traks[0]
+
+        tkhd = self.trak.find(b"tkhd").payload
+        self.track_id = struct.unpack_from(">I", tkhd, 20 if tkhd[0] == 1 else 12)[0]
+
+        mdhd = self.trak.find(b"mdia", b"mdhd").payload
+        self.timescale = struct.unpack_from(">I", mdhd, 20 if mdhd[0] == 1 else 12)[0]
+
+        stsd = self.trak.find(b"mdia", b"minf", b"stbl", b"stsd")
+
+        if stsd is None or struct.unpack_from(">I", stsd.payload, 4)[0] != 1:
+            raise RemuxUnsupportedError(f"{self.path.name} 的样本描述不止一个")
+
+        if stsd.payload[12:16] in _ENCRYPTED_TYPES:
+            raise RemuxUnsupportedError(f"{self.path.name} 已加密")
+
+        for trex in self.moov.find(b"mvex").find_all(b"trex"):
+            track_id, _, duration, size, flags = struct.unpack_from(">5I", trex.payload, 4)
+
+            if track_id == self.track_id:
+                self._defaults = (duration, size, flags)
+
+    def _parse_moof(self, data: bytes, moof_offset: int):
+        trafs = [box for box in Box.parse(data) if box.type == b"traf"]
+
+        for traf in trafs:
+            # traf 不在 _CONTAINER_TYPES 中，这里单独展开
+            children = Box.parse(traf.payload)
+
+            if any(box.type in _ENCRYPTED_TYPES for box in children):
+                raise RemuxUnsupportedError(f"{self.path.name} 已加密")
+
+            tfhd = next((box.payload for box in children if box.type == b"tfhd"), None)
+
+            if tfhd is None:
+                raise RemuxUnsupportedError(f"{self.path.name} 缺少 tfhd")
+
+            tfhd_flags = struct.unpack_from(">I", tfhd)[0] & 0xFFFFFF
+            track_id = struct.unpack_from(">I", tfhd, 4)[0]
+
+            if track_id != self.track_id:
+                raise RemuxUnsupportedError(f"{self.path.name} 的分片属于未知轨道")
+
+            # 没有显式给出 base_data_offset 时，数据偏移以 moof 的起点为基准。
+            # 旧式约定下第二个 traf 起改以上一个 traf 的数据末尾为基准，这种布局不予支持
+            base_offset = moof_offset
+            position = 8
+            default_duration, default_size, default_flags = self._defaults
+
+            if tfhd_flags & _TFHD_BASE_DATA_OFFSET:
+                base_offset = struct.unpack_from(">Q", tfhd, position)[0]
+                position += 8
+
+            elif not tfhd_flags & _TFHD_DEFAULT_BASE_IS_MOOF and len(trafs) > 1:
+                raise RemuxUnsupportedError(f"{self.path.name} 的分片布局不受支持")
+
+            if tfhd_flags & _TFHD_SAMPLE_DESCRIPTION_INDEX:
+                if struct.unpack_from(">I", tfhd, position)[0] != 1:
+                    raise RemuxUnsupportedError(f"{self.path.name} 引用了多个样本描述")
+
+                position += 4
+
+            if tfhd_flags & _TFHD_DEFAULT_DURATION:
+                default_duration = struct.unpack_from(">I", tfhd, position)[0]
+                position += 4
+
+            if tfhd_flags & _TFHD_DEFAULT_SIZE:
+                default_size = struct.unpack_from(">I", tfhd, position)[0]
+                position += 4
+
+            if tfhd_flags & _TFHD_DEFAULT_FLAGS:
+                default_flags = struct.unpack_from(">I", tfhd, position)[0]
+
+            tfdt = next((box.payload for box in children if box.type == b"tfdt"), None)
+
+            if tfdt is not None:
+                self._align_decode_time(struct.unpack_from(">Q" if tfdt[0] == 1 else ">I", tfdt, 4)[0])
+
+            data_end = base_offset
+
+            for trun in (box.payload for box in children if box.type == b"trun"):
+                data_end = self._parse_trun(trun, base_offset, data_end, default_duration, default_size, default_flags)
+
+    def _align_decode_time(self, decode_time: int):
+        if not self.chunks:
+            self.start_time = decode_time
+            self._decode_time = decode_time
+
+            return
+
+        gap = decode_time - self._decode_time
+
+        if gap < 0:
+            raise RemuxUnsupportedError(f"{self.path.name} 的分片时间戳重叠")
+
+        if gap:
+            # 分片之间有空隙时拉长上一个样本，保证之后的样本时间戳与原文件一致
+            self.durations[-1] += gap
+            self._decode_time = decode_time
+
+    def _parse_trun(self, trun: bytes, base_offset: int, data_end: int, default_duration: int, default_size: int, default_flags: int):
+        version = trun[0]
+        flags = struct.unpack_from(">I", trun)[0] & 0xFFFFFF
+        sample_count = struct.unpack_from(">I", trun, 4)[0]
+        position = 8
+
+        # 未给出 data_offset 时紧接着上一个 trun 的数据
+        data_start = data_end
+
+        if flags & _TRUN_DATA_OFFSET:
+            data_start = base_offset + struct.unpack_from(">i", trun, position)[0]
+            position += 4
+
+        first_sample_flags = None
+
+        if flags & _TRUN_FIRST_SAMPLE_FLAGS:
+            first_sample_flags = struct.unpack_from(">I", trun, position)[0]
+            position += 4
+
+        if sample_count == 0:
+            return data_start
+
+        fields = [flag for flag in (_TRUN_DURATION, _TRUN_SIZE, _TRUN_FLAGS, _TRUN_COMPOSITION_OFFSET) if flags & flag]
+        stride = len(fields)
+
+        if stride:
+            values = from_big_endian("I", trun[position:position + sample_count * stride * 4])
+
+            if len(values) != sample_count * stride:
+                raise RemuxUnsupportedError(f"{self.path.name} 的 trun 不完整")
+
+            columns = {flag: values[index::stride] for index, flag in enumerate(fields)}
+        else:
+            columns = {}
+
+        durations = columns.get(_TRUN_DURATION) or array("I", [default_duration]) * sample_count
+        sizes = columns.get(_TRUN_SIZE) or array("I", [default_size]) * sample_count
+
+        sample_flags = columns.get(_TRUN_FLAGS)
+
+        if sample_flags is None:
+            sample_flags = array("I", [default_flags]) * sample_count
+
+        if first_sample_flags is not None:
+            sample_flags[0] = first_sample_flags
+
+        first_sample = len(self.sizes)
+
+        for index, value in enumerate(sample_flags):
+            if value & _NON_SYNC_SAMPLE:
+                self.all_sync = False
+            else:
+                self.sync_samples.append(first_sample + index + 1)
+
+        offsets = columns.get(_TRUN_COMPOSITION_OFFSET)
+
+        if offsets is not None:
+            # version 1 的合成时间偏移是有符号数
+            offsets = array("i", offsets.tobytes()) if version == 1 else array("i", (min(value, 0x7FFFFFFF) for value in offsets))
+
+            if any(offsets):
+                self.has_composition_offsets = True
+        else:
+            offsets = array("i", [0]) * sample_count
+
+        data_size = sum(sizes)
+
+        self.chunks.append((data_start, data_size, sample_count, self._decode_time))
+
+        self.durations.extend(durations)
+        self.sizes.extend(sizes)
+        self.composition_offsets.extend(offsets)
+
+        self._decode_time += sum(durations)
+
+        return data_start + data_size
+
+class MP4Remuxer:
+    """
+    把视频、音频两个分段 MP4（DASH m4s）直接合并成普通 MP4，不经过 FFmpeg
+
+    只改写 box 结构：样本表由各分片的 trun 汇总而来，moov 放在文件开头，
+    样本数据按分片整段拷贝，支持时走 copy_file_range / sendfile，不经过用户态。
+    遇到不认识的结构一律抛出 RemuxUnsupportedError，由调用方改用 FFmpeg
+    """
+    def __init__(self, video_path: str | Path, audio_path: str | Path, output_path: str | Path):
+        self.video_path = Path(video_path)
+        self.audio_path = Path(audio_path)
+        self.output_path = Path(output_path)
+
+        self.on_progress: Callable[[int, int], None] = None
+        self.stop_event = Event()
+
+        self._copy_method = "copy_file_range" if hasattr(os, "copy_file_range") else "sendfile" if hasattr(os, "sendfile") else "read"
+
+    @classmethod
+    def merge_video_audio(cls, video_path: str | Path, audio_path: str | Path, output_path: str | Path):
+        cls(video_path, audio_path, output_path).run()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        video = FragmentedTrack(self.video_path)
+        audio = FragmentedTrack(self.audio_path)
+
+        if video.handler != b"vide" or audio.handler != b"soun":
+            raise RemuxUnsupportedError("输入不是一路视频加一路音频")
+
+        tracks = [video, audio]
+
+        # 按解码时间交错排列两路的 chunk，播放时顺序读取即可，不必来回跳转
+        layout = sorted(
+            ((chunk[3] / track.timescale, index, chunk) for index, track in enumerate(tracks) for chunk in track.chunks),
+            key = lambda item: (item[0], item[1])
+        )
+
+        payload_size = sum(chunk[1] for _, _, chunk in layout)
+        mdat_header_size = 8 if payload_size + 8 <= _UINT32_MAX else 16
+
+        ftyp = self._make_ftyp()
+
+        # 先按 32 位偏移生成一次 moov 以确定其长度，再据此计算每个 chunk 在输出文件中的位置
+        use_co64 = False
+        placeholder = {index: [0] * len(track.chunks) for index, track in enumerate(tracks)}
+        moov_size = len(self._make_moov(video, tracks, placeholder, use_co64))
+
+        if len(ftyp) + moov_size + mdat_header_size + payload_size > _UINT32_MAX:
+            use_co64 = True
+            moov_size = len(self._make_moov(video, tracks, placeholder, use_co64))
+
+        data_start = len(ftyp) + moov_size + mdat_header_size
+        chunk_offsets = {index: [] for index in range(len(tracks))}
+        copy_list = []
+        position = data_start
+
+        for _, index, (src_offset, size, _, _) in layout:
+            chunk_offsets[index].append(position)
+            copy_list.append((index, src_offset, position, size))
+
+            position += size
+
+        moov = self._make_moov(video, tracks, chunk_offsets, use_co64)
+
+        if mdat_header_size == 8:
+            mdat_header = struct.pack(">I4s", payload_size + 8, b"mdat")
+        else:
+            mdat_header = struct.pack(">I4sQ", 1, b"mdat", payload_size + 16)
+
+        try:
+            self._write(ftyp + moov + mdat_header, tracks, copy_list, payload_size)
+
+        except BaseException:
+            try:
+                self.output_path.unlink(missing_ok = True)
+
+            except OSError:
+                pass
+
+            raise
+
+    def _write(self, header: bytes, tracks: list[FragmentedTrack], copy_list: list[tuple[int, int, int, int]], payload_size: int):
+        source_fds = [os.open(track.path, os.O_RDONLY | getattr(os, "O_BINARY", 0)) for track in tracks]
+
+        try:
+            output_fd = os.open(self.output_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0))
+
+            try:
+                File.pwrite(output_fd, header, 0)
+
+                copied = 0
+
+                for index, src_offset, dst_offset, size in copy_list:
+                    if self.stop_event.is_set():
+                        raise RemuxStoppedError()
+
+                    self._copy_range(source_fds[index], output_fd, src_offset, dst_offset, size)
+
+                    copied += size
+
+                    if self.on_progress:
+                        self.on_progress(copied, payload_size)
+
+            finally:
+                os.close(output_fd)
+
+        finally:
+            for fd in source_fds:
+                os.close(fd)
+
+    def _copy_range(self, src_fd: int, dst_fd: int, src_offset: int, dst_offset: int, size: int):
+        # 优先在内核中直接拷贝（copy_file_range 在支持 reflink 的文件系统上甚至不复制数据），
+        # 文件系统或内核不支持时逐级退回 sendfile 与普通读写
+        while size > 0:
+            try:
+                match self._copy_method:
+                    case "copy_file_range":
+                        copied = os.copy_file_range(src_fd, dst_fd, size, src_offset, dst_offset)
+
+                    case "sendfile":
+                        os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+                        copied = os.sendfile(dst_fd, src_fd, src_offset, size)
+
+                    case _:
+                        os.lseek(src_fd, src_offset, os.SEEK_SET)
+                        data = os.read(src_fd, min(size, _COPY_BUFFER_SIZE))
+                        File.pwrite(dst_fd, data, dst_offset)
+                        copied = len(data)
+
+            except OSError as e:
+                if self._copy_method != "read" and e.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.ENOTSOCK):
+                    self._copy_method = "sendfile" if self._copy_method == "copy_file_range" and hasattr(os, "sendfile") else "read"
+
+                    logger.info("拷贝方式不受支持（%s），改用 %s", e, self._copy_method)
+
+                    continue
+
+                raise
+
+            if copied <= 0:
+                raise RemuxUnsupportedError("输入文件比分片信息描述的短")
+
+            src_offset += copied
+            dst_offset += copied
+            size -= copied
+
+    @staticmethod
+    def _make_ftyp() -> bytes:
+        return make_box(b"ftyp", b"isom" + struct.pack(">I", 0x200) + b"isomiso2mp41")
+
+    def _make_moov(self, video: FragmentedTrack, tracks: list[FragmentedTrack], chunk_offsets: dict[int, list[int]], use_co64: bool) -> bytes:
+        mvhd = video.moov.find(b"mvhd").payload
+        version = mvhd[0]
+        movie_timescale = struct.unpack_from(">I", mvhd, 20 if version == 1 else 12)[0]
+
+        traks = []
+        movie_duration = 0
+
+        for index, track in enumerate(tracks):
+            trak, duration = self._make_trak(track, index + 1, movie_timescale, chunk_offsets[index], use_co64)
+
+            traks.append(trak)
+            movie_duration = max(movie_duration, duration)
+
+        mvhd = bytearray(mvhd)
+
+        if version == 1:
+            struct.pack_into(">Q", mvhd, 24, movie_duration)
+        else:
+            struct.pack_into(">I", mvhd, 16, min(movie_duration, _UINT32_MAX))
+
+        # next_track_ID 位于 mvhd 末尾
+        struct.pack_into(">I", mvhd, len(mvhd) - 4, len(tracks) + 1)
+
+        # 其余 box（udta 等）沿用视频文件的，mvex 只属于分段 MP4，去掉
+        extra = [box.to_bytes() for box in video.moov.children if box.type not in (b"mvhd", b"trak", b"mvex")]
+
+        return make_box(b"moov", make_box(b"mvhd", bytes(mvhd)) + b"".join(traks) + b"".join(extra))
+
+    def _make_trak(self, track: FragmentedTrack, track_id: int, movie_timescale: int, chunk_offsets: list[int], use_co64: bool):
+        media_duration = track.media_duration
+        track_duration = media_duration * movie_timescale // track.timescale
+        delay = track.start_time * movie_timescale // track.timescale
+
+        children = []
+
+        for box in track.trak.children:
+            match box.type:
+                case b"tkhd":
+                    tkhd = bytearray(box.payload)
+
+                    if tkhd[0] == 1:
+                        struct.pack_into(">I", tkhd, 20, track_id)
+                        struct.pack_into(">Q", tkhd, 28, track_duration + delay)
+                    else:
+                        struct.pack_into(">I", tkhd, 12, track_id)
+                        struct.pack_into(">I", tkhd, 20, min(track_duration + delay, _UINT32_MAX))
+
+                    children.append(make_box(b"tkhd", bytes(tkhd)))
+
+                    if delay and track.trak.find(b"edts") is None:
+                        # 首个分片不从 0 开始时，用一段空编辑把整条轨道往后推，保持音画同步
+                        children.append(make_box(b"edts", make_full_box(b"elst", 0, 0, struct.pack(">I", 2) + struct.pack(">IiI", delay, -1, 0x10000) + struct.pack(">IiI", track_duration, 0, 0x10000))))
+
+                case b"edts":
+                    if delay:
+                        raise RemuxUnsupportedError(f"{track.path.name} 的编辑列表与分片时间戳同时存在")
+
+                    children.append(self._make_edts(box, track_duration, movie_timescale, track.timescale))
+
+                case b"mdia":
+                    children.append(self._make_mdia(box, track, chunk_offsets, use_co64))
+
+                case _:
+                    children.append(box.to_bytes())
+
+        return make_box(b"trak", b"".join(children)), track_duration + delay
+
+    @staticmethod
+    def _make_edts(edts: Box, track_duration: int, movie_timescale: int, media_timescale: int) -> bytes:
+        elst = edts.find(b"elst")
+
+        if elst is None:
+            return edts.to_bytes()
+
+        # 分段 MP4 在生成时还不知道总时长，编辑的时长常写作 0，这里补上实际值
+        payload = bytearray(elst.payload)
+        version = payload[0]
+        count = struct.unpack_from(">I", payload, 4)[0]
+        entry_size = 20 if version == 1 else 12
+        duration_format, time_format = (">Q", ">q") if version == 1 else (">I", ">i")
+
+        for index in range(count):
+            position = 8 + index * entry_size
+            duration = struct.unpack_from(duration_format, payload, position)[0]
+            media_time = struct.unpack_from(time_format, payload, position + (8 if version == 1 else 4))[0]
+
+            if duration == 0 and media_time >= 0:
+                struct.pack_into(duration_format, payload, position, max(track_duration - media_time * movie_timescale // media_timescale, 0))
+
+        return make_box(b"edts", make_box(b"elst", bytes(payload)))
+
+    def _make_mdia(self, mdia: Box, track: FragmentedTrack, chunk_offsets: list[int], use_co64: bool) -> bytes:
+        children = []
+
+        for box in mdia.children:
+            match box.type:
+                case b"mdhd":
+                    mdhd = bytearray(box.payload)
+
+                    if mdhd[0] == 1:
+                        struct.pack_into(">Q", mdhd, 24, track.media_duration)
+                    elif track.media_duration > _UINT32_MAX:
+                        raise RemuxUnsupportedError(f"{track.path.name} 的时长超出 mdhd 的表示范围")
+                    else:
+                        struct.pack_into(">I", mdhd, 16, track.media_duration)
+
+                    children.append(make_box(b"mdhd", bytes(mdhd)))
+
+                case b"minf":
+                    minf = [
+                        self._make_stbl(child, track, chunk_offsets, use_co64) if child.type == b"stbl" else child.to_bytes()
+                        for child in box.children
+                    ]
+
+                    children.append(make_box(b"minf", b"".join(minf)))
+
+                case _:
+                    children.append(box.to_bytes())
+
+        return make_box(b"mdia", b"".join(children))
+
+    def _make_stbl(self, stbl: Box, track: FragmentedTrack, chunk_offsets: list[int], use_co64: bool) -> bytes:
+        # 分段 MP4 的样本表都是空的，只保留样本描述（其中带着编解码参数），其余按汇总结果重建
+        tables = [stbl.find(b"stsd").to_bytes(), self._make_stts(track.durations)]
+
+        if track.has_composition_offsets:
+            tables.append(self._make_ctts(track.composition_offsets))
+
+        if not track.all_sync:
+            tables.append(make_full_box(b"stss", 0, 0, struct.pack(">I", len(track.sync_samples)) + to_big_endian(array("I", track.sync_samples))))
+
+        tables.append(self._make_stsc([chunk[2] for chunk in track.chunks]))
+        tables.append(self._make_stsz(track.sizes))
+
+        if use_co64:
+            tables.append(make_full_box(b"co64", 0, 0, struct.pack(">I", len(chunk_offsets)) + to_big_endian(array("Q", chunk_offsets))))
+        else:
+            tables.append(make_full_box(b"stco", 0, 0, struct.pack(">I", len(chunk_offsets)) + to_big_endian(array("I", chunk_offsets))))
+
+        return make_box(b"stbl", b"".join(tables))
+
+    @staticmethod
+    def _run_length(values: array) -> list[tuple[int, int]]:
+        entries = []
+        previous = None
+        count = 0
+
+        for value in values:
+            if value == previous:
+                count += 1
+                continue
+
+            if count:
+                entries.append((count, previous))
+
+            previous = value
+            count = 1
+
+        if count:
+            entries.append((count, previous))
+
+        return entries
+
+    def _make_stts(self, durations: array) -> bytes:
+        entries = self._run_length(durations)
+
+        return make_full_box(b"stts", 0, 0, struct.pack(">I", len(entries)) + b"".join(struct.pack(">II", *entry) for entry in entries))
+
+    def _make_ctts(self, offsets: array) -> bytes:
+        entries = self._run_length(offsets)
+
+        # 有负的合成时间偏移时必须用 version 1，否则按无符号解析会变成极大的值
+        version = 1 if any(value < 0 for value in offsets) else 0
+        entry_format = ">Ii" if version == 1 else ">II"
+
+        return make_full_box(b"ctts", version, 0, struct.pack(">I", len(entries)) + b"".join(struct.pack(entry_format, *entry) for entry in entries))
+
+    @staticmethod
+    def _make_stsc(samples_per_chunk: list[int]) -> bytes:
+        entries = []
+        previous = None
+
+        for index, count in enumerate(samples_per_chunk):
+            if count != previous:
+                entries.append(struct.pack(">III", index + 1, count, 1))
+                previous = count
+
+        return make_full_box(b"stsc", 0, 0, struct.pack(">I", len(entries)) + b"".join(entries))
+
+    @staticmethod
+    def _make_stsz(sizes: array) -> bytes:
+        if sizes and sizes.count(sizes[0]) == len(sizes):
+            return make_full_box(b"stsz", 0, 0, struct.pack(">II", sizes[0], len(sizes)))
+
+        return make_full_box(b"stsz", 0, 0, struct.pack(">II", 0, len(sizes)) + to_big_endian(sizes))
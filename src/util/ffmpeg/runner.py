@@ -1,11 +1,15 @@
 from ..common.translator import Translator
 
 from .command import FFmpegCommand
+from .remux import MP4Remuxer
 
-from typing import Optional, List
+from typing import Iterable, Optional, List
+from pathlib import Path
 from collections import deque
 from threading import Lock, Thread
 import subprocess
+import psutil
+import time
 import re
 import os
 
@@ -17,6 +21,9 @@ _DURATION_PATTERN = re.compile(r"Duration:\s*(\d+):(\d{2}):(\d{2})\.(\d+)")
 # -progress 每个周期输出一组 key=value，其中这一项是已处理的微秒数
 _PROGRESS_TIME_KEY = "out_time_us="
 
+# 每组进度以这一项收尾，顺带在这时采样 FFmpeg 的 CPU 时间
+_PROGRESS_END_KEY = "progress="
+
 # 两边都只留尾部。加了 -nostats 之后 stderr 已经没有进度行刷屏，
 # 但个别警告仍可能反复出现；stdout 那边则整个都是进度，留存价值更低
 _STDERR_KEEP_LINES = 500
@@ -32,10 +39,16 @@ class FFmpegRunner(QThread):
         self._cmd = cmd
         self._cwd = None
         self._proc: Optional[subprocess.Popen] = None
+        self._stdin_source: Optional[Iterable[bytes]] = None
 
         self._duration = 0.0
         self._last_progress = -1
 
+        # 运行耗时与 FFmpeg 进程累计的 CPU 时间（秒），供 MergeScheduler 估算各类合并任务的资源占用
+        self.elapsed = 0.0
+        self.cpu_time = 0.0
+        self._ps_proc: Optional[psutil.Process] = None
+
         # 保护「创建子进程」与「请求终止」这一对操作。二者分处两个线程，
         # 若 stop() 抢在 Popen 之前完成，终止请求就会落空，线程会一直跑到 FFmpeg 自己结束
         self._proc_lock = Lock()
@@ -60,6 +73,16 @@ class FFmpegRunner(QThread):
 
         return self
 
+    def set_stdin_source(self, source: Iterable[bytes]):
+        """
+        指定写入 FFmpeg stdin 的数据来源，配合输入路径 pipe:0 使用
+
+        由单独的线程逐块写入，迭代结束后关闭 stdin，FFmpeg 随即读到 EOF
+        """
+        self._stdin_source = source
+
+        return self
+
     def run(self):
         return_code = -1
         stdout = ""
@@ -77,13 +100,15 @@ class FFmpegRunner(QThread):
                     # 线程刚启动就被要求停止，此时还没有子进程可以终止，直接收工
                     return
 
+                started_at = time.monotonic()
+
                 self._proc = subprocess.Popen(
                     self._build_exec_command(),
                     stdout = subprocess.PIPE,
                     stderr = subprocess.PIPE,
                     # FFmpeg 默认会去读 stdin 响应交互按键，并为此打印一行 Press [q] to stop。
-                    # 本进程没有控制台，这条输入通道只可能带来干扰，直接断掉
-                    stdin = subprocess.DEVNULL,
+                    # 本进程没有控制台，这条输入通道只可能带来干扰，除非用它传输入数据，否则直接断掉
+                    stdin = subprocess.PIPE if self._stdin_source is not None else subprocess.DEVNULL,
                     cwd = self._cwd,
                     text = True,
                     encoding = "utf-8",
@@ -91,10 +116,22 @@ class FFmpegRunner(QThread):
                     **kwargs
                 )
 
+            try:
+                self._ps_proc = psutil.Process(self._proc.pid)
+
+            except psutil.Error:
+                # 进程可能已经退出，拿不到 CPU 时间只影响调度估算
+                pass
+
+            if self._stdin_source is not None:
+                Thread(target = self._write_stdin, args = (self._proc, ), name = "ffmpeg-stdin", daemon = True).start()
+
             stdout, stderr = self._read_output(self._proc)
 
             return_code = self._proc.wait()
 
+            self.elapsed = time.monotonic() - started_at
+
         except Exception as e:
             exception = e
             stdout = ""
@@ -127,6 +164,32 @@ class FFmpegRunner(QThread):
         """
         return [self._cmd[0], "-progress", "pipe:1", "-nostats", *self._cmd[1:]]
 
+    def _write_stdin(self, proc: subprocess.Popen):
+        source = iter(self._stdin_source)
+
+        try:
+            # text = True 时 stdin 是文本流，输入数据要直接写进底层的字节流
+            pipe = proc.stdin.buffer
+
+            for data in source:
+                pipe.write(data)
+
+        except (OSError, ValueError):
+            # FFmpeg 出错退出或被终止时管道随之断开，结果由返回码体现，这里不必处理
+            pass
+
+        finally:
+            close = getattr(source, "close", None)
+
+            if close:
+                close()
+
+            try:
+                proc.stdin.close()
+
+            except Exception:
+                pass
+
     def _read_output(self, proc: subprocess.Popen):
         """
         主线程逐行读 stdout 上的进度，后台线程同时读 stderr
@@ -171,6 +234,9 @@ class FFmpegRunner(QThread):
 
                 self._parse_progress(line)
 
+                if line.startswith(_PROGRESS_END_KEY):
+                    self._sample_cpu_time()
+
         except Exception:
             pass
 
@@ -185,6 +251,19 @@ class FFmpegRunner(QThread):
 
         return "".join(stdout_lines), "".join(stderr_lines)
 
+    def _sample_cpu_time(self):
+        # 进程退出后就查不到了，只能在运行期间按进度周期采样，最后一次采样即为近似的总 CPU 时间
+        if self._ps_proc is None:
+            return
+
+        try:
+            times = self._ps_proc.cpu_times()
+
+            self.cpu_time = times.user + times.system
+
+        except psutil.Error:
+            pass
+
     def _parse_duration(self, line: str):
         # 合并阶段有视频、音频、封面等多路输入，每一路都会打印自己的 Duration，
         # 封面这类图片输入的时长极短，取最长的那一路才是输出文件的实际时长
@@ -249,3 +328,60 @@ class FFmpegRunner(QThread):
                 pass
 
         return self.wait(timeout)
+
+class RemuxRunner(QThread):
+    """
+    在后台线程执行 MP4Remuxer，信号与 FFmpegRunner 一致，Merger 可以按同样的方式接入
+    """
+    finished_signal = Signal(int, str, str)  # return_code, stdout, stderr
+    error_signal = Signal(Exception, str, str)  # exception, stdout, stderr
+    progress_signal = Signal(int)  # 0 - 100
+
+    def __init__(self, remuxer: MP4Remuxer, parent = None):
+        super().__init__(parent)
+
+        self._remuxer = remuxer
+        self._last_progress = -1
+
+        self.elapsed = 0.0
+        self.cpu_time = 0.0
+
+        remuxer.on_progress = self._on_progress
+
+    def set_cwd(self, cwd: str | Path):
+        # 与 FFmpegRunner 的接口保持一致，路径在创建 MP4Remuxer 时已经确定
+        return self
+
+    def set_duration(self, duration: float):
+        return self
+
+    def run(self):
+        started_at = time.monotonic()
+        started_cpu = time.thread_time()
+
+        try:
+            self._remuxer.run()
+
+        except Exception as e:
+            self.error_signal.emit(e, "", str(e))
+            return
+
+        finally:
+            self.elapsed = time.monotonic() - started_at
+            self.cpu_time = time.thread_time() - started_cpu
+
+        self.finished_signal.emit(0, "", "")
+
+    def _on_progress(self, copied: int, total: int):
+        # 与 FFmpegRunner 一样留出最后 1% 给重命名等收尾步骤
+        progress = min(99, copied * 100 // total) if total else 99
+
+        if progress != self._last_progress:
+            self._last_progress = progress
+
+            self.progress_signal.emit(progress)
+
+    def stop(self, timeout: int = 3000):
+        self._remuxer.stop()
+
+        return self.wait(timeout)
\ No newline at end of file
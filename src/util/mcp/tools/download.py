@@ -263,8 +263,7 @@ def _split_duplicates(found: list, found_ids: list):
     """
     分出已经下载过的条目
 
-    返回 (待下载的条目, 对应的 id, 重复条目的标题)。查库在当前线程完成：
-    每个线程各持有自己的 SQLite 连接，且这里只读不写
+    返回 (待下载的条目, 对应的 id, 重复条目的标题)。整批一次判定，见 TaskManager.check_duplicates
     """
     from ...download.task.manager import task_manager
 
@@ -272,17 +271,21 @@ def _split_duplicates(found: list, found_ids: list):
     fresh_ids = []
     duplicates = []
 
-    for episode, episode_id in zip(found, found_ids):
-        try:
-            if task_manager.is_duplicate(episode):
-                duplicates.append(episode.get("title", ""))
+    try:
+        flags = task_manager.check_duplicates(found)
 
-                continue
+    except Exception:
+        # 判定失败时按未重复处理，后面 TaskManager 还会再判一次，
+        # 顶多是多走一遍流程，总好过把能下的条目挡在门外
+        logger.exception("预检重复下载失败")
 
-        except Exception:
-            # 查库失败时按未重复处理，后面 TaskManager 还会再判一次，
-            # 顶多是多走一遍流程，总好过把能下的条目挡在门外
-            logger.exception("预检重复下载失败：%s", episode.get("title", ""))
+        flags = [False] * len(found)
+
+    for episode, episode_id, duplicate in zip(found, found_ids, flags):
+        if duplicate:
+            duplicates.append(episode.get("title", ""))
+
+            continue
 
         fresh.append(episode)
         fresh_ids.append(episode_id)
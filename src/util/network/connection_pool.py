@@ -0,0 +1,391 @@
+from .request import get_ssl_context, get_proxy_mounts, POOL_TIMEOUT
+
+from ..common.config import config
+
+from threading import Lock
+import logging
+import httpx
+import time
+
+logger = logging.getLogger(__name__)
+
+# 全部下载任务共用的连接上限。原先每个任务各建一个 Client，连接数随任务数成倍增长，
+# 5 个任务 × 8 线程就是 40 条冷连接，且暂停时全部断开，恢复时又要重新握手
+SHARED_MAX_CONNECTIONS = 64
+SHARED_MAX_KEEPALIVE_CONNECTIONS = 32
+
+# 空闲连接的保留时间。httpcore 默认只有 5 秒，任务之间的切换（出队、合并、下一个任务解析）
+# 往往比这更久，连接还没来得及复用就被回收了
+SHARED_KEEPALIVE_EXPIRY = 30.0
+
+_transport = None
+_mounts = None
+_transport_lock = Lock()
+
+def is_http2_enabled() -> bool:
+    # h2 是固定依赖，HTTP/2 只由设置项决定
+    return config.get(config.http2_download)
+
+class HTTP2Fallback:
+    # HTTP/2 出现协议错误的节点，此后一律改走 HTTP/1.1。跨任务共享，直到程序退出
+    _lock = Lock()
+    _hosts: set[str] = set()
+
+    @classmethod
+    def disable(cls, host: str, reason: Exception):
+        with cls._lock:
+            if host in cls._hosts:
+                return
+
+            cls._hosts.add(host)
+
+        logger.warning("节点 %s 的 HTTP/2 连接出错，已改用 HTTP/1.1：%s", host, reason)
+
+    @classmethod
+    def is_disabled(cls, host: str) -> bool:
+        with cls._lock:
+            return host in cls._hosts
+
+class PoolStats:
+    # 连接池统计，跨任务累计，供日志查看连接复用的效果
+    _lock = Lock()
+    requests = 0
+    hits = 0
+    new_connections = 0
+    handshake_time = 0.0
+
+    @classmethod
+    def record(cls, new_connection: bool, handshake_time: float):
+        with cls._lock:
+            cls.requests += 1
+
+            if new_connection:
+                cls.new_connections += 1
+                cls.handshake_time += handshake_time
+            else:
+                cls.hits += 1
+
+    @classmethod
+    def snapshot(cls) -> dict:
+        with cls._lock:
+            return {
+                "requests": cls.requests,
+                "hits": cls.hits,
+                "new_connections": cls.new_connections,
+                "handshake_time": round(cls.handshake_time, 3),
+                "average_handshake_time": round(cls.handshake_time / cls.new_connections, 3) if cls.new_connections else 0.0
+            }
+
+class _RequestTracer:
+    # 借助 httpcore 的 trace 扩展判断本次请求是否新建了连接，并统计 TCP + TLS 握手耗时
+    def __init__(self, previous = None):
+        self.previous = previous
+        self.connect_started = 0.0
+        self.connect_finished = 0.0
+        self.recorded = False
+
+    def __call__(self, event_name: str, info: dict):
+        match event_name:
+            case "connection.connect_tcp.started":
+                self.connect_started = time.monotonic()
+
+            case "connection.connect_tcp.complete" | "connection.start_tls.complete":
+                self.connect_finished = time.monotonic()
+
+            case "http11.send_request_headers.started" | "http2.send_request_headers.started":
+                # 重定向、重试会让同一个 tracer 收到多轮事件，只统计第一轮
+                if not self.recorded:
+                    self.recorded = True
+
+                    new_connection = self.connect_started > 0
+
+                    PoolStats.record(new_connection, max(self.connect_finished - self.connect_started, 0.0) if new_connection else 0.0)
+
+        if self.previous:
+            self.previous(event_name, info)
+
+class _AsyncRequestTracer(_RequestTracer):
+    # 异步传输层要求 trace 回调是协程函数
+    async def __call__(self, event_name: str, info: dict):
+        super().__call__(event_name, info)
+
+class _TracedAsyncTransport(httpx.AsyncBaseTransport):
+    # 异步下载引擎的传输层，只负责记录连接复用统计。
+    # 暂停、取消由引擎直接取消对应的协程，不需要像 TaskTransport 那样按任务追踪响应
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.extensions["trace"] = _AsyncRequestTracer()
+
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+class _TrackedStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, owner: "TaskTransport"):
+        self.stream = stream
+        self.owner = owner
+
+    def __iter__(self):
+        yield from self.stream
+
+    def close(self):
+        self.owner._untrack(self)
+
+        self.stream.close()
+
+class _FallbackStream(httpx.SyncByteStream):
+    def __init__(self, stream: httpx.SyncByteStream, host: str):
+        self.stream = stream
+        self.host = host
+
+    def __iter__(self):
+        try:
+            yield from self.stream
+
+        except (httpx.RemoteProtocolError, httpx.LocalProtocolError) as e:
+            # 读取途中的协议错误无法在这一层透明重试，交给分片自身的重试，
+            # 但之后发往该节点的请求都改走 HTTP/1.1
+            HTTP2Fallback.disable(self.host, e)
+
+            raise
+
+    def close(self):
+        self.stream.close()
+
+class FallbackTransport(httpx.BaseTransport):
+    """
+    优先使用 HTTP/2 的传输层
+
+    一个节点只需一条多路复用的连接、一次 TLS 握手。服务端不支持 h2 时 ALPN 协商
+    会自动选择 HTTP/1.1；这里额外处理协商成功但 h2 实现有问题的节点：
+    一旦出现协议错误，该节点此后一律改走 HTTP/1.1
+    """
+    def __init__(self, http2_transport: httpx.BaseTransport, http1_transport: httpx.BaseTransport):
+        self.http2_transport = http2_transport
+        self.http1_transport = http1_transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+
+        if HTTP2Fallback.is_disabled(host):
+            return self.http1_transport.handle_request(request)
+
+        try:
+            response = self.http2_transport.handle_request(request)
+
+        except (httpx.RemoteProtocolError, httpx.LocalProtocolError) as e:
+            # 请求尚未收到响应，且下载请求都不带请求体，可以直接改用 HTTP/1.1 重发
+            HTTP2Fallback.disable(host, e)
+
+            return self.http1_transport.handle_request(request)
+
+        response.stream = _FallbackStream(response.stream, host)
+
+        return response
+
+    def close(self):
+        self.http2_transport.close()
+        self.http1_transport.close()
+
+def build_transport(**kwargs) -> httpx.BaseTransport:
+    """
+    按设置创建 HTTPTransport，启用 HTTP/2 时返回带回退的传输层
+
+    :param kwargs: 传给 httpx.HTTPTransport 的参数
+    """
+    if is_http2_enabled():
+        return FallbackTransport(
+            httpx.HTTPTransport(http2 = True, **kwargs),
+            httpx.HTTPTransport(**kwargs)
+        )
+
+    return httpx.HTTPTransport(**kwargs)
+
+class _AsyncFallbackStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, host: str):
+        self.stream = stream
+        self.host = host
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.stream:
+                yield chunk
+
+        except (httpx.RemoteProtocolError, httpx.LocalProtocolError) as e:
+            HTTP2Fallback.disable(self.host, e)
+
+            raise
+
+    async def aclose(self):
+        await self.stream.aclose()
+
+class AsyncFallbackTransport(httpx.AsyncBaseTransport):
+    # FallbackTransport 的异步版本，与同步下载共用 HTTP2Fallback 的节点记录
+    def __init__(self, http2_transport: httpx.AsyncBaseTransport, http1_transport: httpx.AsyncBaseTransport):
+        self.http2_transport = http2_transport
+        self.http1_transport = http1_transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+
+        if HTTP2Fallback.is_disabled(host):
+            return await self.http1_transport.handle_async_request(request)
+
+        try:
+            response = await self.http2_transport.handle_async_request(request)
+
+        except (httpx.RemoteProtocolError, httpx.LocalProtocolError) as e:
+            HTTP2Fallback.disable(host, e)
+
+            return await self.http1_transport.handle_async_request(request)
+
+        response.stream = _AsyncFallbackStream(response.stream, host)
+
+        return response
+
+    async def aclose(self):
+        await self.http2_transport.aclose()
+        await self.http1_transport.aclose()
+
+def build_async_transport(**kwargs) -> httpx.AsyncBaseTransport:
+    """
+    build_transport 的异步版本
+
+    :param kwargs: 传给 httpx.AsyncHTTPTransport 的参数
+    """
+    if is_http2_enabled():
+        return AsyncFallbackTransport(
+            httpx.AsyncHTTPTransport(http2 = True, **kwargs),
+            httpx.AsyncHTTPTransport(**kwargs)
+        )
+
+    return httpx.AsyncHTTPTransport(**kwargs)
+
+class TaskTransport(httpx.BaseTransport):
+    """
+    单个下载任务的传输层
+
+    请求全部转交给进程内共享的 HTTPTransport，连接在各任务之间复用。
+    close() 只断开本任务仍在读取的响应（暂停、取消时分片线程能立即返回），
+    不会关闭共享连接池本身
+    """
+    def __init__(self, transport: httpx.BaseTransport):
+        self.transport = transport
+        self.responses: set[_TrackedStream] = set()
+        self.lock = Lock()
+        self.closed = False
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if self.closed:
+            raise httpx.ConnectError("下载会话已关闭", request = request)
+
+        request.extensions["trace"] = _RequestTracer(request.extensions.get("trace"))
+
+        response = self.transport.handle_request(request)
+
+        stream = _TrackedStream(response.stream, self)
+        response.stream = stream
+
+        with self.lock:
+            closed = self.closed
+
+            if not closed:
+                self.responses.add(stream)
+
+        if closed:
+            stream.close()
+
+        return response
+
+    def _untrack(self, stream: _TrackedStream):
+        with self.lock:
+            self.responses.discard(stream)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+
+            responses = list(self.responses)
+            self.responses.clear()
+
+        for stream in responses:
+            try:
+                stream.stream.close()
+
+            except Exception:
+                logger.debug("关闭下载响应失败", exc_info = True)
+
+def _get_shared_transports():
+    global _transport, _mounts
+
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                ssl_context = get_ssl_context()
+
+                limits = httpx.Limits(
+                    max_connections = SHARED_MAX_CONNECTIONS,
+                    max_keepalive_connections = SHARED_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry = SHARED_KEEPALIVE_EXPIRY
+                )
+
+                # 代理模式改动需要重启程序生效，挂载与主传输层一样只建一次
+                _mounts = get_proxy_mounts()
+                _transport = build_transport(retries = 5, verify = ssl_context, limits = limits)
+
+    return _transport, _mounts
+
+def create_download_client(headers: dict) -> httpx.Client:
+    """
+    创建一个下载任务专用的 Client
+
+    Client 本身只承载该任务的请求头与 Cookie，连接由全部任务共享。
+    关闭它会中断该任务仍在进行的请求，但不影响其他任务的连接
+    """
+    transport, mounts = _get_shared_transports()
+
+    task_mounts = None
+
+    if mounts:
+        task_mounts = {
+            pattern: TaskTransport(mount) if mount is not None else None
+            for pattern, mount in mounts.items()
+        }
+
+    return httpx.Client(
+        transport = TaskTransport(transport),
+        mounts = task_mounts,
+        headers = headers,
+        timeout = httpx.Timeout(10, pool = POOL_TIMEOUT)
+    )
+
+def create_async_download_client() -> httpx.AsyncClient:
+    """
+    创建异步下载引擎使用的 AsyncClient
+
+    整个进程只需要一个：全部任务的分片都跑在同一个事件循环上，连接天然共享。
+    请求头（Referer 等）随每个请求传入。
+    必须在事件循环所在的线程上创建和使用
+    """
+    limits = httpx.Limits(
+        max_connections = SHARED_MAX_CONNECTIONS,
+        max_keepalive_connections = SHARED_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry = SHARED_KEEPALIVE_EXPIRY
+    )
+
+    # 与同步下载一样，h2 实现有问题的节点自动改走 HTTP/1.1
+    transport = build_async_transport(retries = 5, verify = get_ssl_context(), limits = limits)
+
+    mounts = get_proxy_mounts(httpx.AsyncHTTPTransport)
+
+    return httpx.AsyncClient(
+        transport = _TracedAsyncTransport(transport),
+        mounts = mounts,
+        timeout = httpx.Timeout(10, pool = POOL_TIMEOUT)
+    )
+
+def get_pool_stats() -> dict:
+    return PoolStats.snapshot()
@@ -46,14 +46,21 @@ def get_probe_client():
             if _probe_client is None:
                 import httpx
 
+                from .connection_pool import build_transport
+
                 ssl_context = get_ssl_context()
 
                 _probe_client = httpx.Client(
-                    # 连接数放宽：批量下载时多个任务会同时探测（每个任务并发 PROBE_CONCURRENCY 条），
-                    # 上限太低会让请求卡在连接池排队上，白白吃掉时间预算
-                    limits = httpx.Limits(max_connections = 64, max_keepalive_connections = 16),
                     timeout = httpx.Timeout(PROBE_TIMEOUT, pool = PROBE_TIMEOUT),
-                    transport = httpx.HTTPTransport(retries = 0, verify = ssl_context),
+                    # 连接数放宽：批量下载时多个任务会同时探测（每个任务并发 PROBE_CONCURRENCY 条），
+                    # 上限太低会让请求卡在连接池排队上，白白吃掉时间预算。
+                    # limits 必须交给 transport，写在 Client 上会被忽略，见 request.get_limits。
+                    # 启用 HTTP/2 时探测与下载走同一套协议，探测阶段建立的连接也能说明节点是否支持 h2
+                    transport = build_transport(
+                        retries = 0,
+                        verify = ssl_context,
+                        limits = httpx.Limits(max_connections = 64, max_keepalive_connections = 16)
+                    ),
                     # 代理模式改动需要重启程序生效，因此这里创建一次即可
                     mounts = get_proxy_mounts(),
                     follow_redirects = True,
@@ -100,6 +107,8 @@ def resolve_download_url(url_list: list[str], min_file_size: int = 1024) -> dict
             result = _probe_tier(executor, tier, min_file_size, tier_deadline, failed_hosts, stats)
 
             if result:
+                result["url_list"] = _collect_source_urls(result["url"], tier_list, failed_hosts)
+
                 return result
 
     finally:
@@ -120,6 +129,29 @@ def resolve_download_url(url_list: list[str], min_file_size: int = 1024) -> dict
     ))
 
 
+def _collect_source_urls(url: str, tier_list: list[list[str]], failed_hosts: set) -> list[str]:
+    # 多节点下载时，除探测胜出的链接外，再附上其余节点上的同一文件作为备用来源。
+    # 这些节点没有逐个探测（那会把解析时间拉长数倍），由下载器在使用时核对文件大小，
+    # 出错即停用并降权。本次探测已失败或仍在冷却中的节点不予采用
+    if not config.get(config.multi_cdn_download):
+        return [url]
+
+    url_list = [url]
+    hosts = {CDN.get_netloc(url)}
+
+    for tier in tier_list:
+        for candidate in tier:
+            host = CDN.get_netloc(candidate)
+
+            if not host or host in hosts or host in failed_hosts or HostHealth.is_cooling(host):
+                continue
+
+            hosts.add(host)
+            url_list.append(candidate)
+
+    return url_list
+
+
 def _probe_tier(executor, url_list: list[str], min_file_size: int, deadline: float, failed_hosts: set, stats: dict) -> dict:
     index = 0
     count = len(url_list)
@@ -105,15 +105,18 @@ def _load_system_certs(context: ssl.SSLContext):
         # 叠加失败不影响上面已经加载好的证书，保持原有行为继续可用即可，不必让整个上下文构建失败
         logger.warning("加载系统根证书失败，仅使用已加载的证书列表", exc_info = True)
 
-def get_mounts(proxies = None):
+def get_mounts(proxies = None, transport_class = None):
+    # transport_class 默认为 httpx.HTTPTransport，异步下载引擎传入 httpx.AsyncHTTPTransport
     import httpx
 
+    transport_class = transport_class or httpx.HTTPTransport
+
     if proxies:
         proxy_url = proxies.get("http") or proxies.get("https")
 
         return {
-            "http://": httpx.HTTPTransport(proxy = proxy_url, retries = 5, limits = get_limits(), verify = get_ssl_context()),
-            "https://": httpx.HTTPTransport(proxy = proxy_url, retries = 5, limits = get_limits(), verify = get_ssl_context())
+            "http://": transport_class(proxy = proxy_url, retries = 5, limits = get_limits(), verify = get_ssl_context()),
+            "https://": transport_class(proxy = proxy_url, retries = 5, limits = get_limits(), verify = get_ssl_context())
         }
     else:
         return None
@@ -131,7 +134,7 @@ def _get_environment_proxies():
 
         return {}
 
-def get_env_mounts():
+def get_env_mounts(transport_class = None):
     # httpx 只在未显式传入 transport 时才会读取环境变量（Windows / macOS 上还包括系统代理设置）中的代理，
     # 见 httpx._client 中的 allow_env_proxies = trust_env and transport is None。
     # 本项目为了设置 retries 并复用全局 SSLContext，一律显式传入 transport，系统代理因此被静默绕过：
@@ -139,6 +142,8 @@ def get_env_mounts():
     # 表现为二维码登录等请求直接失败。这里把系统代理手动还原成 mounts，补回 httpx 的默认行为。
     import httpx
 
+    transport_class = transport_class or httpx.HTTPTransport
+
     mounts = {}
 
     for pattern, proxy_url in _get_environment_proxies().items():
@@ -148,7 +153,7 @@ def get_env_mounts():
         else:
             try:
                 # httpx 对 http(s) 代理不使用 retries，此处与 get_mounts 一样只依赖代理本身的连接行为
-                mounts[pattern] = httpx.HTTPTransport(proxy = proxy_url, limits = get_limits(), verify = get_ssl_context())
+                mounts[pattern] = transport_class(proxy = proxy_url, limits = get_limits(), verify = get_ssl_context())
 
             except Exception as e:
                 # httpx 不认识的代理协议（如 socks4）会抛 ValueError，socks5 缺少 socksio 依赖时会抛 ImportError。
@@ -157,17 +162,17 @@ def get_env_mounts():
 
     return mounts or None
 
-def get_proxy_mounts():
+def get_proxy_mounts(transport_class = None):
     # 按用户选择的代理模式生成 httpx Client 使用的 mounts，解析与下载共用同一套判定：
     # 不启用代理 → None（直连）；使用系统代理 → 从环境变量还原；手动设置 → 使用程序内配置的代理服务器
     from .proxy import Proxy
 
     match config.get(config.proxy_mode):
         case ProxyMode.MANUAL:
-            return get_mounts(Proxy().get_proxies())
+            return get_mounts(Proxy().get_proxies(), transport_class)
 
         case ProxyMode.SYSTEM:
-            return get_env_mounts()
+            return get_env_mounts(transport_class)
 
         case _:
             return None
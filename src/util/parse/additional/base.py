@@ -2,7 +2,11 @@ from ...download.task.info import TaskInfo
 from ..parser.base import ParserBase
 
 from pathlib import Path
-from typing import List
+from threading import Lock
+from typing import Iterable, List
+
+# 附加内容的各项解析会并发进行，累加同一任务的文件大小时需要互斥
+_file_size_lock = Lock()
 
 class AdditionalParserBase(ParserBase):
     def __init__(self, task_info: TaskInfo):
@@ -10,15 +14,16 @@ class AdditionalParserBase(ParserBase):
 
         self.task_info: TaskInfo = task_info
 
-    def _write(self, contents: str | bytes, suffix: str, name: str = None, qualifier: List[str] = None):
-        if isinstance(contents, str):
-            mode = "w"
-            encoding = "utf-8"
-
-        elif isinstance(contents, bytes):
+    def _write(self, contents: str | bytes | Iterable[str], suffix: str, name: str = None, qualifier: List[str] = None):
+        # contents 也可以是逐段产出文本的生成器，边生成边写入，不必在内存里拼出整个文件
+        if isinstance(contents, bytes):
             mode = "wb"
             encoding = None
 
+        else:
+            mode = "w"
+            encoding = "utf-8"
+
         if name is None:
             name = self.task_info.File.name
 
@@ -30,8 +35,18 @@ class AdditionalParserBase(ParserBase):
         path = self.__base_path / f"{name_parts}.{suffix}"
         path.parent.mkdir(parents = True, exist_ok = True)
 
-        with open(path, mode, encoding = encoding) as f:
-            f.write(contents)
+        try:
+            with open(path, mode, encoding = encoding) as f:
+                if isinstance(contents, (str, bytes)):
+                    f.write(contents)
+                else:
+                    f.writelines(contents)
+
+        except Exception:
+            # 生成器中途出错时不留下写了一半的文件
+            path.unlink(missing_ok = True)
+
+            raise
 
         self._update_file_size(path)
 
@@ -55,8 +70,11 @@ class AdditionalParserBase(ParserBase):
 
     def _update_file_size(self, path: Path):
         if path.exists():
-            self.task_info.Download.downloaded_size += path.stat().st_size
-            self.task_info.Download.total_size += path.stat().st_size
+            size = path.stat().st_size
+
+            with _file_size_lock:
+                self.task_info.Download.downloaded_size += size
+                self.task_info.Download.total_size += size
 
     def _on_error(self, error_message: str):
         raise RuntimeError(error_message)
@@ -1,37 +1,44 @@
 from ...network.request import ResponseType, SyncNetWorkRequest
 from ...download.task.info import TaskInfo
 from ...common.translator import Translator
-from ...common._json import json_dumps
 from ...common.enum import DanmakuType
 from ...download.task.options import resolve
 
 from .base import AdditionalParserBase
 from .file.danmaku_ass import DanmakuASS
 from .file.danmaku_xml import DanmakuXML
+from .file.danmaku_json import DanmakuJSON
+from .file.danmaku_record import DanmakuRecord, decode_segment, decode_segment_dicts
 
-import util.misc.dm_pb2 as dm_pb2
-
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List
+from collections import deque
+from itertools import chain
 from math import ceil
 
+# 同时请求的弹幕分包数。每包 6 分钟，长片有几十包，逐个请求要等上十几秒；
+# 并发过多又容易触发接口风控。
+# 这同时也是预取窗口：已请求但尚未写入文件的分包最多这么多个，内存占用与片长无关
+DANMAKU_FETCH_CONCURRENCY = 4
+
 class DanmakuParser(AdditionalParserBase):
     def __init__(self, task_info: TaskInfo):
         super().__init__(task_info)
 
     def parse(self):
-        dict_list = self._get_all_protobuf_parts()
-
+        # 分包在写入文件的过程中才逐个取得，请求、解码、格式化与写入流水进行。
+        # XML 与 ASS 只用到少数字段，解码成精简的 DanmakuRecord；JSON 导出保留全部字段
         danmaku_type = resolve(self.task_info, "danmaku_type")
 
         match danmaku_type:
             case DanmakuType.XML:
-                contents, suffix = self._to_xml(dict_list)
+                contents, suffix = self._to_xml(self._iter_segments(decode_segment))
 
             case DanmakuType.ASS:
-                contents, suffix = self._to_ass(dict_list)
+                contents, suffix = self._to_ass(self._iter_segments(decode_segment))
 
             case DanmakuType.JSON:
-                contents, suffix = self._to_json(dict_list)
+                contents, suffix = self._to_json(self._iter_segments(decode_segment_dicts))
 
         file_name = self._write(contents, suffix = suffix, name = self.task_info.File.name, qualifier = [Translator.ADDITIONAL_FILES_QUALIFIER("DANMAKU")])
 
@@ -51,32 +58,51 @@ class DanmakuParser(AdditionalParserBase):
             kind = "danmaku"
         )
 
-    def _to_xml(self, dict_list: List[dict]) -> tuple:
-        xml = DanmakuXML(dict_list, self.task_info.Episode.cid).generate()
+    def _to_xml(self, segments: Iterator[List[DanmakuRecord]]) -> tuple:
+        xml = DanmakuXML(segments, self.task_info.Episode.cid).generate()
 
         return xml, "xml"
 
-    def _to_ass(self, dict_list: List[dict]) -> tuple:
-        ass = DanmakuASS(dict_list, self.task_info.Basic.show_title).generate()
+    def _to_ass(self, segments: Iterator[List[DanmakuRecord]]) -> tuple:
+        # ASS 要按出现时间排好序再分配轨道，只能先收齐全部弹幕
+        ass = DanmakuASS(list(chain.from_iterable(segments)), self.task_info.Basic.show_title).generate()
 
         return ass, "ass"
 
-    def _to_json(self, dict_list: List[dict]) -> tuple:
-        return json_dumps(dict_list, indent = 2), "json"
+    def _to_json(self, segments: Iterator[List[dict]]) -> tuple:
+        json = DanmakuJSON(segments).generate()
+
+        return json, "json"
+
+    def _iter_segments(self, decode: Callable[[bytes], list]) -> Iterator[list]:
+        # 按分包顺序逐个产出由 decode 解码后的弹幕。后面几包提前在工作线程里请求并解码，
+        # 但最多领先 DANMAKU_FETCH_CONCURRENCY 包，消费方写完一包才会再请求下一包
+        if not (duration := self.task_info.Episode.duration):
+            return
+
+        # 每6分钟一包，向上取整
+        parts = ceil(duration / 360)
+
+        executor = ThreadPoolExecutor(max_workers = min(parts, DANMAKU_FETCH_CONCURRENCY), thread_name_prefix = "danmaku-seg")
 
-    def _get_all_protobuf_parts(self):
-        if duration := self.task_info.Episode.duration:
-            segment_list = []
+        try:
+            pending = deque()
+            next_index = 1
 
-            # 每6分钟一包，向上取整
-            parts = ceil(duration / 360)
+            while pending or next_index <= parts:
+                while next_index <= parts and len(pending) < DANMAKU_FETCH_CONCURRENCY:
+                    pending.append(executor.submit(self._get_segment, decode, self.task_info.Episode.cid, next_index))
 
-            for index in range(1, parts + 1):
-                segment_list.append(self._get_protobuf_danmaku(self.task_info.Episode.cid, index))
+                    next_index += 1
 
-            return self._proto_to_dict_list(segment_list)
-        
-        return []
+                yield pending.popleft().result()
+
+        finally:
+            # 某一包失败或写入中途出错时不再请求剩下的包
+            executor.shutdown(wait = False, cancel_futures = True)
+
+    def _get_segment(self, decode: Callable[[bytes], list], cid: int, index: int) -> list:
+        return decode(self._get_protobuf_danmaku(cid, index))
 
     def _get_protobuf_danmaku(self, cid: int, index: int):
         params = {
@@ -91,20 +117,3 @@ class DanmakuParser(AdditionalParserBase):
         response = request.run()
 
         return response
-
-    def _proto_to_dict_list(self, segment_list: List[bytes]) -> List[dict]:
-        from google.protobuf.json_format import MessageToDict
-        
-        # 将所有 protobuf 数据转换为 dict 格式，方便后续处理
-        dict_list = []
-
-        for segment in segment_list:
-            DmSeg = dm_pb2.DmSegMobileReply()
-            DmSeg.ParseFromString(segment)
-
-            temp_entry = MessageToDict(DmSeg).get("elems", [])
-
-            # 过滤无效的弹幕数据
-            dict_list.extend([entry for entry in temp_entry if entry.get("stime") and entry.get("text")])
-
-        return dict_list
\ No newline at end of file
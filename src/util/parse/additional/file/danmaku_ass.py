@@ -4,7 +4,12 @@ from PySide6.QtGui import QFontMetrics
 from ....common.config import config
 from ....format.time import Time
 
-from typing import List, Tuple, Optional
+from .danmaku_record import DanmakuRecord
+
+from typing import Callable, Iterator, List, Tuple, Optional
+from operator import attrgetter
+from heapq import heappop, heappush
+from math import inf
 
 ass_base = """[Script Info]
 ; Script generated by Bili23 Downloader
@@ -28,70 +33,121 @@ Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
 {dialogues}
 """
 
-class ScrollTrack:
-    def __init__(self, screen_width: int, min_gap: int):
-        self.screen_width = screen_width
-        self.min_gap = min_gap
-        self.last_stime = -1
-        self.last_duration = 0
-        self.last_width = 0
-        self.last_speed = 0.0
-
-    def can_fit(self, stime: int, speed: float) -> bool:
-        if self.last_stime == -1:
-            return True
-            
-        # 条件1：前一条弹幕的尾部必须离开右边缘，并保持最小间距
-        cond1 = stime >= self.last_stime + ((self.last_width + self.min_gap) / self.last_speed)
-        
-        # 条件2：前一条弹幕尾巴到达屏幕左边缘时，当前弹幕的头还没到达屏幕左边缘，并保持最小间距
-        cond2 = stime >= self.last_stime + self.last_duration - ((self.screen_width - self.min_gap) / speed)
-        
-        return cond1 and cond2
+class GlyphWidthCache(dict):
+    # 字符 -> 像素宽度。每个字符只向 Qt 查询一次，整条弹幕的宽度由各字符宽度相加，
+    # 热路径上不再有逐条弹幕的 Qt 调用
+    def __init__(self, font_metrics: QFontMetrics):
+        super().__init__()
 
-    def push(self, stime: int, duration_ms: int, text_width: int, speed: float):
-        self.last_stime = stime
-        self.last_duration = duration_ms
-        self.last_width = text_width
-        self.last_speed = speed
+        self.font_metrics = font_metrics
 
+    def __missing__(self, char: str) -> int:
+        width = self[char] = self.font_metrics.horizontalAdvance(char)
 
-class StaticTrack:
-    def __init__(self):
-        self.end_time = -1
-        
-    def can_fit(self, stime: int) -> bool:
-        return stime >= self.end_time
-        
-    def push(self, end_time: int):
-        self.end_time = end_time
+        return width
+
+    def text_width(self, text: str) -> int:
+        return sum(map(self.__getitem__, text))
+
+
+class TrackTree:
+    """
+    以行号为下标的最小值线段树，用来找出「行号最小的可用轨道」
+
+    原先每条弹幕都要从第一行开始逐行检查，满屏时一条弹幕要看遍所有行。
+    轨道能否放下新弹幕只取决于该行的一个时间值，且时间值越小越容易放下，
+    因此只需沿线段树往下走，左子树的最小值满足条件就往左，否则往右
+    """
+    def __init__(self, size: int, initial: float):
+        self.capacity = 1
+
+        while self.capacity < size:
+            self.capacity *= 2
+
+        # 补齐的叶子为 inf，永远不会被选中
+        self.tree = [inf] * (2 * self.capacity)
+
+        for row in range(size):
+            self.tree[self.capacity + row] = initial
+
+        for node in range(self.capacity - 1, 0, -1):
+            self.tree[node] = min(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def update(self, row: int, value: float):
+        tree = self.tree
+        node = self.capacity + row
+
+        tree[node] = value
+
+        while node > 1:
+            node //= 2
+            tree[node] = min(tree[2 * node], tree[2 * node + 1])
+
+    def first(self, fits: Callable[[float], bool]) -> Optional[int]:
+        # fits 须对时间值单调：某个值满足，则更小的值也满足
+        tree = self.tree
+
+        if not fits(tree[1]):
+            return None
+
+        node = 1
+
+        while node < self.capacity:
+            node *= 2
+
+            if not fits(tree[node]):
+                node += 1
+
+        return node - self.capacity
 
 
 class DanmakuLayoutEngine:
-    def __init__(self, screen_width: int, screen_height: int):
+    """
+    为弹幕分配轨道，弹幕须按出现时间（stime）从早到晚依次分配
+
+    判定条件与逐行检查时完全一致，浮点运算的顺序也保持不变，输出逐字节相同：
+      - 固定弹幕：上一条在该行的结束时间不晚于当前弹幕的出现时间
+      - 滚动弹幕：上一条的尾部已离开右边缘并留出最小间距（条件 1），
+        且它的尾部到达左边缘时，当前弹幕的头部尚未追上（条件 2）
+
+    滚动轨道的条件 1 只与上一条弹幕有关，用小顶堆记下各行何时满足，满足后才放进线段树；
+    条件 2 与当前弹幕的速度有关，由线段树按各行上一条的结束时间查找
+    """
+    def __init__(self, screen_width: int, screen_height: int, style: dict = None, font_metrics: QFontMetrics = None):
         self.screen_width = screen_width
         self.screen_height = screen_height
         
-        self._load_config()
+        self._load_config(style, font_metrics)
 
-        # 初始化不同类型弹幕的轨道
-        self.scroll_tracks = [ScrollTrack(screen_width, self.min_gap) for _ in range(self.max_scroll_rows)]
-        self.top_tracks = [StaticTrack() for _ in range(self.max_static_rows)]
-        self.bottom_tracks = [StaticTrack() for _ in range(self.max_static_rows)]
+        self.glyph_widths = GlyphWidthCache(self.font_metrics)
 
-    def _load_config(self):
-        style = config.get(config.danmaku_style)
-        
-        font = QApplication.font()
-
-        font.setFamily(style["font"]["name"])
-        font.setPixelSize(style["font"]["size"])
-        font.setBold(style["font"]["bold"])
-        font.setItalic(style["font"]["italic"])
-        font.setUnderline(style["font"]["underline"])
-        font.setStrikeOut(style["font"]["strike"])
+        # 滚动轨道：树中存放各行上一条弹幕的结束时间，条件 1 尚未满足时为 inf。从未使用过的行为 -inf
+        self.scroll_tree = TrackTree(self.max_scroll_rows, -inf)
+        self.scroll_end_time = [0] * self.max_scroll_rows
+        # (满足条件 1 的时间, 行号)
+        self.scroll_waiting: List[Tuple[float, int]] = []
+
+        # 固定轨道：树中存放各行上一条弹幕的结束时间
+        self.top_tree = TrackTree(self.max_static_rows, -1)
+        self.bottom_tree = TrackTree(self.max_static_rows, -1)
+
+    def _load_config(self, style: dict = None, font_metrics: QFontMetrics = None):
+        if style is None:
+            style = config.get(config.danmaku_style)
         
-        self.font_metrics = QFontMetrics(font)
+        if font_metrics is None:
+            font = QApplication.font()
+
+            font.setFamily(style["font"]["name"])
+            font.setPixelSize(style["font"]["size"])
+            font.setBold(style["font"]["bold"])
+            font.setItalic(style["font"]["italic"])
+            font.setUnderline(style["font"]["underline"])
+            font.setStrikeOut(style["font"]["strike"])
+            
+            font_metrics = QFontMetrics(font)
+
+        self.font_metrics = font_metrics
         self.line_height = self.font_metrics.height() + 4
 
         self.display_area = style["advanced"]["display_area"] / 100.0
@@ -104,38 +160,52 @@ class DanmakuLayoutEngine:
         
         # 顶部/底部固定弹幕区域
         self.max_static_rows = max(1, int(self.screen_height * self.display_area / self.line_height))
+
+    def text_width(self, text: str) -> int:
+        return self.glyph_widths.text_width(text)
         
     def alloc_scroll(self, stime: int, text_width: int, duration_ms: int) -> Optional[int]:
         speed = (self.screen_width + text_width) / duration_ms
 
-        for row, track in enumerate(self.scroll_tracks):
-            if track.can_fit(stime, speed):
-                track.push(stime, duration_ms, text_width, speed)
-                return row
-        
-        return None
+        # 条件 1 已满足的行加入候选
+        waiting = self.scroll_waiting
+
+        while waiting and stime >= waiting[0][0]:
+            _, row = heappop(waiting)
+
+            self.scroll_tree.update(row, self.scroll_end_time[row])
+
+        lead = (self.screen_width - self.min_gap) / speed
+
+        row = self.scroll_tree.first(lambda end_time: stime >= end_time - lead)
+
+        if row is not None:
+            self.scroll_end_time[row] = stime + duration_ms
+
+            self.scroll_tree.update(row, inf)
+            heappush(waiting, (stime + ((text_width + self.min_gap) / speed), row))
+
+        return row
         
     def alloc_top(self, stime: int, duration_ms: int) -> Optional[int]:
-        for row, track in enumerate(self.top_tracks):
-            if track.can_fit(stime):
-                track.push(stime + duration_ms)
-                return row
-        
-        return None
+        return self._alloc_static(self.top_tree, stime, duration_ms)
         
     def alloc_bottom(self, stime: int, duration_ms: int) -> Optional[int]:
-        for row, track in enumerate(self.bottom_tracks):
-            if track.can_fit(stime):
-                track.push(stime + duration_ms)
-                return row
-        
-        return None
+        return self._alloc_static(self.bottom_tree, stime, duration_ms)
+
+    def _alloc_static(self, tree: TrackTree, stime: int, duration_ms: int) -> Optional[int]:
+        row = tree.first(lambda end_time: stime >= end_time)
+
+        if row is not None:
+            tree.update(row, stime + duration_ms)
+
+        return row
 
 
 class DanmakuASS:
-    def __init__(self, dict_list: List[dict], title: str):
+    def __init__(self, record_list: List[DanmakuRecord], title: str):
         # 弹幕按出现时间排序
-        self.dict_list = sorted(dict_list, key=lambda x: x.get("stime", 0))
+        self.record_list = sorted(record_list, key = attrgetter("stime"))
         self.title = title
         
         # 各模式的显示时长 (毫秒)
@@ -145,19 +215,26 @@ class DanmakuASS:
             5: 5000   # 顶部弹幕
         }
 
-    def generate(self) -> str:
+    def generate(self) -> Iterator[str]:
+        # 逐段产出文件内容，由调用方边生成边写入，不必先在内存里拼出整个文件。
+        # 拼接结果与 ass_base.format(dialogues = "\n".join(...)) 逐字节相同
         style_str, screen_width, screen_height = self._get_style_info()
         
         engine = DanmakuLayoutEngine(screen_width, screen_height)
-        dialogues = self._convert_dialogues(engine)
-        
-        return ass_base.format(
+
+        head, tail = ass_base.split("{dialogues}")
+
+        yield head.format(
             title = self.title,
             style = style_str,
-            dialogues = "\n".join(dialogues),
             width = screen_width,
             height = screen_height
         )
+
+        for index, dialogue in enumerate(self._convert_dialogues(engine)):
+            yield f"\n{dialogue}" if index else dialogue
+
+        yield tail
         
     def _get_style_info(self) -> Tuple[str, int, int]:
         style = config.get(config.danmaku_style)
@@ -183,22 +260,17 @@ class DanmakuASS:
         )
         return style_str, screen_width, screen_height
         
-    def _convert_dialogues(self, engine: DanmakuLayoutEngine) -> List[str]:
-        dialogues = []
-        
-        for entry in self.dict_list:
-            mode = entry.get("mode")
-            stime = entry.get("stime", 0)
-            text = entry.get("text", "")
+    def _convert_dialogues(self, engine: DanmakuLayoutEngine) -> Iterator[str]:
+        for record in self.record_list:
+            mode = record.mode
+            stime = record.stime
+            text = record.text
             
             if not text or mode not in self.duration_map:
                 continue
                 
             duration_ms = self.duration_map[mode]
-            text_width = engine.font_metrics.horizontalAdvance(text)
-            
-            start_ass = Time.format_ass_time_by_ms(stime)
-            end_ass = Time.format_ass_time_by_ms(stime + duration_ms)
+            text_width = engine.text_width(text)
             
             style_label = ""
             allocated_row = None
@@ -226,18 +298,16 @@ class DanmakuASS:
             
             # 如果没有分配到轨道（满屏），则抛弃该弹幕以防重叠
             if allocated_row is not None:
+                # 满屏时大部分弹幕会被丢弃，时间戳只为保留下来的弹幕格式化
+                start_ass = Time.format_ass_time_by_ms(stime)
+                end_ass = Time.format_ass_time_by_ms(stime + duration_ms)
+
                 # 解析可能附加的颜色
                 color_tag = ""
-                if "color" in entry and entry["color"] != 16777215:
-                    try:
-                        c = int(entry["color"])
-                        bgr = ((c & 0xFF) << 16) | (c & 0xFF00) | ((c >> 16) & 0xFF)
-                        color_tag = f"\\c&H{bgr:06X}&"
-                    except (ValueError, TypeError):
-                        pass
-
-                dialogue = f"Dialogue: 0,{start_ass},{end_ass},Default,,0,0,0,,{{{style_label}{color_tag}}}{text}"
-                dialogues.append(dialogue)
-                
-        return dialogues
+                if record.color and record.color != 16777215:
+                    c = record.color
+                    bgr = ((c & 0xFF) << 16) | (c & 0xFF00) | ((c >> 16) & 0xFF)
+                    color_tag = f"\\c&H{bgr:06X}&"
+
+                yield f"Dialogue: 0,{start_ass},{end_ass},Default,,0,0,0,,{{{style_label}{color_tag}}}{text}"
 
@@ -0,0 +1,28 @@
+from ....common._json import json_dumps
+
+from typing import Iterable, Iterator, List
+
+class DanmakuJSON:
+    """
+    逐包生成 JSON 弹幕文件，与 DanmakuXML 一样每次只格式化一包。
+    各包为 decode_segment_dicts 解码出的完整弹幕字段
+    """
+    def __init__(self, segments: Iterable[List[dict]]):
+        self.segments = segments
+
+    def generate(self) -> Iterator[str]:
+        # 拼接结果与一次性 json_dumps(全部弹幕, indent = 2) 逐字节相同：
+        # 每包单独序列化成带缩进的数组，去掉首尾的 "[\n" 与 "\n]"，剩下的就是缩进好的各个元素
+        first = True
+
+        for entry_list in self.segments:
+            if not entry_list:
+                continue
+
+            elements = json_dumps(entry_list, indent = 2)[2:-2]
+
+            yield f"[\n{elements}" if first else f",\n{elements}"
+
+            first = False
+
+        yield "[]" if first else "\n]"
@@ -0,0 +1,86 @@
+import util.misc.dm_pb2 as dm_pb2
+
+from google.protobuf.descriptor import FieldDescriptor
+
+from operator import attrgetter
+from typing import List, NamedTuple
+
+class DanmakuRecord(NamedTuple):
+    # 一条弹幕，只保留 DanmakuXML / DanmakuASS 用得到的字段
+    stime: int
+    mode: int
+    size: int
+    color: int
+    date: int
+    weight: int
+    uhash: str
+    dmid: str
+    text: str
+
+def _build_json_fields():
+    # (字段名, JSON 键名, 取值转换)，按字段编号排序，与 MessageToDict 的输出顺序一致。
+    # DanmakuElem 全是单值标量字段：int64 写成字符串，枚举写成名称（未知取值保留数字）
+    json_fields = []
+
+    for field in sorted(dm_pb2.DanmakuElem.DESCRIPTOR.fields, key = attrgetter("number")):
+        if field.cpp_type in (FieldDescriptor.CPPTYPE_INT64, FieldDescriptor.CPPTYPE_UINT64):
+            convert = str
+
+        elif field.enum_type is not None:
+            names = {value.number: value.name for value in field.enum_type.values}
+            convert = lambda value, names = names: names.get(value, value)
+
+        else:
+            convert = None
+
+        json_fields.append((field.name, field.json_name, convert))
+
+    return tuple(json_fields)
+
+_JSON_FIELDS = _build_json_fields()
+
+def decode_segment(data: bytes) -> List[DanmakuRecord]:
+    """
+    解码一包 seg.so 弹幕
+
+    MessageToDict 要先经反射把每条弹幕的所有字段转成 dict，十万条以上的弹幕要耗时数秒；
+    这里解析后直接读取需要的几个属性构造成元组，省去中间的 dict，也不会处理用不到的字段
+    """
+    reply = dm_pb2.DmSegMobileReply()
+    reply.ParseFromString(data)
+
+    # 过滤无效的弹幕数据。_make 直接由元组构造，比逐个关键字参数的 __new__ 快一些
+    make = DanmakuRecord._make
+
+    return [
+        make((elem.stime, elem.mode, elem.size, elem.color, elem.date, elem.weight, elem.uhash, elem.dmid, elem.text))
+        for elem in reply.elems
+        if elem.stime and elem.text
+    ]
+
+def decode_segment_dicts(data: bytes) -> List[dict]:
+    """
+    解码一包 seg.so 弹幕，供导出 JSON 使用
+
+    JSON 弹幕是面向用户的格式，保留每条弹幕的全部字段，结果与 MessageToDict 逐字段相同：
+    省略默认值，int64 写成字符串，枚举写成名称。直接读取字段，不经过 MessageToDict 的反射
+    """
+    reply = dm_pb2.DmSegMobileReply()
+    reply.ParseFromString(data)
+
+    entry_list = []
+
+    for elem in reply.elems:
+        # 过滤无效的弹幕数据
+        if not (elem.stime and elem.text):
+            continue
+
+        entry = {}
+
+        for name, json_name, convert in _JSON_FIELDS:
+            if value := getattr(elem, name):
+                entry[json_name] = convert(value) if convert else value
+
+        entry_list.append(entry)
+
+    return entry_list
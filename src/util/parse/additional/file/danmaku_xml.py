@@ -1,5 +1,6 @@
-from textwrap import indent
-from typing import List
+from .danmaku_record import DanmakuRecord
+
+from typing import Iterable, Iterator, List
 import re
 
 xml_base = """<?xml version="1.0" encoding="UTF-8"?>
@@ -15,38 +16,47 @@ xml_base = """<?xml version="1.0" encoding="UTF-8"?>
 </i>"""
 
 class DanmakuXML:
-    def __init__(self, dict_list: List[dict], cid: int):
-        self.dict_list = dict_list
+    """
+    逐包生成 XML 弹幕文件
+
+    传入的是按分包顺序产出弹幕的可迭代对象，每次只格式化一包，
+    由调用方边生成边写入文件，内存占用与片长无关
+    """
+    def __init__(self, segments: Iterable[List[DanmakuRecord]], cid: int):
+        self.segments = segments
         self.cid = cid
 
-    def generate(self):
-        return xml_base.format(
-            cid = self.cid,
-            comments = self._comments()
-        )
+    def generate(self) -> Iterator[str]:
+        # 拼接结果与一次性 xml_base.format(comments = "\n".join(...)) 逐字节相同
+        head, tail = xml_base.split("{comments}")
+
+        yield head.format(cid = self.cid)
+
+        first = True
+
+        for record_list in self.segments:
+            if not record_list:
+                continue
 
-    def _comments(self):
-        comment_elements = []
-
-        for entry in self.dict_list:
-            comment_elements.append(
-                indent(
-                    """<d p="{stime},{mode},{size},{color},{date},0,{uhash},{dmid}">{text}</d>""".format(
-                        stime = self._ms_to_s(entry.get("stime", 0)),
-                        mode = entry.get("mode", 1),
-                        size = entry.get("size", 25),
-                        color = entry.get("color", 16777215),
-                        date = entry.get("date", 0),
-                        uhash = entry.get("uhash", 0),
-                        dmid = entry.get("dmid", 0),
-                        weight = entry.get("weight", 1),
-                        text = self._filter_invalid_characters(entry.get("text", ""))
-                    ),
-                    "    "
-                )
-            )
-
-        return "\n".join(comment_elements)
+            comments = "\n".join(self._comment(record) for record in record_list)
+
+            yield comments if first else f"\n{comments}"
+
+            first = False
+
+        yield tail
+
+    def _comment(self, record: DanmakuRecord) -> str:
+        return """    <d p="{stime},{mode},{size},{color},{date},0,{uhash},{dmid}">{text}</d>""".format(
+            stime = self._ms_to_s(record.stime),
+            mode = record.mode or 1,
+            size = record.size or 25,
+            color = record.color or 16777215,
+            date = record.date,
+            uhash = record.uhash or 0,
+            dmid = record.dmid or 0,
+            text = self._filter_invalid_characters(record.text)
+        )
     
     def _filter_invalid_characters(self, text: str) -> str:
         # 过滤非法XML字符并转义特殊字符
@@ -13,10 +13,26 @@ from .chapter import ChapterParser
 from .player import PlayerInfoParser
 from .cover import CoverParser
 
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Any, Callable
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 同时进行的附加内容解析数。弹幕、封面、元数据与播放器信息互不依赖，正好可以同时进行
+ADDITIONAL_PARSE_CONCURRENCY = 4
+
+@dataclass
+class AdditionalJob:
+    key: str
+    # 状态栏进度与错误信息中显示的名称。播放器信息这类中间步骤为空，不计入进度，
+    # 它失败时错误记到依赖它的字幕、章节名下
+    label: str
+    run: Callable[..., Any]
+    # 依赖的任务 key，其返回值依次作为本任务的参数
+    depends: tuple[str, ...] = field(default_factory = tuple)
+
 class AdditionalParseWorker(QObject):
     success = Signal()
     error = Signal(str)
@@ -42,55 +58,108 @@ class AdditionalParseWorker(QObject):
             self.finished.emit()
 
     def __parse(self):
-        # 读取 Download Type 标志位，决定下载哪种类型的附加文件
-        attr = self.task_info.Download.type
-
-        # 待嵌入的字幕轨在下方逐条追加。任务暂停恢复或失败重试时会重新走一遍附加内容解析，
+        # 待嵌入的字幕轨由各解析器追加。任务暂停恢复或失败重试时会重新走一遍附加内容解析，
         # 不先清空就会把同一个 ASS 文件重复登记，最终被嵌入多条相同的轨道
         self.task_info.File.subtitle_track_list.clear()
 
+        self.__run_jobs(self.__build_jobs())
+
+        # 各项并发完成，登记顺序不固定，这里恢复为弹幕在前、字幕在后，保证嵌入的轨道顺序不变
+        self.task_info.File.subtitle_track_list.sort(key = lambda track: track["kind"] != "danmaku")
+
+        self.update_status_label("")
+
+    def __build_jobs(self) -> list[AdditionalJob]:
+        # 读取 Download Type 标志位，决定下载哪种类型的附加文件
+        attr = self.task_info.Download.type
+
         need_subtitle = attr & DownloadType.SUBTITLE != 0
         need_chapter = ChapterParser.is_available(self.task_info)
 
-        if attr & DownloadType.DANMAKU != 0:
-            # 下载弹幕
-            self.update_status_label(Translator.TIP_MESSAGES("DOWNLOADING_DANMAKU"))
+        job_list = []
 
-            parser = DanmakuParser(self.task_info)
-            parser.parse()
+        if attr & DownloadType.DANMAKU != 0:
+            job_list.append(AdditionalJob("danmaku", Translator.TIP_MESSAGES("DOWNLOADING_DANMAKU"), DanmakuParser(self.task_info).parse))
 
-        # 字幕和章节来自同一个播放器信息接口，只请求一次
-        player_data = PlayerInfoParser(self.task_info).get_data() if need_subtitle or need_chapter else {}
+        if need_subtitle or need_chapter:
+            # 字幕和章节来自同一个播放器信息接口，只请求一次
+            job_list.append(AdditionalJob("player", "", PlayerInfoParser(self.task_info).get_data))
 
         if need_subtitle:
-            # 下载字幕
-            self.update_status_label(Translator.TIP_MESSAGES("DOWNLOADING_SUBTITLES"))
-
-            parser = SubtitlesParser(self.task_info)
-            parser.parse(player_data)
+            job_list.append(AdditionalJob("subtitles", Translator.TIP_MESSAGES("DOWNLOADING_SUBTITLES"), SubtitlesParser(self.task_info).parse, ("player", )))
 
         if need_chapter:
             # 获取章节信息，生成供 FFmpeg 使用的章节文件
-            self.update_status_label(Translator.TIP_MESSAGES("PARSING_CHAPTER"))
-
-            parser = ChapterParser(self.task_info)
-            parser.parse(player_data)
+            job_list.append(AdditionalJob("chapter", Translator.TIP_MESSAGES("PARSING_CHAPTER"), ChapterParser(self.task_info).parse, ("player", )))
 
         if attr & DownloadType.COVER != 0:
-            # 下载封面
-            self.update_status_label(Translator.TIP_MESSAGES("DOWNLOADING_COVER"))
-
-            parser = CoverParser(self.task_info)
-            parser.parse()
+            job_list.append(AdditionalJob("cover", Translator.TIP_MESSAGES("DOWNLOADING_COVER"), CoverParser(self.task_info).parse))
 
         if attr & DownloadType.METADATA != 0:
-            # 下载元数据
-            self.update_status_label(Translator.TIP_MESSAGES("SCRAPING_METADATA"))
+            job_list.append(AdditionalJob("metadata", Translator.TIP_MESSAGES("SCRAPING_METADATA"), MetadataParser(self.task_info).parse))
 
-            parser = MetadataParser(self.task_info)
-            parser.parse()
+        return job_list
 
-        self.update_status_label("")
+    def __run_jobs(self, job_list: list[AdditionalJob]):
+        # 原先各项依次执行，每项都有自己的网络请求，全部开启时要串行等上好几轮。
+        # 这里依赖已就绪的任务立即提交，互不依赖的同时进行；某一项失败不影响其余各项，
+        # 全部结束后再把失败的项目逐条汇总报告
+        pending = {job.key: job for job in job_list}
+        running: dict[Future, AdditionalJob] = {}
+
+        results = {}
+        errors: dict[str, Exception] = {}
+
+        total = sum(1 for job in job_list if job.label)
+        finished = 0
+
+        self.update_progress_label(finished, total)
+
+        with ThreadPoolExecutor(max_workers = ADDITIONAL_PARSE_CONCURRENCY, thread_name_prefix = "additional-parse") as executor:
+            while pending or running:
+                unresolved = set(pending) | {job.key for job in running.values()}
+
+                for job in list(pending.values()):
+                    if any(key in unresolved for key in job.depends):
+                        continue
+
+                    del pending[job.key]
+
+                    if failed_key := next((key for key in job.depends if key in errors), None):
+                        # 依赖的步骤失败了，本项无法进行，沿用它的错误
+                        errors[job.key] = errors[failed_key]
+                        finished += 1 if job.label else 0
+                        continue
+
+                    running[executor.submit(job.run, *(results[key] for key in job.depends))] = job
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when = FIRST_COMPLETED)
+
+                for future in done:
+                    job = running.pop(future)
+
+                    try:
+                        results[job.key] = future.result()
+
+                    except Exception as e:
+                        errors[job.key] = e
+
+                        logger.exception("附加文件解析失败：%s", job.key)
+
+                    finished += 1 if job.label else 0
+
+                self.update_progress_label(finished, total)
+
+        error_list = ["{label}：{error}".format(label = job.label.rstrip(".…"), error = errors[job.key]) for job in job_list if job.label and job.key in errors]
+
+        if error_list:
+            raise RuntimeError("\n".join(error_list))
+
+    def update_progress_label(self, finished: int, total: int):
+        self.update_status_label("{label} ({finished}/{total})".format(label = Translator.TIP_MESSAGES("ADDITIONAL_FILES"), finished = finished, total = total))
 
     def update_status_label(self, label: str):
         self.task_info.Download.status_label = label